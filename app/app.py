@@ -1,115 +1,142 @@
-import random
-from functools import lru_cache, wraps
-from datetime import datetime, timedelta
-from flask import request
+from datetime import timedelta
+import os
 import re
 
+import click
 from flask import (
-    Flask, render_template, abort, Response,
+    Flask, Blueprint, render_template, abort, Response,
     request, make_response, redirect, url_for,
-    flash, session
+    flash, session, current_app
 )
-from faker import Faker
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_login import (
-    LoginManager, login_user, logout_user,
+    login_user, logout_user,
     login_required, current_user
 )
 
-# === Приложение и конфигурация ===
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.permanent_session_lifetime = timedelta(days=7)
-import os
+from models import db, User, Role, VisitLog
+from db_profile import db_profile, database_url
+from auth import login_manager, check_rights
+from visit_log_writer import visit_log_writer
+from keyset import keyset_paginate, cached_count
+from identity_cache import identity_cache
+from hashing import password_hasher, HashingBusy
+from counters import visit_counter
+from page_cache import page_cache
+from static_assets import static_assets, compress_static_command
+from image_variants import image_variants, warm_images_command
+from profiling import profiler
+from metrics import metrics
+from posts_store import list_posts, get_post, ensure_posts, generate_posts_command
+from rollups import rebuild_rollups_command
+from retention import archive_visit_logs_command
+from sketches import visitor_key
+from user_admin import anonymize_logs, delete_users, change_role
+from validators import user_errors, password_error
+from user_import import (
+    import_users, read_rows, decode_lines, export_query, format_from_filename,
+    EXPORT_COLUMNS, FORMATS as USER_FORMATS,
+    import_users_command, export_users_command
+)
+from csv_stream import iter_rows, csv_response, jsonl_response
+from migrations import (
+    upgrade, db_upgrade_command, db_status_command, explain_queries_command
+)
+from visit_logs import visit_logs_bp
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'app.db')
-
-print(">>> Using database:", os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "app.db")
-))
-
-# === Инициализация базы данных ===
-from models import db, User, Role, VisitLog
-
-db.init_app(app)
-
-# === Настройка Flask-Login ===
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
-login_manager.login_message = "Пожалуйста, войдите в систему для доступа к этой странице."
-login_manager.login_message_category = "warning"
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-    
-# === Faker для фейковых постов ===
-fake = Faker()
-images_ids = [
-    '7d4e9175-95ea-4c5f-8be5-92a6b708bb3c',
-    '2d2ab7df-cdbc-48a8-a936-35bba702def5',
-    '6e12f3de-d5fd-4ebb-855b-8cbc485278b7',
-    'afc2cfe7-5cac-4b80-9b9a-d5c65ef0c728',
-    'cab5b7f2-774e-4884-a200-0c0180fa777f'
+main_bp = Blueprint('main', __name__)
+
+
+# === Фабрика приложения ===
+# Импорт модуля ничего тяжёлого не делает: схема создаётся отдельной
+# командой `flask --app app init-db`, Faker грузится только при генерации постов.
+# Расширения держат очереди, кэши и потоки в app.extensions, а не в себе,
+# поэтому приложений может быть несколько (тесты, бенчмарки).
+
+def create_app(config=None):
+    # статику отдаёт static_assets: долгое кэширование, Range, сжатые копии
+    app = Flask(__name__, static_folder=None)
+    app.config['SECRET_KEY'] = 'your-secret-key'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url('sqlite:///' + os.path.join(basedir, 'app.db'))
+    # общее число записей журнала пересчитывается не чаще раза в N секунд (0 — не считать)
+    app.config['VISIT_LOG_COUNT_TTL'] = 60
+    # журнал старше N дней переносится в архив командой archive-visit-logs
+    app.config['VISIT_LOG_RETENTION_DAYS'] = 90
+    app.config['VISIT_LOG_ARCHIVE_BATCH'] = 2000
+    app.config['VISIT_LOG_ARCHIVE_PAUSE_MS'] = 50
+    # строк журнала, обезличиваемых одной транзакцией при удалении пользователя
+    app.config['USER_DELETE_BATCH'] = 2000
+    app.config['USERS_PER_PAGE'] = 20
+    app.config['POSTS_SEED'] = 42
+    # строк импорта пользователей в одной транзакции
+    app.config['USER_IMPORT_CHUNK'] = 500
+    # больше через веб не принимаем — такие файлы импортируются командой
+    app.config['USER_IMPORT_MAX_BYTES'] = 1024 * 1024
+    app.permanent_session_lifetime = timedelta(days=7)
+    if config:
+        app.config.update(config)
+
+    db_profile.init_app(app)
+    db.init_app(app)
+    db_profile.listen(app)
+    login_manager.init_app(app)
+    visit_log_writer.init_app(app)
+    identity_cache.init_app(app)
+    password_hasher.init_app(app)
+    visit_counter.init_app(app)
+    page_cache.init_app(app)
+    static_assets.init_app(app)
+    image_variants.init_app(app)
+    profiler.init_app(app)
+    metrics.init_app(app)
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(visit_logs_bp, url_prefix='/visit_logs')
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(archive_visit_logs_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_status_command)
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(generate_posts_command)
+    app.cli.add_command(compress_static_command)
+    app.cli.add_command(warm_images_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(export_users_command)
+    return app
+
+
+DEFAULT_ROLES = [
+    ('Administrator', 'Суперпользователь'),
+    ('User', 'Обычный пользователь'),
 ]
 
-def generate_comments(replies=True):
-    comments = []
-    for _ in range(random.randint(1, 3)):
-        c = {'author': fake.name(), 'text': fake.text()}
-        if replies:
-            c['replies'] = generate_comments(False)
-        comments.append(c)
-    return comments
-
-def generate_post(i):
-    return {
-        'title': fake.sentence(),
-        'text': fake.paragraph(nb_sentences=100),
-        'author': fake.name(),
-        'date': fake.date_time_between('-2y', 'now'),
-        'image_id': f'{images_ids[i]}.jpg',
-        'comments': generate_comments()
-    }
-
-def check_rights(allowed_roles, own_allowed=False):
-
-    def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            if not current_user.is_authenticated:
-                return login_manager.unauthorized()
-            role = current_user.role.name if current_user.role else None
-            # админ или нужная роль
-            if role == 'Administrator' or role in allowed_roles:
-                return f(*args, **kwargs)
-            # разрешаем над собой
-            if own_allowed and kwargs.get('user_id') == current_user.id:
-                return f(*args, **kwargs)
-            flash("У вас недостаточно прав для доступа к данной странице.", "warning")
-            return redirect(url_for('index'))
-        return wrapper
-    return decorator
-
-@lru_cache
-def posts_list():
-    return sorted([generate_post(i) for i in range(5)],
-                  key=lambda p: p['date'], reverse=True)
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Создать/обновить схему базы, добавить стандартные роли и посты."""
+    done = upgrade(db.engine)
+    for name, description in DEFAULT_ROLES:
+        if not Role.query.filter_by(name=name).first():
+            db.session.add(Role(name=name, description=description))
+    db.session.commit()
+    ensure_posts()
+    click.echo(f'База готова, применено миграций: {len(done)}.')
 
 # === Роуты ===
 
-with app.app_context():
-    db.create_all()
-
-
 
-@app.route('/dump')
+@main_bp.route('/dump')
 def dump_db():
     rows = []
-    for u in User.query.all():
+    for u in User.query.options(selectinload(User.role)).all():
         rows.append({
             'id': u.id,
             'login': u.login,
@@ -119,19 +146,32 @@ def dump_db():
         })
     return {'users': rows}
 
-@app.route('/')
+@main_bp.route('/')
+@page_cache.cached
 def index():
-    users = User.query.order_by(User.id).all()
-    return render_template('index.html', users=users)
+    page = request.args.get('page', 1, type=int)
+    # только те колонки, что показывает таблица; роль — тем же запросом через JOIN
+    query = (
+        db.session.query(
+            User.id, User.surname, User.name, User.patronymic,
+            Role.name.label('role_name')
+        )
+        .outerjoin(Role, User.role_id == Role.id)
+        .order_by(User.id)
+    )
+    pagination = query.paginate(page=page, per_page=current_app.config['USERS_PER_PAGE'],
+                                 error_out=False)
+    roles = Role.query.order_by(Role.name).all()
+    return render_template('index.html', pagination=pagination, roles=roles)
 
-@app.route('/view_user/<int:user_id>')
+@main_bp.route('/view_user/<int:user_id>')
 @login_required
 @check_rights(['User'], own_allowed=True)
 def view_user(user_id):
     user = User.query.get_or_404(user_id)
     return render_template('view_user.html', user=user)
 
-@app.route('/create_user', methods=['GET', 'POST'])
+@main_bp.route('/create_user', methods=['GET', 'POST'])
 @login_required
 @check_rights(['Administrator'])
 def create_user():
@@ -147,30 +187,7 @@ def create_user():
         form['patronymic'] = request.form.get('patronymic', '').strip()
         form['role_id'] = request.form.get('role_id', '')
 
-        if not form['login']:
-            errors['login'] = 'Поле не может быть пустым'
-        elif not re.match(r'^[A-Za-z0-9]{5,}$', form['login']):
-            errors['login'] = 'Логин должен состоять из латинских букв и цифр, минимум 5 символов'
-
-        pwd = form['password']
-        if not pwd:
-            errors['password'] = 'Поле не может быть пустым'
-        else:
-            if len(pwd) < 8 or len(pwd) > 128:
-                errors['password'] = 'Пароль должен быть от 8 до 128 символов'
-            elif not re.search(r'[A-Z]', pwd) or not re.search(r'[a-z]', pwd):
-                errors['password'] = 'Пароль должен содержать и заглавные, и строчные буквы'
-            elif not re.search(r'\d', pwd):
-                errors['password'] = 'Пароль должен содержать хотя бы одну цифру'
-            elif ' ' in pwd:
-                errors['password'] = 'Пароль не должен содержать пробелов'
-            elif not re.match(r'^[A-Za-zА-Яа-я0-9~!?@#$%^&*_\-+()\[\]{}><\\|"\'.:,]+$', pwd):
-                errors['password'] = 'Пароль содержит недопустимые символы'
-
-        if not form['surname']:
-            errors['surname'] = 'Поле не может быть пустым'
-        if not form['name']:
-            errors['name'] = 'Поле не может быть пустым'
+        errors = user_errors(form)
 
         role = None
         if form['role_id']:
@@ -189,8 +206,9 @@ def create_user():
         db.session.add(new_user)
         try:
             db.session.commit()
+            page_cache.invalidate()
             flash('Пользователь успешно создан', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при создании пользователя: ' + str(e), 'danger')
@@ -198,7 +216,7 @@ def create_user():
 
     return render_template('create_user.html', roles=roles, errors=errors, form=form)
 
-@app.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
+@main_bp.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 @check_rights(['User'], own_allowed=True)
 def edit_user(user_id):
@@ -232,8 +250,10 @@ def edit_user(user_id):
         user.role = role
         try:
             db.session.commit()
+            identity_cache.invalidate(user.id)
+            page_cache.invalidate()
             flash('Пользователь успешно обновлён', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при обновлении пользователя: ' + str(e), 'danger')
@@ -241,23 +261,120 @@ def edit_user(user_id):
 
     return render_template('edit_user.html', user=user, roles=roles, errors=errors)
 
-@app.route('/delete_user/<int:user_id>', methods=['POST'])
+@main_bp.route('/delete_user/<int:user_id>', methods=['POST'])
 @login_required
 @check_rights(['User'], own_allowed=True)
 def delete_user(user_id):
-    user = User.query.get_or_404(user_id)
+    # только ФИО для сообщения: журнал посещений в сессию не грузится
+    user = db.session.execute(
+        select(User.surname, User.name, User.patronymic).where(User.id == user_id)
+    ).first()
+    if user is None:
+        abort(404)
+    own = user_id == current_user.id
+    # журнал обезличивается заранее пачками в своих транзакциях; чтение
+    # выше закрываем, чтобы сессия не писала поверх старого снимка
+    db.session.commit()
     try:
-        db.session.delete(user)
+        anonymize_logs(db.engine, [user_id], current_app.config['USER_DELETE_BATCH'])
+        delete_users(db.session.connection(), [user_id])
         db.session.commit()
+        if own:
+            logout_user()
+        identity_cache.invalidate(user_id)
+        page_cache.invalidate()
         flash('Пользователь "{} {} {}" успешно удалён'.format(
             user.surname or '', user.name or '', user.patronymic or ''
         ), 'success')
     except Exception as e:
         db.session.rollback()
         flash('Ошибка при удалении пользователя: ' + str(e), 'danger')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/change_password', methods=['GET', 'POST'])
+@main_bp.route('/users/bulk', methods=['POST'])
+@login_required
+@check_rights(['Administrator'])
+def bulk_users():
+    # удаление или смена роли у отмеченных пользователей одной транзакцией
+    user_ids = request.form.getlist('user_ids', type=int)
+    action = request.form.get('action')
+    if not user_ids:
+        flash('Не выбрано ни одного пользователя', 'warning')
+        return redirect(url_for('main.index'))
+    role_id = request.form.get('role_id', type=int)
+    if action == 'set_role' and role_id is not None and not db.session.get(Role, role_id):
+        flash('Выбранная роль недействительна', 'danger')
+        return redirect(url_for('main.index'))
+    if action not in ('delete', 'set_role'):
+        abort(400)
+    own = current_user.id in user_ids
+    # как в delete_user: журнал обезличивается заранее, пачками
+    db.session.commit()
+    try:
+        if action == 'delete':
+            anonymize_logs(db.engine, user_ids, current_app.config['USER_DELETE_BATCH'])
+            message = 'Удалено пользователей: {}'.format(
+                delete_users(db.session.connection(), user_ids))
+        else:
+            message = 'Роль изменена у пользователей: {}'.format(
+                change_role(db.session.connection(), user_ids, role_id))
+        db.session.commit()
+        # себя удалили — выходим; сменили себе роль — кэш сброшен ниже
+        if own and action == 'delete':
+            logout_user()
+        for user_id in user_ids:
+            identity_cache.invalidate(user_id)
+        page_cache.invalidate()
+        flash(message, 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Ошибка при изменении пользователей: ' + str(e), 'danger')
+    return redirect(url_for('main.index'))
+
+@main_bp.route('/users/import', methods=['GET', 'POST'])
+@login_required
+@check_rights(['Administrator'])
+def import_users_view():
+    # файл разбирается потоком, ошибки — списком по номерам строк
+    report = None
+    max_bytes = current_app.config['USER_IMPORT_MAX_BYTES']
+    # лимит проверяет werkzeug при разборе тела, в том числе без Content-Length
+    request.max_content_length = max_bytes
+    upload = None
+    if request.method == 'POST':
+        try:
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('Выберите файл для импорта', 'warning')
+        except RequestEntityTooLarge:
+            # импорт идёт в потоке запроса и занял бы воркер надолго
+            flash(f'Файл больше {max_bytes // 1024} КиБ — импортируйте его командой '
+                  '«flask --app app import-users»', 'warning')
+    if upload and upload.filename:
+        fmt = request.form.get('format') or format_from_filename(upload.filename)
+        if fmt not in USER_FORMATS:
+            abort(400)
+        report = import_users(db.engine, read_rows(decode_lines(upload.stream), fmt),
+                              current_app.config['USER_IMPORT_CHUNK'])
+        if report['created']:
+            page_cache.invalidate()
+    return render_template('import_users.html', report=report, formats=USER_FORMATS,
+                           max_bytes=max_bytes)
+
+@main_bp.route('/users/export')
+@login_required
+@check_rights(['Administrator'])
+def export_users():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in USER_FORMATS:
+        abort(400)
+    rows = iter_rows(export_query())
+    gzip = request.args.get('gzip', type=int) == 1
+    if fmt == 'jsonl':
+        return jsonl_response('users.jsonl', EXPORT_COLUMNS, rows, gzip=gzip)
+    return csv_response('users.csv', EXPORT_COLUMNS, rows, gzip=gzip)
+
+@main_bp.route('/change_password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     errors = {}
@@ -269,19 +386,9 @@ def change_password():
         if not current_user.check_password(old):
             errors['old_password'] = 'Неверный старый пароль'
 
-        if not new:
-            errors['new_password'] = 'Поле не может быть пустым'
-        else:
-            if len(new) < 8 or len(new) > 128:
-                errors['new_password'] = 'Пароль должен быть от 8 до 128 символов'
-            elif not re.search(r'[A-Z]', new) or not re.search(r'[a-z]', new):
-                errors['new_password'] = 'Пароль должен содержать и заглавные, и строчные буквы'
-            elif not re.search(r'\d', new):
-                errors['new_password'] = 'Пароль должен содержать хотя бы одну цифру'
-            elif ' ' in new:
-                errors['new_password'] = 'Пароль не должен содержать пробелов'
-            elif not re.match(r'^[A-Za-zА-Яа-я0-9~!?@#$%^&*\_\-+()\[\]{}><\\|"\'.:,]+$', new):
-                errors['new_password'] = 'Пароль содержит недопустимые символы'
+        error = password_error(new)
+        if error:
+            errors['new_password'] = error
 
         if new != confirm:
             errors['confirm_password'] = 'Пароли не совпадают'
@@ -292,8 +399,9 @@ def change_password():
         current_user.set_password(new)
         try:
             db.session.commit()
+            identity_cache.invalidate(current_user.id)
             flash('Пароль успешно изменён', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при смене пароля: ' + str(e), 'danger')
@@ -301,42 +409,50 @@ def change_password():
 
     return render_template('change_password.html', errors={})
 
-@app.route('/posts')
+@main_bp.route('/posts')
+@page_cache.cached
 def posts():
-    return render_template('posts.html', title='Посты', posts=posts_list())
+    return render_template('posts.html', title='Посты', posts=list_posts())
 
-@app.route('/posts/<int:index>')
+@main_bp.route('/posts/<int:index>')
+@page_cache.cached
 def post(index):
-    if index < 0 or index >= len(posts_list()):
+    post = get_post(index)
+    if post is None:
         abort(404)
-    return render_template('post.html', title=posts_list()[index]['title'],
-                           post=posts_list()[index])
+    return render_template('post.html', title=post['title'], post=post)
 
-@app.route('/about')
+@main_bp.route('/about')
+@page_cache.cached
 def about():
     return render_template('about.html', title='Об авторе')
 
-@app.errorhandler(404)
+@main_bp.app_errorhandler(404)
 def page_not_found(e):
     return Response('404 Not Found', status=404)
 
-@app.route('/url-params')
+@main_bp.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    db.session.rollback()
+    return Response('503 Service Unavailable', status=503, headers={'Retry-After': '1'})
+
+@main_bp.route('/url-params')
 def url_params():
     return render_template('url_params.html', title='Параметры URL',
                            params=request.args)
 
-@app.route('/headers')
+@main_bp.route('/headers')
 def headers():
     return render_template('headers.html', title='Заголовки запроса',
                            headers=dict(request.headers))
 
-@app.route('/cookies', methods=['GET', 'POST'])
+@main_bp.route('/cookies', methods=['GET', 'POST'])
 def cookies():
     resp = make_response()
     name = 'my_cookie'
     if request.method == 'POST':
         action = request.form.get('action')
-        resp = make_response(redirect(url_for('cookies')))
+        resp = make_response(redirect(url_for('main.cookies')))
         if action == 'set':
             resp.set_cookie(name, 'cookie_value', max_age=86400)
         else:
@@ -347,13 +463,13 @@ def cookies():
     return render_template('cookies.html', title='Cookie',
                            message=message, cookie_set=cookie_set)
 
-@app.route('/form_params', methods=['GET', 'POST'])
+@main_bp.route('/form_params', methods=['GET', 'POST'])
 def form_params():
     data = request.form if request.method == 'POST' else {}
     return render_template('form_params.html', title='Параметры формы',
                            form_data=data)
 
-@app.route('/phone_validation', methods=['GET', 'POST'])
+@main_bp.route('/phone_validation', methods=['GET', 'POST'])
 def phone_validation():
     error = formatted = None
     if request.method == 'POST':
@@ -370,80 +486,82 @@ def phone_validation():
     return render_template('phone_validation.html', title='Проверка телефона',
                            error=error, formatted_phone=formatted)
 
-@app.route('/login', methods=['GET', 'POST'])
+@main_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         login_ = request.form['username']
         pwd = request.form['password']
         user = User.query.filter_by(login=login_).first()
         if user and user.check_password(pwd):
+            # параметры хэширования поменялись — пересчитываем хэш, пока знаем пароль
+            if user.needs_rehash():
+                user.set_password(pwd)
+                db.session.commit()
             login_user(user, remember='remember' in request.form)
             flash("Успешный вход", "success")
-            return redirect(request.args.get('next') or url_for('index'))
+            return redirect(request.args.get('next') or url_for('main.index'))
         flash("Неверный логин или пароль", "danger")
     return render_template('login.html')
 
-@app.route('/logout')
+@main_bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash("Вы вышли", "info")
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/secret')
+@main_bp.route('/secret')
 @login_required
 def secret():
     return render_template('secret.html')
 
-@app.route('/visit_logs')
+@main_bp.route('/visit_logs')
 @login_required
 def visit_logs():
-    # страница из ?page=
-    page = request.args.get('page', 1, type=int)
+    # курсор страницы из ?cursor=
+    cursor = request.args.get('cursor')
     per_page = 5
 
     # общий запрос
-    query = VisitLog.query.order_by(VisitLog.created_at.desc())
+    query = VisitLog.query.options(joinedload(VisitLog.user))
     # если не админ — только свои логи
     if not (current_user.role and current_user.role.name == 'Administrator'):
         query = query.filter(VisitLog.user_id == current_user.id)
+        count_key = ('visit_logs', current_user.id)
+    else:
+        count_key = ('visit_logs', None)
 
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    return render_template('visit_logs.html', pagination=pagination)
-
-user_visits = {}
+    total = cached_count(count_key, query, current_app.config['VISIT_LOG_COUNT_TTL'])
+    page = keyset_paginate(query, VisitLog, per_page, cursor, total)
+    return render_template('visit_logs.html', page=page)
 
-@app.route('/counter')
+@main_bp.route('/counter')
 def counter():
     if current_user.is_authenticated:
-        username = current_user.name
-        user_visits[username] = user_visits.get(username, 0) + 1
-        visits = user_visits[username]
+        # общий для всех воркеров счётчик, запись в базу — пачками в фоне
+        visits = visit_counter.incr(current_user.id)
     else:
         session.permanent = True
         session['visits'] = session.get('visits', 0) + 1
         visits = session['visits']
     return render_template('counter.html', visits=visits)
 
-@app.after_request
+@main_bp.after_app_request
 def log_visit(response):
-    # не логируем статику и сам журнал
-    if request.endpoint not in ('static',) and not request.path.startswith('/visit_logs'):
-        visit = VisitLog(
+    # не логируем статику, метрики и сам журнал
+    if request.endpoint not in ('static', 'image_variant', 'metrics') and not request.path.startswith('/visit_logs'):
+        # запись уходит в очередь, в базу её пишет фоновый поток пачками
+        user_id = current_user.id if current_user.is_authenticated else None
+        visit_log_writer.put(
             path=request.path,
-            user_id=current_user.id if current_user.is_authenticated else None
+            user_id=user_id,
+            visitor=visitor_key(user_id, request.remote_addr, request.user_agent.string)
         )
-        db.session.add(visit)
-        db.session.commit()
     return response
 
-print(app.url_map)
+# приложение для `gunicorn app:app` и `flask --app app`
+app = create_app()
 
 # === Запуск приложения ===
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        # Регистрация Blueprint-а делаем здесь, чтобы избежать циклического импорта
-        import visit_logs
-        app.register_blueprint(visit_logs.visit_logs_bp, url_prefix='/visit_logs')
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
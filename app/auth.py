@@ -0,0 +1,37 @@
+from functools import wraps
+
+from flask import flash, redirect, url_for
+from flask_login import LoginManager, current_user
+
+from identity_cache import identity_cache
+
+# === Настройка Flask-Login ===
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+login_manager.login_message = "Пожалуйста, войдите в систему для доступа к этой странице."
+login_manager.login_message_category = "warning"
+
+@login_manager.user_loader
+def load_user(user_id):
+    # пользователь с ролью из кэша, при промахе — одним запросом с JOIN
+    return identity_cache.load_user(int(user_id))
+
+
+def check_rights(allowed_roles, own_allowed=False):
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return login_manager.unauthorized()
+            role = current_user.role.name if current_user.role else None
+            # админ или нужная роль
+            if role == 'Administrator' or role in allowed_roles:
+                return f(*args, **kwargs)
+            # разрешаем над собой
+            if own_allowed and kwargs.get('user_id') == current_user.id:
+                return f(*args, **kwargs)
+            flash("У вас недостаточно прав для доступа к данной странице.", "warning")
+            return redirect(url_for('main.index'))
+        return wrapper
+    return decorator
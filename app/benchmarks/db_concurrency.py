@@ -0,0 +1,152 @@
+"""Смешанная нагрузка чтение/запись на SQLite при разных профилях.
+
+Для каждого профиля из db_profile создаётся отдельная временная база,
+заполняется пользователями и журналом посещений, после чего потоки-читатели
+листают журнал (как /visit_logs), а потоки-писатели добавляют пачки записей
+(как фоновый writer). Печатаются пропускная способность, перцентили задержек
+и число ошибок «database is locked».
+
+    python benchmarks/db_concurrency.py [--profiles none production]
+        [--readers 8] [--writers 2] [--seconds 5] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.exc import OperationalError
+
+from models import db, Role, User, VisitLog
+from db_profile import PROFILES, apply_pragmas
+
+PATHS = ['/', '/posts', '/about', '/counter', '/posts/1', '/posts/2']
+
+
+def make_engine(path, profile):
+    settings = PROFILES[profile]
+    engine = create_engine(f'sqlite:///{path}', **settings['engine'])
+    event.listen(engine, 'connect',
+                 lambda conn, record: apply_pragmas(conn, settings['pragmas']))
+    return engine
+
+
+def seed(engine, users, logs):
+    db.metadata.create_all(engine, tables=[Role.__table__, User.__table__, VisitLog.__table__])
+    rnd = random.Random(1)
+    start = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'login': f'user{i}', 'password_hash': '-', 'name': f'Имя {i}',
+             'surname': 'Фамилия', 'created_at': start} for i in range(users)])
+        conn.execute(VisitLog.__table__.insert(), [
+            {'path': rnd.choice(PATHS), 'user_id': rnd.choice([None, rnd.randint(1, users)]),
+             'created_at': start + timedelta(seconds=i)} for i in range(logs)])
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(profile, readers, writers, seconds, batch):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = make_engine(path, profile)
+    try:
+        seed(engine, users=200, logs=20000)
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'read': [], 'write': [], 'locked': 0}
+
+        page = (select(VisitLog.id, VisitLog.path, VisitLog.created_at, User.login)
+                .outerjoin(User, VisitLog.user_id == User.id)
+                .order_by(VisitLog.created_at.desc(), VisitLog.id.desc())
+                .limit(20))
+
+        def worker(kind):
+            rnd = random.Random()
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    if kind == 'read':
+                        with engine.connect() as conn:
+                            conn.execute(page).all()
+                    else:
+                        now = datetime.utcnow()
+                        with engine.begin() as conn:
+                            conn.execute(VisitLog.__table__.insert(), [
+                                {'path': rnd.choice(PATHS), 'user_id': None, 'created_at': now}
+                                for _ in range(batch)])
+                except OperationalError:
+                    with lock:
+                        stats['locked'] += 1
+                    continue
+                elapsed = (time.perf_counter() - t0) * 1000
+                with lock:
+                    stats[kind].append(elapsed)
+                if kind == 'write':
+                    # writer сбрасывает пачку раз в несколько миллисекунд
+                    time.sleep(0.005)
+
+        threads = ([threading.Thread(target=worker, args=('read',)) for _ in range(readers)]
+                   + [threading.Thread(target=worker, args=('write',)) for _ in range(writers)])
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    result = {'profile': profile, 'locked_errors': stats['locked']}
+    for kind in ('read', 'write'):
+        values = stats[kind]
+        result[kind] = {
+            'ops_per_sec': round(len(values) / seconds, 1),
+            'p50_ms': round(statistics.median(values), 2) if values else 0.0,
+            'p95_ms': round(percentile(values, 0.95), 2),
+            'p99_ms': round(percentile(values, 0.99), 2),
+            'max_ms': round(max(values), 2) if values else 0.0,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=['none', 'production'], choices=sorted(PROFILES))
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    args = parser.parse_args()
+
+    results = [run(p, args.readers, args.writers, args.seconds, args.batch) for p in args.profiles]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    for r in results:
+        print(f"{r['profile']}: ошибок блокировки {r['locked_errors']}")
+        for kind in ('read', 'write'):
+            s = r[kind]
+            print(f"  {kind:>5}: {s['ops_per_sec']:8.1f} оп/с, p50 {s['p50_ms']:6.2f} мс, "
+                  f"p95 {s['p95_ms']:6.2f} мс, p99 {s['p99_ms']:6.2f} мс, макс {s['max_ms']:7.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
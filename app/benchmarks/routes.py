@@ -0,0 +1,296 @@
+"""Задержки основных страниц на заполненной базе.
+
+Для каждого масштаба создаётся временная база SQLite (пользователи, журнал
+посещений, счётчики отчётов), приложение поднимается через create_app и
+страницы запрашиваются тестовым клиентом в том же процессе. По каждой
+странице печатаются перцентили задержки, число SQL-запросов и время в базе
+на запрос; --output сохраняет результат в JSON, --compare сравнивает с
+сохранённым ранее (например, с прогона на предыдущем коммите).
+
+    python benchmarks/routes.py [--scale 1k 100k 1m] [--requests 50]
+        [--routes index visit_logs_main] [--db-dir DIR] [--page-cache]
+        [--output result.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, APP_DIR)
+
+from sqlalchemy import create_engine, event
+
+from app import create_app
+from models import db, Role, User, VisitLog
+from migrations import upgrade
+from hashing import password_hasher
+from metrics import metrics
+from visit_log_writer import visit_log_writer
+import rollups
+
+# (пользователей, записей журнала)
+SCALES = {
+    '1k': (100, 1000),
+    '100k': (10000, 100000),
+    '1m': (10000, 1000000),
+}
+
+PATHS = ['/', '/posts', '/about', '/counter', '/posts/1', '/posts/2', '/login']
+ADMIN_LOGIN = 'benchadmin'
+ADMIN_PASSWORD = 'Bench1234'
+# обычный пользователь с тем же паролем (id 2): видит только свой журнал
+USER_LOGIN = 'user1'
+# журнал равномерно раскладывается на последние DAYS суток
+DAYS = 60
+INSERT_CHUNK = 20000
+
+# (имя, метод, путь, клиент): 'anon' — гость, 'admin' — вошедший администратор,
+# 'user' — вошедший обычный пользователь, 'fresh' — новый клиент на каждый запрос
+ROUTES = [
+    ('index', 'GET', '/', 'anon'),
+    # основной журнал: админ видит всё, пользователь — свои строки (свой счётчик)
+    ('visit_logs_main', 'GET', '/visit_logs', 'admin'),
+    ('visit_logs_own', 'GET', '/visit_logs', 'user'),
+    ('visit_logs_index', 'GET', '/visit_logs/', 'admin'),
+    ('pages_report', 'GET', '/visit_logs/logs_pages_report', 'admin'),
+    ('users_report', 'GET', '/visit_logs/logs_users_report', 'admin'),
+    ('pages_report_csv', 'GET', '/visit_logs/logs_pages_report/export', 'admin'),
+    ('users_report_csv', 'GET', '/visit_logs/logs_users_report/export', 'admin'),
+    ('logs_export_day', 'GET', '/visit_logs/export?date_from={day}&date_to={day}', 'admin'),
+    ('login_form', 'GET', '/login', 'anon'),
+    ('login', 'POST', '/login', 'fresh'),
+    ('posts', 'GET', '/posts', 'anon'),
+]
+
+
+def seed(url, users, logs):
+    engine = create_engine(url)
+    try:
+        upgrade(engine)
+        rnd = random.Random(1)
+        now = datetime.utcnow().replace(microsecond=0)
+        start = now - timedelta(days=DAYS)
+        step = DAYS * 86400 / logs
+        # один хэш на всех: сидирование не должно занимать минуты
+        password_hash = password_hasher.hash(ADMIN_PASSWORD)
+        with engine.begin() as conn:
+            conn.execute(Role.__table__.insert(), [
+                {'id': 1, 'name': 'Administrator', 'description': 'Суперпользователь'},
+                {'id': 2, 'name': 'User', 'description': 'Обычный пользователь'},
+            ])
+            conn.execute(User.__table__.insert(), [
+                {'login': ADMIN_LOGIN if i == 0 else f'user{i}', 'password_hash': password_hash,
+                 'surname': 'Фамилия', 'name': f'Имя {i}', 'role_id': 1 if i == 0 else 2,
+                 'created_at': start}
+                for i in range(users)
+            ])
+        for offset in range(0, logs, INSERT_CHUNK):
+            with engine.begin() as conn:
+                conn.execute(VisitLog.__table__.insert(), [
+                    {'path': rnd.choice(PATHS),
+                     'user_id': rnd.choice([None, rnd.randint(1, users)]),
+                     'created_at': start + timedelta(seconds=i * step)}
+                    for i in range(offset, min(offset + INSERT_CHUNK, logs))
+                ])
+        with engine.begin() as conn:
+            rollups.rebuild(conn)
+    finally:
+        engine.dispose()
+
+
+class QueryCounter:
+    # SQL-запросы и время в базе в потоке бенчмарка; фоновый writer журнала
+    # пишет из своего потока и сюда не попадает
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.thread = threading.get_ident()
+        self.queries = 0
+        self.seconds = 0.0
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread:
+            conn.info.setdefault('bench_started', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread:
+            self.queries += 1
+            self.seconds += time.perf_counter() - conn.info['bench_started'].pop()
+
+    def reset(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def close(self):
+        event.remove(self.engine, 'before_cursor_execute', self._before)
+        event.remove(self.engine, 'after_cursor_execute', self._after)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def make_client(app, kind):
+    client = app.test_client()
+    if kind in ('admin', 'user'):
+        login = ADMIN_LOGIN if kind == 'admin' else USER_LOGIN
+        rv = client.post('/login', data={'username': login, 'password': ADMIN_PASSWORD})
+        if rv.status_code != 302:
+            raise RuntimeError(f'не удалось войти как {login}')
+    return client
+
+
+def measure(app, counter, clients, method, path, kind, requests, warmup):
+    data = {'username': ADMIN_LOGIN, 'password': ADMIN_PASSWORD} if method == 'POST' else None
+    latencies, queries, db_time, statuses = [], [], [], set()
+    for i in range(warmup + requests):
+        client = make_client(app, 'anon') if kind == 'fresh' else clients[kind]
+        counter.reset()
+        t0 = time.perf_counter()
+        rv = client.open(path, method=method, data=data)
+        # потоковые выгрузки считаются вместе с телом ответа
+        rv.get_data()
+        elapsed = time.perf_counter() - t0
+        rv.close()
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(counter.queries)
+        db_time.append(counter.seconds * 1000)
+        statuses.add(rv.status_code)
+    return {
+        'requests': requests,
+        'status': sorted(statuses),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p90_ms': round(percentile(latencies, 0.90), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries': round(statistics.mean(queries), 1),
+        'db_ms': round(statistics.mean(db_time), 2),
+    }
+
+
+def run_scale(scale, routes, requests, warmup, db_dir, page_cache, metrics_dir):
+    users, logs = SCALES[scale]
+    path = os.path.join(db_dir, f'routes-{scale}.db')
+    url = f'sqlite:///{path}'
+    if not os.path.exists(path):
+        t0 = time.perf_counter()
+        seed(url, users, logs)
+        print(f'[{scale}] база заполнена за {time.perf_counter() - t0:.1f} с', file=sys.stderr)
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': url,
+        'PAGE_CACHE_ENABLED': page_cache,
+        'IDENTITY_CACHE_BACKEND': 'memory',
+        'METRICS_DIR': metrics_dir,
+    })
+    day = (datetime.utcnow() - timedelta(days=DAYS // 2)).strftime('%Y-%m-%d')
+    results = {}
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+        try:
+            clients = {kind: make_client(app, kind) for kind in ('anon', 'admin', 'user')}
+            for name, method, route, kind in ROUTES:
+                if routes and name not in routes:
+                    continue
+                results[name] = measure(app, counter, clients, method,
+                                        route.format(day=day), kind, requests, warmup)
+                # записи журнала от этой страницы не должны достаться следующей
+                visit_log_writer.flush()
+        finally:
+            counter.close()
+            # поток записи свой у каждого приложения — останавливаем вместе с ним
+            app.extensions['visit_log_writer'].close()
+            db.engine.dispose()
+    return {'users': users, 'visit_logs': logs, 'routes': results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    for scale, data in results['scales'].items():
+        print(f"== {scale}: пользователей {data['users']}, записей журнала {data['visit_logs']}")
+        base = (baseline or {}).get('scales', {}).get(scale, {}).get('routes', {})
+        for name, r in data['routes'].items():
+            line = (f"  {name:>18}: p50 {r['p50_ms']:8.2f} мс, p90 {r['p90_ms']:8.2f} мс, "
+                    f"p99 {r['p99_ms']:8.2f} мс, запросов {r['queries']:5.1f}, "
+                    f"в базе {r['db_ms']:7.2f} мс, статус {r['status']}")
+            if name in base:
+                old = base[name]
+                change = (r['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0.0
+                line += f"  | было p50 {old['p50_ms']:.2f} мс ({change:+.0f}%), запросов {old['queries']}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', nargs='+', default=['1k'], choices=list(SCALES))
+    parser.add_argument('--requests', type=int, default=50, help='замеров на страницу')
+    parser.add_argument('--warmup', type=int, default=3, help='прогревочных запросов на страницу')
+    parser.add_argument('--routes', nargs='+', choices=[r[0] for r in ROUTES],
+                        help='только эти страницы')
+    parser.add_argument('--db-dir', help='хранить заполненные базы здесь и брать готовые '
+                                         '(по умолчанию — временный каталог)')
+    parser.add_argument('--page-cache', action='store_true',
+                        help='не выключать кэш страниц (по умолчанию мерится сама отрисовка)')
+    parser.add_argument('--output', help='сохранить результат в JSON')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    args = parser.parse_args()
+
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix='bench-routes-')
+    # файлы метрик прогона не смешиваются с метриками запущенного сервера
+    metrics_dir = tempfile.mkdtemp(prefix='bench-metrics-')
+    os.makedirs(db_dir, exist_ok=True)
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'page_cache': args.page_cache,
+        'requests': args.requests,
+        'scales': {},
+    }
+    try:
+        for scale in args.scale:
+            results['scales'][scale] = run_scale(scale, args.routes, args.requests,
+                                                 args.warmup, db_dir, args.page_cache,
+                                                 metrics_dir)
+    finally:
+        metrics.close()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        if not args.db_dir:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Время холодного старта приложения.
+
+Каждый замер — отдельный процесс python: импорт модуля app (с фабрикой
+create_app) и первый запрос через тестовый клиент.
+
+    python benchmarks/startup.py [--runs 10] [--path /about]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.app.config['METRICS_DIR'] = {metrics_dir!r}
+client = app.app.test_client()
+rv = client.get({path!r})
+t2 = time.perf_counter()
+rv = client.get({path!r})
+t3 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'first_request': t2 - t1,
+                  'second_request': t3 - t2, 'status': rv.status_code}}))
+'''
+
+
+def measure(path):
+    # файлы метрик замера — во временном каталоге, не в общем /dev/shm
+    with tempfile.TemporaryDirectory(prefix='bench-metrics-') as metrics_dir:
+        code = PROBE.format(app_dir=APP_DIR, path=path, metrics_dir=metrics_dir)
+        out = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR,
+                             capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/about')
+    args = parser.parse_args()
+
+    samples = [measure(args.path) for _ in range(args.runs)]
+    for key in ('import', 'first_request', 'second_request'):
+        values = [s[key] * 1000 for s in samples]
+        print(f'{key:>15}: медиана {statistics.median(values):7.1f} мс, '
+              f'мин {min(values):7.1f} мс, макс {max(values):7.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
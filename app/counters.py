@@ -0,0 +1,137 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, UserCounter
+from rollups import increment_counts
+
+# Счётчик посещений /counter, общий для всех воркеров.
+# Значения хранятся в таблице user_counters. Воркер копит приращения
+# в памяти и раз в COUNTER_FLUSH_INTERVAL_MS сбрасывает их одним upsert
+# из фонового потока, так что запрос не ждёт записи в базу.
+# Показываемое значение = последнее прочитанное из базы + свои несброшенные
+# приращения; прочитанное обновляется не чаще того же интервала.
+
+# больше стольких прочитанных значений в памяти не держим
+MAX_CACHED = 10000
+
+
+class CounterBuffer:
+    # приращения и фоновый поток одного приложения (app.extensions['visit_counter'])
+
+    def __init__(self, app):
+        self.app = app
+        self._pending = Counter()
+        self._inflight = Counter()
+        self._stored = {}
+        self._read_at = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def incr(self, user_id):
+        self._ensure_started()
+        stored = self._read(user_id)
+        with self._lock:
+            self._pending[user_id] += 1
+            return stored + self._inflight[user_id] + self._pending[user_id]
+
+    def _read(self, user_id):
+        interval = self.app.config['COUNTER_FLUSH_INTERVAL_MS'] / 1000
+        now = time.monotonic()
+        if user_id in self._stored and now - self._read_at[user_id] < interval:
+            return self._stored[user_id]
+        value = db.session.execute(
+            select(UserCounter.count).where(UserCounter.user_id == user_id)
+        ).scalar() or 0
+        with self._lock:
+            if len(self._stored) >= MAX_CACHED:
+                self._stored.clear()
+                self._read_at.clear()
+            # пока читали, фоновый поток мог сбросить свои приращения
+            if now >= self._read_at.get(user_id, 0):
+                self._stored[user_id] = value
+                self._read_at[user_id] = now
+            return self._stored[user_id]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._inflight = pending
+            if not pending:
+                return
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        increment_counts(conn, UserCounter.__table__, 'user_id', pending)
+                        rows = conn.execute(
+                            select(UserCounter.user_id, UserCounter.count)
+                            .where(UserCounter.user_id.in_(list(pending)))
+                        ).all()
+            except Exception:
+                # не потерять приращения: вернём их в очередь до следующей попытки
+                with self._lock:
+                    self._pending.update(pending)
+                    self._inflight = Counter()
+                self.app.logger.exception('Не удалось сохранить счётчики посещений')
+                return
+            now = time.monotonic()
+            with self._lock:
+                for user_id, count in rows:
+                    self._stored[user_id] = count
+                    self._read_at[user_id] = now
+                self._inflight = Counter()
+
+    def close(self):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # после fork приращения родителя принадлежат родителю
+            self._pending = Counter()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, name='visit-counter', daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        interval = self.app.config['COUNTER_FLUSH_INTERVAL_MS'] / 1000
+        while not self._stop.wait(interval):
+            self.flush()
+
+
+class VisitCounter:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COUNTER_FLUSH_INTERVAL_MS', 1000)
+        app.extensions['visit_counter'] = CounterBuffer(app)
+
+    def incr(self, user_id):
+        return current_app.extensions['visit_counter'].incr(user_id)
+
+
+visit_counter = VisitCounter()
@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+
+from flask import Response, stream_with_context
+
+from models import db
+
+# Потоковая выгрузка CSV (и JSONL — по объекту на строку): строки читаются
+# из базы порциями (yield_per) и отдаются клиенту по мере формирования,
+# целиком в памяти ничего не лежит.
+
+CHUNK_ROWS = 1000
+
+
+def iter_rows(stmt, chunk_rows=CHUNK_ROWS):
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_rows))
+    for row in result:
+        yield tuple(row)
+
+
+def iter_csv(header, rows, chunk_rows=CHUNK_ROWS):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(header)
+    for i, row in enumerate(rows, 1):
+        w.writerow(row)
+        if i % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def iter_jsonl(header, rows, chunk_rows=CHUNK_ROWS):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, row)), ensure_ascii=False,
+                                default=_json_default))
+        if len(lines) == chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_gzip(chunks):
+    # wbits=31 — формат gzip, а не «голый» zlib
+    z = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = z.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield z.flush()
+
+
+def csv_response(filename, header, rows, gzip=False):
+    return _stream_response(filename, iter_csv(header, rows), 'text/csv', gzip)
+
+
+def jsonl_response(filename, header, rows, gzip=False):
+    return _stream_response(filename, iter_jsonl(header, rows), 'application/x-ndjson', gzip)
+
+
+def _stream_response(filename, chunks, mimetype, gzip):
+    if gzip:
+        return Response(
+            stream_with_context(iter_gzip(chunks)),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': f'attachment; filename={filename}.gz'}
+        )
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+from rollups import UPSERT_INSERTS
+
+# Настройка подключения к базе.
+# Адрес берётся из DATABASE_URL (по умолчанию — файл SQLite рядом с app.py);
+# для серверной базы (PostgreSQL) включается пул с проверкой соединений —
+# тогда несколько хостов с приложением работают с одной базой.
+#
+# Профили настройки SQLite.
+# По умолчанию SQLite работает в режиме rollback journal: пока фоновый поток
+# журнала посещений пишет пачку, читатели ждут, а при долгой записи получают
+# «database is locked». В WAL читатели не блокируются писателем, а
+# busy_timeout заставляет второго писателя подождать вместо ошибки.
+# Прагмы выполняются на каждое новое соединение пула движка приложения
+# (db_profile.listen после db.init_app); профиль выбирается
+# DB_PROFILE (или переменной окружения DB_PROFILE), отдельные значения можно
+# переопределить через DB_PRAGMAS. Проверка: benchmarks/db_concurrency.py.
+
+PROFILES = {
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            # в WAL NORMAL не рискует целостностью, теряется лишь последняя
+            # транзакция при отключении питания
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -32000,   # КиБ, ~32 МБ на соединение
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'engine': {'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 3600},
+    },
+    'development': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -8000,
+            'mmap_size': 64 * 1024 * 1024,
+        },
+        'engine': {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 10, 'pool_recycle': 3600},
+    },
+    'testing': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'OFF',
+            'busy_timeout': 5000,
+        },
+        'engine': {},
+    },
+    # настройки драйвера как есть — для сравнения в бенчмарке
+    'none': {'pragmas': {}, 'engine': {}},
+}
+
+# пул для серверной базы: соединения проверяются перед выдачей и
+# пересоздаются раньше, чем их закроет сервер или балансировщик
+SERVER_ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 10,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+
+def database_url(default):
+    url = os.environ.get('DATABASE_URL') or default
+    # так адрес отдают многие хостинги, SQLAlchemy понимает только postgresql://
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_file_sqlite(uri):
+    return uri.startswith('sqlite') and uri not in ('sqlite://', 'sqlite:///:memory:')
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+class ProfileSettings:
+    # профиль одного приложения (app.extensions['db_profile'])
+
+    def __init__(self, name, pragmas):
+        self.name = name
+        self.pragmas = pragmas
+
+    def on_connect(self, dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_pragmas(dbapi_connection, self.pragmas)
+
+
+class DatabaseProfile:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # вызывается до db.init_app: параметры пула нужны при создании движка
+        app.config.setdefault('DB_PROFILE', os.environ.get('DB_PROFILE', 'production'))
+        app.config.setdefault('DB_PRAGMAS', {})
+        name = app.config['DB_PROFILE']
+        if name not in PROFILES:
+            raise ValueError(f'Неизвестный DB_PROFILE: {name!r}')
+        profile = PROFILES[name]
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        backend = make_url(uri).get_backend_name()
+        # счётчики и скетчи пишутся upsert'ом (rollups.increment_counts) —
+        # на другой базе фоновый writer падал бы на каждой пачке
+        if backend not in UPSERT_INSERTS:
+            raise ValueError(f'База {backend!r} не поддерживается: нужна SQLite или PostgreSQL')
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        if not uri.startswith('sqlite'):
+            defaults = SERVER_ENGINE_OPTIONS
+        elif is_file_sqlite(uri):
+            defaults = profile['engine']
+        else:
+            # у базы в памяти свой пул без этих параметров
+            defaults = {}
+        for key, value in defaults.items():
+            options.setdefault(key, value)
+        app.extensions['db_profile'] = ProfileSettings(
+            name, {**profile['pragmas'], **app.config['DB_PRAGMAS']})
+
+    def listen(self, app):
+        # после db.init_app: прагмы ставятся только соединениям движка этого
+        # приложения, а не всем движкам SQLite в процессе
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'connect', app.extensions['db_profile'].on_connect)
+
+    @property
+    def name(self):
+        return current_app.extensions['db_profile'].name
+
+    def current(self, conn):
+        # фактические значения прагм на соединении — для db-status
+        pragmas = current_app.extensions['db_profile'].pragmas
+        return {name: conn.exec_driver_sql(f'PRAGMA {name}').scalar() for name in pragmas}
+
+
+db_profile = DatabaseProfile()
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import tempfile
+
+# Общая для всех воркеров метка поколения кэша — маленький файл
+# (по умолчанию в /dev/shm, это память, а не диск).
+# Кэш хранит данные вместе с меткой, при которой они получены; сброс пишет
+# новую метку, и старые данные перестают совпадать сразу во всех процессах,
+# даже если сами данные лежат в памяти каждого воркера.
+
+
+def shared_path(name):
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, name)
+
+
+def instance_key(app):
+    # короткий ключ развёртывания (каталог приложения и база) для имён общих
+    # файлов: два приложения на одном хосте не читают файлы друг друга
+    source = app.root_path + '\n' + str(app.config.get('SQLALCHEMY_DATABASE_URI'))
+    return hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+class Generation:
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def bump(self):
+        # случайная метка, а не счётчик: два одновременных сброса
+        # из разных процессов не сольются в один
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.urandom(8).hex())
+        os.replace(tmp, self.path)
@@ -0,0 +1,172 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import (
+    generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+)
+
+from metrics import metrics
+
+# Хэширование паролей вне потока запроса.
+# scrypt/pbkdf2 намеренно тяжёлые, поэтому считаются в небольшом пуле
+# процессов. Число одновременно ожидающих задач ограничено: если очередь
+# полна дольше PASSWORD_HASH_QUEUE_TIMEOUT, запрос получает HashingBusy (503),
+# а не занимает воркер до бесконечности.
+# PASSWORD_HASH_WORKERS = 0 — считать прямо в потоке запроса (без пула).
+# Массовое хэширование (hash_many, импорт) занимает не больше
+# PASSWORD_HASH_MAX_PENDING - PASSWORD_HASH_RESERVED мест: остальные
+# всегда свободны для входа и смены пароля.
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def _method_prefix(method):
+    # префикс, который werkzeug запишет в хэш: короткое имя метода
+    # дополняется его параметрами по умолчанию (без пробного хэширования)
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(args or ['32768', '8', '1'])
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f'Неизвестный метод хэширования паролей: {method}')
+
+
+class PasswordHasher:
+
+    def __init__(self, app=None):
+        self.method = 'scrypt:32768:8:1'
+        self.prefix = None
+        self.workers = 0
+        self.timeout = 10
+        self.queue_timeout = 2
+        self._slots = None
+        self._bulk_slots = None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # стоимость задаётся методом werkzeug: 'scrypt:N:r:p' или 'pbkdf2:sha256:итерации'
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 16)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_TIMEOUT', 2)
+        app.config.setdefault('PASSWORD_HASH_RESERVED', 4)
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        # префикс хэша — полные параметры метода: 'scrypt' даёт 'scrypt:32768:8:1'
+        self.prefix = _method_prefix(self.method)
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self.queue_timeout = app.config['PASSWORD_HASH_QUEUE_TIMEOUT']
+        pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self._slots = threading.BoundedSemaphore(pending)
+        self._bulk_slots = threading.BoundedSemaphore(
+            max(1, pending - app.config['PASSWORD_HASH_RESERVED']))
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        return self._timed('hash', _hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._timed('verify', _verify, pwhash, password)
+
+    def hash_many(self, passwords):
+        # пачка паролей для импорта: задачи раздаются всем процессам пула, но
+        # занимают не больше MAX_PENDING - RESERVED мест. Вход во время импорта
+        # не получает HashingBusy, хотя ждёт за уже поставленными задачами
+        # импорта — не больше их числа
+        if not self.workers:
+            return [_hash(p, self.method) for p in passwords]
+        futures = []
+        try:
+            for password in passwords:
+                if not self._bulk_slots.acquire(timeout=self.timeout):
+                    raise HashingBusy()
+                if not self._slots.acquire(timeout=self.timeout):
+                    self._bulk_slots.release()
+                    raise HashingBusy()
+                try:
+                    future = self._get_pool().submit(_hash, password, self.method)
+                except BaseException:
+                    self._slots.release()
+                    self._bulk_slots.release()
+                    raise
+                future.add_done_callback(self._release_bulk)
+                futures.append(future)
+            return [f.result(timeout=self.timeout) for f in futures]
+        except (FutureTimeout, HashingBusy):
+            for f in futures:
+                f.cancel()
+            raise HashingBusy()
+
+    def _release_bulk(self, future):
+        self._slots.release()
+        self._bulk_slots.release()
+
+    def needs_rehash(self, pwhash):
+        # параметры хэша записаны в его префиксе до первого '$'
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def _timed(self, op, fn, *args):
+        # время вместе с ожиданием места в пуле — столько ждёт запрос
+        started = time.perf_counter()
+        try:
+            return self._run(fn, *args)
+        except HashingBusy:
+            metrics.inc('password_hash_busy_total')
+            raise
+        finally:
+            metrics.observe('password_hash_seconds', time.perf_counter() - started, {'op': op})
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # место освобождается, когда задача завершится, а не когда запрос
+        # перестал её ждать: зависшая задача продолжает занимать процесс пула
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashingBusy()
+
+    def _get_pool(self):
+        # пул создаётся лениво и заново в каждом воркере после fork
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    methods = multiprocessing.get_all_start_methods()
+                    ctx = multiprocessing.get_context(
+                        'forkserver' if 'forkserver' in methods else 'spawn'
+                    )
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=ctx)
+                    self._pid = os.getpid()
+        return self._pool
+
+
+password_hasher = PasswordHasher()
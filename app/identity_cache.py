@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from generation import Generation, instance_key, shared_path
+from models import db, User, Role
+
+# Кэш «личности» пользователя для Flask-Login user_loader.
+# Хранит колонки пользователя и его роли, так что на уже залогиненную сессию
+# не уходит ни одного запроса: объект собирается из кэша и присоединяется
+# к сессии без SELECT. Хэш пароля в кэш не попадает — он подгружается
+# из базы только при обращении (смена пароля).
+# Бэкенды: 'memory' — LRU в процессе, 'sqlite' — общий файл для всех воркеров
+# (по умолчанию в /dev/shm, свой у каждой базы), 'none' — кэш выключен.
+# Записи 'memory' помечены общей меткой поколения (generation.py): сброс
+# пользователя в одном воркере меняет метку, и остальные воркеры перестают
+# отдавать свои копии — удалённый или пониженный пользователь не сохраняет
+# доступ на IDENTITY_CACHE_TTL.
+
+USER_FIELDS = ('id', 'login', 'surname', 'name', 'patronymic', 'role_id', 'created_at')
+ROLE_FIELDS = ('id', 'name', 'description')
+
+
+class MemoryBackend:
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    # один файл на все процессы; соединение своё у каждого потока
+    PURGE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+            os.close(fd)
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                     (key, value, time.time() + ttl))
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache')
+
+
+class IdentityStore:
+    # кэш одного приложения (app.extensions['identity_cache'])
+
+    def __init__(self, app):
+        self.app = app
+        self.backend = None
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        kind = app.config['IDENTITY_CACHE_BACKEND']
+        if kind == 'memory':
+            self.backend = MemoryBackend(app.config['IDENTITY_CACHE_SIZE'])
+            self.generation = Generation(app.config['IDENTITY_CACHE_GENERATION_PATH'])
+        elif kind == 'sqlite':
+            self.backend = SQLiteBackend(app.config['IDENTITY_CACHE_PATH'])
+        elif kind == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f'Неизвестный IDENTITY_CACHE_BACKEND: {kind!r}')
+
+    def load_user(self, user_id):
+        if self.backend is None:
+            return self._fetch(user_id)
+        key = f'user:{user_id}'
+        # метку читаем до запроса в базу: сброс между запросом и записью
+        # в кэш не оставит в нём старых данных
+        generation = self.generation.read() if self.generation is not None else ''
+        try:
+            raw = self.backend.get(key)
+        except sqlite3.Error:
+            raw = None
+        if raw is not None:
+            cached_generation, raw = raw.split('\n', 1)
+            if cached_generation == generation:
+                self.hits += 1
+                return _attach(json.loads(raw))
+        self.misses += 1
+        user = self._fetch(user_id)
+        if user is not None:
+            try:
+                self.backend.set(key, generation + '\n' + json.dumps(_dump(user)),
+                                 self.app.config['IDENTITY_CACHE_TTL'])
+            except sqlite3.Error:
+                pass
+        return user
+
+    def invalidate(self, user_id):
+        if self.backend is None:
+            return
+        try:
+            self.backend.delete(f'user:{user_id}')
+        except sqlite3.Error:
+            self.app.logger.exception('Не удалось сбросить кэш пользователя %s', user_id)
+        self._bump_generation()
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+            self._bump_generation()
+
+    def _bump_generation(self):
+        # память других воркеров отсюда не очистить — меняем общую метку
+        if self.generation is None:
+            return
+        try:
+            self.generation.bump()
+        except OSError:
+            self.app.logger.exception('Не удалось сменить поколение кэша пользователей')
+
+    @staticmethod
+    def _fetch(user_id):
+        # пользователь и роль одним запросом
+        return db.session.get(User, user_id, options=[joinedload(User.role)])
+
+
+class IdentityCache:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDENTITY_CACHE_BACKEND', 'memory')
+        app.config.setdefault('IDENTITY_CACHE_TTL', 60)
+        app.config.setdefault('IDENTITY_CACHE_SIZE', 1024)
+        # имена с ключом развёртывания: приложение с другой базой на том же
+        # хосте не получит чужих пользователей и не сбросит чужой кэш
+        key = instance_key(app)
+        app.config.setdefault('IDENTITY_CACHE_PATH', shared_path(f'web4sem-identity-{key}.db'))
+        app.config.setdefault('IDENTITY_CACHE_GENERATION_PATH',
+                              shared_path(f'web4sem-identity-{key}.gen'))
+        app.extensions['identity_cache'] = IdentityStore(app)
+
+    def load_user(self, user_id):
+        return current_app.extensions['identity_cache'].load_user(user_id)
+
+    def invalidate(self, user_id):
+        current_app.extensions['identity_cache'].invalidate(user_id)
+
+    def clear(self):
+        current_app.extensions['identity_cache'].clear()
+
+
+def _dump(user):
+    data = {f: getattr(user, f) for f in USER_FIELDS}
+    data['created_at'] = data['created_at'].isoformat()
+    role = user.role
+    return {
+        'user': data,
+        'role': {f: getattr(role, f) for f in ROLE_FIELDS} if role else None,
+    }
+
+
+def _attach(data):
+    # собираем объекты без SELECT: make_transient_to_detached даёт им
+    # identity key, merge(load=False) кладёт их в сессию как загруженные
+    fields = dict(data['user'])
+    fields['created_at'] = datetime.fromisoformat(fields['created_at'])
+    user = User(**fields)
+    make_transient_to_detached(user)
+    user = db.session.merge(user, load=False)
+    role = None
+    if data['role'] is not None:
+        role = Role(**data['role'])
+        make_transient_to_detached(role)
+        role = db.session.merge(role, load=False)
+    set_committed_value(user, 'role', role)
+    return user
+
+
+identity_cache = IdentityCache()
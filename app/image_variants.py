@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+from static_assets import static_assets
+
+# Уменьшенные копии картинок постов для srcset.
+# Для каждой картинки из static/images строятся варианты заданной ширины
+# (IMAGE_VARIANTS) и кладутся в IMAGE_VARIANTS_DIR (по умолчанию
+# static/images/variants) под именем <uuid>-w<ширина>.jpg. Отдаются они
+# своим маршрутом /images/variants/<имя> из этого каталога, где бы он ни был;
+# имя по-прежнему содержит UUID, поэтому static_assets отдаёт их с immutable. Варианты создаются при первом обращении или заранее
+# командой `flask warm-images`. Без Pillow шаблоны получают только оригинал.
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class ImageVariants:
+
+    def __init__(self, app=None):
+        self._info = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_VARIANTS', (320, 800))
+        app.config.setdefault('IMAGE_VARIANTS_QUALITY', 82)
+        app.config.setdefault('IMAGE_VARIANTS_DIR', os.path.join(app.root_path, 'static', 'images', 'variants'))
+        app.add_url_rule('/images/variants/<filename>', endpoint='image_variant',
+                         view_func=self.serve)
+        app.jinja_env.globals['image_srcset'] = self.srcset
+        app.extensions['image_variants'] = self
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def source(self, image_id):
+        return os.path.join(current_app.config['STATIC_DIR'], 'images', image_id)
+
+    def variant_name(self, image_id, width):
+        stem, _ = os.path.splitext(image_id)
+        return f'{stem}-w{width}.jpg'
+
+    def variant_path(self, image_id, width):
+        return os.path.join(current_app.config['IMAGE_VARIANTS_DIR'], self.variant_name(image_id, width))
+
+    def variants(self, image_id):
+        # [(endpoint, имя файла, ширина)], оригинал — последним
+        source = self.source(image_id)
+        mtime = os.stat(source).st_mtime_ns
+        # у приложений могут быть разные каталоги и ширины
+        cfg = current_app.config
+        key = (source, cfg['IMAGE_VARIANTS_DIR'], tuple(cfg['IMAGE_VARIANTS']))
+        cached = self._info.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        result = [('static', f'images/{image_id}', None)]
+        if self.available:
+            with self._lock:
+                result = self._build(image_id, source)
+        self._info[key] = (mtime, result)
+        return result
+
+    def _build(self, image_id, source):
+        with Image.open(source) as img:
+            original_width = img.width
+            targets = [w for w in current_app.config['IMAGE_VARIANTS'] if w < original_width]
+            missing = [w for w in targets if not self._fresh(self.variant_path(image_id, w), source)]
+            if missing:
+                img = img.convert('RGB')
+                for width in missing:
+                    self._save(img, width, self.variant_path(image_id, width))
+        result = [('image_variant', self.variant_name(image_id, w), w) for w in targets]
+        result.append(('static', f'images/{image_id}', original_width))
+        return result
+
+    @staticmethod
+    def _fresh(path, source):
+        try:
+            return os.stat(path).st_mtime_ns >= os.stat(source).st_mtime_ns
+        except OSError:
+            return False
+
+    def _save(self, img, width, target):
+        height = round(img.height * width / img.width)
+        resized = img.resize((width, height), Image.LANCZOS)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # через временный файл: параллельный воркер не прочитает половину
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.jpg')
+        with os.fdopen(fd, 'wb') as f:
+            resized.save(f, 'JPEG', quality=current_app.config['IMAGE_VARIANTS_QUALITY'],
+                         optimize=True, progressive=True)
+        # mkstemp создаёт файл 0600, а статику может отдавать фронтенд-сервер
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+
+    def srcset(self, image_id):
+        # (src, srcset) для <img>; src — самый маленький вариант
+        try:
+            variants = self.variants(image_id)
+        except OSError:
+            return url_for('static', filename=f'images/{image_id}'), ''
+        src = url_for(variants[0][0], filename=variants[0][1])
+        srcset = ', '.join(f"{url_for(endpoint, filename=name)} {width}w"
+                           for endpoint, name, width in variants if width)
+        return src, srcset
+
+    def serve(self, filename):
+        path = safe_join(current_app.config['IMAGE_VARIANTS_DIR'], filename)
+        return static_assets.send(path, filename)
+
+    def warm(self):
+        images_dir = os.path.join(current_app.config['STATIC_DIR'], 'images')
+        count = 0
+        for name in sorted(os.listdir(images_dir)):
+            if os.path.isfile(os.path.join(images_dir, name)) and name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                self.variants(name)
+                count += 1
+        return count
+
+
+image_variants = ImageVariants()
+
+
+@click.command('warm-images')
+@with_appcontext
+def warm_images_command():
+    """Заранее построить уменьшенные копии картинок постов."""
+    if not image_variants.available:
+        click.echo('Pillow не установлен — варианты не строятся, отдаются оригиналы.')
+        return
+    count = image_variants.warm()
+    widths = ', '.join(str(w) for w in current_app.config['IMAGE_VARIANTS'])
+    click.echo(f'Обработано картинок: {count} (ширины: {widths}).')
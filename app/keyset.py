@@ -0,0 +1,136 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+# Курсорная (keyset) пагинация по ключу (created_at, id) в порядке убывания.
+# Вместо OFFSET страница ищется условием «строго после/до ключа», поэтому
+# глубокие страницы стоят столько же, сколько первая.
+# Курсор — непрозрачный токен: направление, ключ граничной строки и номер
+# первой строки страницы (только для нумерации в таблице).
+
+
+class KeysetPage:
+
+    def __init__(self, items, per_page, start, next_cursor, prev_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.start = start
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(direction, created_at, id_, start):
+    raw = json.dumps([direction, created_at.isoformat(), id_, start])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # битый или подделанный курсор — просто первая страница
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, created_at, id_, start = json.loads(raw)
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(id_), max(int(start), 1)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, model, per_page, cursor=None, total=None):
+    decoded = decode_cursor(cursor) if cursor else None
+    created_at, id_ = model.created_at, model.id
+
+    if decoded is None:
+        rows = query.order_by(created_at.desc(), id_.desc()).limit(per_page + 1).all()
+        more, rows = len(rows) > per_page, rows[:per_page]
+        start, has_next, has_prev = 1, more, False
+    else:
+        direction, key_created, key_id, start = decoded
+        if direction == 'next':
+            rows = (
+                query.filter(or_(created_at < key_created,
+                                 and_(created_at == key_created, id_ < key_id)))
+                .order_by(created_at.desc(), id_.desc())
+                .limit(per_page + 1).all()
+            )
+            more, rows = len(rows) > per_page, rows[:per_page]
+            has_next, has_prev = more, True
+        else:
+            rows = (
+                query.filter(or_(created_at > key_created,
+                                 and_(created_at == key_created, id_ > key_id)))
+                .order_by(created_at.asc(), id_.asc())
+                .limit(per_page + 1).all()
+            )
+            more, rows = len(rows) > per_page, rows[:per_page][::-1]
+            has_next, has_prev = True, more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor('next', last.created_at, last.id, start + len(rows))
+    if rows and has_prev:
+        first = rows[0]
+        prev_cursor = encode_cursor('prev', first.created_at, first.id, start - per_page)
+    return KeysetPage(rows, per_page, start, next_cursor, prev_cursor, total)
+
+
+# === Кэш общего количества строк ===
+# COUNT(*) по журналу дорогой и для навигации не нужен, поэтому итог
+# показывается приблизительным: пересчитывается не чаще раза в ttl секунд.
+# Кэш свой у каждого приложения (app.extensions), ключей — не больше
+# COUNT_CACHE_SIZE: у каждого пользователя свой счётчик, старые вытесняются.
+
+COUNT_CACHE_SIZE = 1024
+
+
+class CountCache:
+
+    def __init__(self, maxsize=COUNT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or time.monotonic() - hit[0] >= ttl:
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def cached_count(key, query, ttl):
+    if ttl <= 0:
+        return None
+    cache = current_app.extensions.setdefault('keyset_counts', CountCache())
+    value = cache.get(key, ttl)
+    if value is None:
+        value = query.order_by(None).count()
+        cache.set(key, value)
+    return value
@@ -0,0 +1,359 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки, там нет и нескольких воркеров gunicorn
+    fcntl = None
+
+from flask import Response, current_app, g, request
+
+from generation import instance_key, shared_path
+
+# Метрики в текстовом формате Prometheus на /metrics.
+# Каждый воркер копит значения у себя в памяти и раз в
+# METRICS_FLUSH_INTERVAL_MS атомарно записывает их в свой файл
+# METRICS_DIR/<pid>.json (по умолчанию в /dev/shm — это память, а не диск;
+# имя каталога своё у каждого развёртывания, см. generation.instance_key).
+# /metrics складывает файлы всех воркеров, поэтому любой воркер, на который
+# попал запрос Prometheus, отдаёт картину всего сервера.
+# Счётчики и гистограммы завершившихся воркеров переносятся в retired.json
+# (при выходе воркера, при сборке /metrics, если процесса уже нет, и при
+# старте нового воркера с тем же pid), а файл воркера удаляется — суммы
+# не уменьшаются и файлы не копятся. «Текущие» значения (gauge) умерших
+# воркеров не учитываются.
+# Значения общие для процесса, как и его файл: в файл пишет приложение,
+# первым обработавшее запрос в этом процессе.
+#
+# Что собирается:
+# - http_request_duration_seconds — гистограмма по endpoint, методу и
+#   статусу, её _count — число запросов;
+# - очередь журнала посещений: глубина, выброшенные записи, записанные
+#   пачки и время их записи (visit_log_writer.py);
+# - время хэширования и проверки паролей (hashing.py);
+# - попадания и промахи кэша пользователей и кэша страниц.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Время обработки запроса'),
+    'visit_log_queue_depth': ('gauge', 'Записей журнала посещений в очереди'),
+    'visit_log_dropped_total': ('counter', 'Записей журнала, выброшенных при полной очереди'),
+    'visit_log_written_total': ('counter', 'Записей журнала, записанных в базу'),
+    'visit_log_write_errors_total': ('counter', 'Записей журнала, которые не удалось записать'),
+    'visit_log_batch_seconds': ('histogram', 'Время записи пачки журнала с счётчиками'),
+    'password_hash_seconds': ('histogram', 'Время хэширования (hash) и проверки (verify) пароля'),
+    'password_hash_busy_total': ('counter', 'Отказов HashingBusy: пул хэширования занят'),
+    'cache_hits_total': ('counter', 'Попаданий в кэш'),
+    'cache_misses_total': ('counter', 'Промахов кэша'),
+}
+
+
+RETIRED = 'retired.json'
+
+
+def _default_dir(app):
+    return shared_path(f'web4sem-metrics-{instance_key(app)}')
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(directory, name, data):
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+@contextmanager
+def _locked(directory):
+    # перенос в retired.json и чтение файлов для /metrics не перекрываются
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class Metrics:
+
+    def __init__(self, app=None):
+        self.buckets = DEFAULT_BUCKETS
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        # процесс, в котором вызван close(): его файл уже в retired.json
+        self._closed_pid = None
+        # приложение, из которого фоновый поток берёт настройки и значения
+        self._flush_app = None
+        atexit.register(self.close)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_DIR', _default_dir(app))
+        app.config.setdefault('METRICS_FLUSH_INTERVAL_MS', 1000)
+        app.extensions['metrics'] = self
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/metrics', endpoint='metrics', view_func=self.view)
+
+    # === Запись значений ===
+
+    def inc(self, name, labels=None, n=1):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name, value, labels=None):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # [счётчики по корзинам..., +Inf], сумма
+                hist = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            hist[0][bisect.bisect_left(self.buckets, value)] += 1
+            hist[1] += value
+
+    def _start(self):
+        if current_app.config['METRICS_ENABLED']:
+            self._ensure_started(current_app._get_current_object())
+            g.metrics_started = time.perf_counter()
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            self.observe('http_request_duration_seconds', time.perf_counter() - started, {
+                'endpoint': request.endpoint or 'none',
+                'method': request.method,
+                'status': str(response.status_code),
+            })
+        return response
+
+    # === Значения других расширений (на момент сброса) ===
+
+    @staticmethod
+    def _collect(app):
+        # (вид, имя, метки, значение); счётчики здесь — итог процесса
+        ext = app.extensions
+        values = []
+        writer = ext.get('visit_log_writer')
+        if writer is not None:
+            values.append(('gauge', 'visit_log_queue_depth', {}, writer.depth()))
+            values.append(('counter', 'visit_log_dropped_total', {}, writer.dropped))
+        for name in ('identity_cache', 'page_cache'):
+            cache = ext.get(name)
+            if cache is not None:
+                values.append(('counter', 'cache_hits_total', {'cache': name}, cache.hits))
+                values.append(('counter', 'cache_misses_total', {'cache': name}, cache.misses))
+        return values
+
+    # === Файл воркера ===
+
+    def snapshot(self, app):
+        counters, gauges = [], []
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                counters.append([name, dict(labels), value])
+            histograms = [[name, dict(labels), list(hist[0]), hist[1]]
+                          for (name, labels), hist in self._histograms.items()]
+        for kind, name, labels, value in self._collect(app):
+            (counters if kind == 'counter' else gauges).append([name, labels, value])
+        return {'pid': os.getpid(), 'buckets': list(self.buckets), 'counters': counters,
+                'gauges': gauges, 'histograms': histograms}
+
+    def flush(self, app):
+        if self._closed_pid == os.getpid():
+            return
+        directory = app.config['METRICS_DIR']
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write(directory, f'{os.getpid()}.json', self.snapshot(app))
+        except OSError:
+            app.logger.exception('Не удалось сохранить метрики воркера')
+
+    def retire(self, directory, pid):
+        # счётчики и гистограммы файла воркера — в retired.json, файл удаляется;
+        # вызывается под _locked
+        path = os.path.join(directory, f'{pid}.json')
+        data = _load(path)
+        if data is not None:
+            retired = _load(os.path.join(directory, RETIRED)) or {
+                'buckets': list(self.buckets), 'counters': [], 'histograms': []}
+            counters = {_key(name, labels): value for name, labels, value in retired['counters']}
+            for name, labels, value in data['counters']:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            histograms = {_key(name, labels): [buckets, total]
+                          for name, labels, buckets, total in retired['histograms']}
+            if data['buckets'] == retired['buckets']:
+                for name, labels, buckets, total in data['histograms']:
+                    hist = histograms.setdefault(_key(name, labels), [[0] * len(buckets), 0.0])
+                    hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+                    hist[1] += total
+            retired['counters'] = [[name, dict(labels), value]
+                                   for (name, labels), value in counters.items()]
+            retired['histograms'] = [[name, dict(labels), hist[0], hist[1]]
+                                     for (name, labels), hist in histograms.items()]
+            _write(directory, RETIRED, retired)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        app = self._flush_app
+        self.flush(app)
+        directory = app.config['METRICS_DIR']
+        try:
+            with _locked(directory):
+                self.retire(directory, os.getpid())
+            self._closed_pid = os.getpid()
+        except (OSError, ValueError, KeyError):
+            app.logger.exception('Не удалось перенести метрики воркера')
+
+    def _ensure_started(self, app):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # после fork значения родителя остаются в его файле
+            self._counters = {}
+            self._histograms = {}
+            self._stop = threading.Event()
+            self._flush_app = app
+            # файл с нашим pid — от завершившегося процесса, которому
+            # достался тот же номер: его счётчики нельзя затереть своими
+            directory = app.config['METRICS_DIR']
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with _locked(directory):
+                    self.retire(directory, os.getpid())
+            except (OSError, ValueError, KeyError):
+                app.logger.exception('Не удалось перенести метрики прежнего воркера')
+            self._thread = threading.Thread(target=self._run, args=(app,), name='metrics',
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self, app):
+        interval = app.config['METRICS_FLUSH_INTERVAL_MS'] / 1000
+        while not self._stop.wait(interval):
+            self.flush(app)
+
+    # === Сборка по всем воркерам ===
+
+    def aggregate(self):
+        app = current_app._get_current_object()
+        self.flush(app)
+        directory = app.config['METRICS_DIR']
+        counters, gauges, histograms = {}, {}, {}
+        files = []
+        os.makedirs(directory, exist_ok=True)
+        with _locked(directory):
+            for path in glob.glob(os.path.join(directory, '[0-9]*.json')):
+                data = _load(path)
+                if data is None:
+                    continue
+                if data['pid'] != os.getpid() and not _pid_alive(data['pid']):
+                    self.retire(directory, data['pid'])
+                    continue
+                files.append(data)
+            retired = _load(os.path.join(directory, RETIRED))
+        if retired is not None:
+            retired['gauges'] = []
+            files.append(retired)
+        for data in files:
+            for name, labels, value in data['counters']:
+                key = _key(name, labels)
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in data['gauges']:
+                key = _key(name, labels)
+                gauges[key] = gauges.get(key, 0) + value
+            if data['buckets'] != list(self.buckets):
+                continue
+            for name, labels, buckets, total in data['histograms']:
+                hist = histograms.setdefault(_key(name, labels), [[0] * len(buckets), 0.0])
+                hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+                hist[1] += total
+        return counters, gauges, histograms
+
+    def render(self):
+        counters, gauges, histograms = self.aggregate()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            source = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[kind]
+            series = sorted((labels, value) for (n, labels), value in source.items() if n == name)
+            if not series and kind != 'gauge':
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'gauge' and not series:
+                lines.append(f'{name} 0')
+            for labels, value in series:
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                buckets, total = value
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
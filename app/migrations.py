@@ -0,0 +1,179 @@
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text, select, func, inspect
+
+from models import db, User, VisitLog, PathVisitCount, UserVisitCount
+from db_profile import db_profile
+import rollups
+
+# Версионные миграции схемы.
+# Каждая миграция — (версия, описание, шаг), где шаг — список SQL-команд
+# или функция от соединения. Применённые версии хранятся в schema_migrations;
+# каждая миграция выполняется в своей транзакции вместе с записью о себе,
+# поэтому прерванный upgrade можно просто запустить ещё раз.
+
+
+def _create_missing_tables(conn):
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+def _widen_password_hash(conn):
+    # SQLite длину VARCHAR не соблюдает — менять нечего
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text('ALTER TABLE users ALTER COLUMN password_hash TYPE VARCHAR(255)'))
+
+
+def _visit_logs_fk_set_null(conn):
+    # SQLite внешний ключ не меняет без пересоздания таблицы, а проверка
+    # ключей в нём выключена: журнал обезличивает user_admin.delete_users
+    if conn.dialect.name == 'sqlite':
+        return
+    for fk in inspect(conn).get_foreign_keys('visit_logs'):
+        if fk['referred_table'] == 'users' and fk['name']:
+            conn.execute(text(f'ALTER TABLE visit_logs DROP CONSTRAINT {fk["name"]}'))
+    conn.execute(text(
+        'ALTER TABLE visit_logs ADD CONSTRAINT visit_logs_user_id_fkey '
+        'FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE SET NULL'
+    ))
+
+
+def _create_daily_counts(conn):
+    _create_missing_tables(conn)
+    rollups.rebuild_daily(conn)
+
+
+def _create_hour_detail_counts(conn):
+    _create_missing_tables(conn)
+    rollups.rebuild_hour_detail(conn)
+
+
+MIGRATIONS = [
+    (1, 'Базовая схема: недостающие таблицы', _create_missing_tables),
+    (2, 'Индексы для журнала посещений и ролей пользователей', [
+        'CREATE INDEX IF NOT EXISTS ix_visit_logs_created_at_id '
+        'ON visit_logs (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_visit_logs_user_id_created_at '
+        'ON visit_logs (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_visit_logs_path ON visit_logs (path)',
+        'CREATE INDEX IF NOT EXISTS ix_users_role_id ON users (role_id)',
+    ]),
+    (3, 'Заполнение счётчиков посещений по журналу', rollups.rebuild),
+    (4, 'Таблица счётчика /counter', _create_missing_tables),
+    (5, 'Таблица постов', _create_missing_tables),
+    (6, 'Длина хэша пароля 255 символов', _widen_password_hash),
+    (7, 'Дневные счётчики посещений по страницам и пользователям', _create_daily_counts),
+    (8, 'Почасовые счётчики посещений по страницам и пользователям', _create_hour_detail_counts),
+    (9, 'Скетчи уникальных посетителей и популярных страниц', _create_missing_tables),
+    (10, 'Удаление пользователя обнуляет user_id в журнале посещений', _visit_logs_fk_set_null),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, '
+        'description VARCHAR(200) NOT NULL, '
+        'applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def pending_migrations(engine):
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def upgrade(engine):
+    done = []
+    for version, description, step in pending_migrations(engine):
+        with engine.begin() as conn:
+            if callable(step):
+                step(conn)
+            else:
+                for sql in step:
+                    conn.execute(text(sql))
+            conn.execute(
+                text('INSERT INTO schema_migrations (version, description, applied_at) '
+                     'VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        done.append((version, description))
+    return done
+
+
+# === Планы выполнения основных запросов ===
+
+def hot_queries():
+    return {
+        'журнал (админ)': select(VisitLog)
+            .order_by(VisitLog.created_at.desc(), VisitLog.id.desc()).limit(20),
+        'журнал (пользователь)': select(VisitLog)
+            .where(VisitLog.user_id == 1)
+            .order_by(VisitLog.created_at.desc(), VisitLog.id.desc()).limit(5),
+        'выгрузка за период': select(VisitLog)
+            .where(VisitLog.created_at >= datetime(2025, 1, 1))
+            .order_by(VisitLog.created_at, VisitLog.id),
+        'отчёт по страницам': select(PathVisitCount)
+            .order_by(PathVisitCount.count.desc()),
+        'отчёт по пользователям': select(UserVisitCount, User.name)
+            .outerjoin(User, User.id == UserVisitCount.user_id)
+            .order_by(UserVisitCount.count.desc()),
+        'пересчёт по страницам': select(VisitLog.path, func.count(VisitLog.id))
+            .group_by(VisitLog.path),
+        'пользователи по роли': select(User).where(User.role_id == 1),
+    }
+
+
+def explain(conn, stmt):
+    sql = str(stmt.compile(conn, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    return [row[0] for row in conn.execute(text('EXPLAIN ' + sql))]
+
+
+# === Команды CLI ===
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Применить недостающие миграции схемы."""
+    done = upgrade(db.engine)
+    for version, description in done:
+        click.echo(f'[{version}] {description}')
+    click.echo('Схема актуальна.' if not done else f'Применено миграций: {len(done)}.')
+
+
+@click.command('db-status')
+@with_appcontext
+def db_status_command():
+    """Показать применённые и ожидающие миграции."""
+    with db.engine.begin() as conn:
+        applied = applied_versions(conn)
+    for version, description, _ in MIGRATIONS:
+        mark = 'x' if version in applied else ' '
+        click.echo(f'[{mark}] {version}: {description}')
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as conn:
+            pragmas = db_profile.current(conn)
+        click.echo(f'Профиль {db_profile.name}: ' + ', '.join(f'{k}={v}' for k, v in pragmas.items()))
+
+
+@click.command('explain-queries')
+@with_appcontext
+def explain_queries_command():
+    """Вывести планы выполнения основных запросов."""
+    indexes = {t: [i['name'] for i in inspect(db.engine).get_indexes(t)]
+               for t in ('visit_logs', 'users')}
+    click.echo(f'Индексы: {indexes}')
+    with db.engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            click.echo(f'\n== {name}')
+            for line in explain(conn, stmt):
+                click.echo(f'   {line}')
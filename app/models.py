@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from hashing import password_hasher
 
 db = SQLAlchemy()
 
@@ -18,27 +18,110 @@ class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     login = db.Column(db.String(64), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    # scrypt-хэш длиннее 128 символов; SQLite длину не проверяет, PostgreSQL — да
+    password_hash = db.Column(db.String(255), nullable=False)
     surname = db.Column(db.String(64))
     name = db.Column(db.String(64), nullable=False)
     patronymic = db.Column(db.String(64))
-    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
+    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), index=True)
     role = db.relationship('Role', backref=db.backref('users', lazy=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # хэширование идёт в пуле процессов, см. hashing.py
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.login}>'
 
 class VisitLog(db.Model):
     __tablename__ = 'visit_logs'
+    # те же индексы добавляет миграция 2 для уже существующих баз (migrations.py)
+    __table_args__ = (
+        db.Index('ix_visit_logs_created_at_id', 'created_at', 'id'),
+        db.Index('ix_visit_logs_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_visit_logs_path', 'path'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     path = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    # ON DELETE SET NULL — миграция 10; сам журнал при удалении пользователя
+    # в сессию не грузится (passive_deletes), см. user_admin.py
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    user = db.relationship('User', backref='visit_logs')
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('visit_logs', passive_deletes=True))
+
+
+# === Предагрегированные счётчики посещений (rollups) ===
+# Обновляются вместе с записью журнала (см. rollups.py), отчёты читают только их.
+
+class PathVisitCount(db.Model):
+    __tablename__ = 'visit_counts_by_path'
+    path = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserVisitCount(db.Model):
+    __tablename__ = 'visit_counts_by_user'
+    # 0 — гости: NULL в первичном ключе не годится для upsert
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class HourlyVisitCount(db.Model):
+    __tablename__ = 'visit_counts_by_hour'
+    hour = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class HourlyPathVisitCount(db.Model):
+    # то же по часам для отчёта с фильтром по странице или пользователю;
+    # хранится только за срок хранения журнала (см. retention.py)
+    __tablename__ = 'visit_counts_by_hour_detail'
+    hour = db.Column(db.DateTime, primary_key=True)
+    path = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyVisitCount(db.Model):
+    # посещения за день в разрезе страницы и пользователя (0 — гость);
+    # остаются и после переноса сырых строк в архив (см. retention.py)
+    __tablename__ = 'visit_counts_by_day'
+    day = db.Column(db.Date, primary_key=True)
+    path = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class VisitSketch(db.Model):
+    # сжатые скетчи посещений за день: 'hll' — уникальные посетители,
+    # 'topk' — популярные страницы (см. sketches.py)
+    __tablename__ = 'visit_sketches'
+    day = db.Column(db.Date, primary_key=True)
+    kind = db.Column(db.String(16), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+
+# === Счётчик страницы /counter для вошедших пользователей (см. counters.py) ===
+
+class UserCounter(db.Model):
+    __tablename__ = 'user_counters'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# === Посты: генерируются один раз и хранятся в базе (см. posts_store.py) ===
+
+class Post(db.Model):
+    __tablename__ = 'posts'
+    id = db.Column(db.Integer, primary_key=True)
+    # номер поста в ленте (по убыванию даты), он же индекс в /posts/<index>
+    position = db.Column(db.Integer, unique=True, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    author = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    image_id = db.Column(db.String(64), nullable=False)
+    comments = db.Column(db.JSON, nullable=False, default=list)
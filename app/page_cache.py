@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session, make_response, Response
+from flask_login import current_user
+
+from generation import Generation, instance_key, shared_path
+
+# Кэш отрисованных страниц для редко меняющихся маршрутов (/posts, /about, ...).
+# Ключ — endpoint + аргументы + строка запроса + состояние входа
+# (гость или id пользователя). В памяти — LRU с ограничением по суммарному
+# размеру тел (PAGE_CACHE_MAX_BYTES); при заданном PAGE_CACHE_DIR страницы
+# дополнительно лежат на диске и общие для всех воркеров.
+# Сброс (invalidate) меняет общую метку поколения (generation.py) — файл
+# PAGE_CACHE_GENERATION_PATH, по умолчанию в PAGE_CACHE_DIR или в /dev/shm
+# (с ключом развёртывания в имени, см. generation.instance_key).
+# Страницы прежнего поколения перестают отдаваться во всех воркерах, даже
+# когда тела лежат только в памяти каждого из них.
+# Каждый ответ получает ETag, повторный запрос с If-None-Match — 304.
+# Страницы с flash-сообщениями не кэшируются: сообщение показывается один раз.
+
+
+class Entry:
+    __slots__ = ('body', 'mimetype', 'etag', 'expires', 'generation')
+
+    def __init__(self, body, mimetype, etag, expires, generation):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.expires = expires
+        self.generation = generation
+
+
+class MemoryBackend:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._data[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+class DiskBackend:
+    # файл на страницу: строка JSON с метаданными, затем тело
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._file(key), 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return Entry(body, meta['mimetype'], meta['etag'], meta['expires'], meta['generation'])
+
+    def set(self, key, entry):
+        meta = {'mimetype': entry.mimetype, 'etag': entry.etag,
+                'expires': entry.expires, 'generation': entry.generation}
+        self._write(self._file(key), json.dumps(meta).encode() + b'\n' + entry.body)
+
+    def _write(self, target, data):
+        # запись через временный файл и rename — читатель не увидит половину
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+
+class PageStore:
+    # страницы одного приложения (app.extensions['page_cache'])
+
+    def __init__(self, app):
+        self.memory = MemoryBackend(app.config['PAGE_CACHE_MAX_BYTES'])
+        self.disk = DiskBackend(app.config['PAGE_CACHE_DIR']) if app.config['PAGE_CACHE_DIR'] else None
+        self._generation = Generation(app.config['PAGE_CACHE_GENERATION_PATH'])
+        self.logger = app.logger
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.memory.clear()
+        try:
+            self._generation.bump()
+        except OSError:
+            self.logger.exception('Не удалось сменить поколение кэша страниц')
+
+    def generation(self):
+        return self._generation.read()
+
+    def get(self, key):
+        generation = self.generation()
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None and (entry.expires < now or entry.generation != generation):
+            self.memory.delete(key)
+            entry = None
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None and (entry.expires < now or entry.generation != generation):
+                entry = None
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, entry)
+            except OSError:
+                self.logger.exception('Не удалось записать страницу в дисковый кэш')
+
+
+class PageCache:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+        app.config.setdefault('PAGE_CACHE_DIR', None)
+        app.config.setdefault('PAGE_CACHE_GENERATION_PATH', (
+            os.path.join(app.config['PAGE_CACHE_DIR'], 'GENERATION') if app.config['PAGE_CACHE_DIR']
+            else shared_path(f'web4sem-pages-{instance_key(app)}.gen')
+        ))
+        app.extensions['page_cache'] = PageStore(app)
+
+    def cached(self, f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if (not current_app.config['PAGE_CACHE_ENABLED'] or request.method != 'GET'
+                    or '_flashes' in session):
+                return f(*args, **kwargs)
+            store = current_app.extensions['page_cache']
+            key = self._key()
+            entry = store.get(key)
+            if entry is not None:
+                store.hits += 1
+                resp = Response(entry.body, mimetype=entry.mimetype)
+                return self._conditional(resp, entry.etag)
+            store.misses += 1
+            # поколение — до отрисовки: сброс во время неё не оставит старую страницу
+            generation = store.generation()
+            resp = make_response(f(*args, **kwargs))
+            # то, что отрисовалось с flash-сообщением, в кэш не кладём
+            if resp.status_code != 200 or resp.is_streamed or '_flashes' in session:
+                return resp
+            body = resp.get_data()
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            store.set(key, Entry(body, resp.mimetype, etag,
+                                 time.time() + current_app.config['PAGE_CACHE_TTL'],
+                                 generation))
+            return self._conditional(resp, etag)
+        return wrapper
+
+    def invalidate(self):
+        current_app.extensions['page_cache'].invalidate()
+
+    @staticmethod
+    def _key():
+        auth = f'user:{current_user.id}' if current_user.is_authenticated else 'anon'
+        args = sorted(request.view_args.items()) if request.view_args else []
+        return f'{request.endpoint}|{args}|{request.query_string.decode()}|{auth}'
+
+    @staticmethod
+    def _conditional(resp, etag):
+        resp.set_etag(etag)
+        # браузер хранит страницу, но каждый раз сверяет ETag
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.vary.add('Cookie')
+        return resp.make_conditional(request)
+
+
+page_cache = PageCache()
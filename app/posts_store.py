@@ -0,0 +1,119 @@
+import random
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Post
+from page_cache import page_cache
+
+# Хранилище постов.
+# Посты генерируются Faker-ом детерминированно (POSTS_SEED) один раз и
+# сохраняются в таблицу posts (init-db или generate-posts) — все воркеры
+# показывают одно и то же и не платят за генерацию на первом запросе.
+# Лента читает только нужные ей колонки, отдельный пост достаётся по номеру
+# одним запросом. В памяти воркера посты не запоминаются: готовые страницы
+# держит page_cache, а его сброс после generate-posts виден всем воркерам.
+
+images_ids = [
+    '7d4e9175-95ea-4c5f-8be5-92a6b708bb3c',
+    '2d2ab7df-cdbc-48a8-a936-35bba702def5',
+    '6e12f3de-d5fd-4ebb-855b-8cbc485278b7',
+    'afc2cfe7-5cac-4b80-9b9a-d5c65ef0c728',
+    'cab5b7f2-774e-4884-a200-0c0180fa777f'
+]
+
+# в ленте текст всё равно обрезается до 100 символов
+PREVIEW_LENGTH = 200
+
+
+def generate_posts(seed):
+    # Faker тяжёлый при импорте — грузим только когда реально генерируем
+    from faker import Faker
+    fake = Faker()
+    fake.seed_instance(seed)
+    rnd = random.Random(seed)
+
+    def generate_comments(replies=True):
+        comments = []
+        for _ in range(rnd.randint(1, 3)):
+            c = {'author': fake.name(), 'text': fake.text()}
+            if replies:
+                c['replies'] = generate_comments(False)
+            comments.append(c)
+        return comments
+
+    posts = [{
+        'title': fake.sentence(),
+        'text': fake.paragraph(nb_sentences=100),
+        'author': fake.name(),
+        'date': fake.date_time_between(datetime(2023, 1, 1), datetime(2025, 1, 1)),
+        'image_id': f'{image_id}.jpg',
+        'comments': generate_comments()
+    } for image_id in images_ids]
+    posts.sort(key=lambda p: p['date'], reverse=True)
+    for position, post in enumerate(posts):
+        post['position'] = position
+    return posts
+
+
+def store_posts(posts):
+    db.session.execute(Post.__table__.delete())
+    db.session.execute(Post.__table__.insert(), posts)
+    db.session.commit()
+    page_cache.invalidate()
+
+
+def ensure_posts():
+    # True, если посты пришлось сгенерировать; если параллельно это сделал
+    # другой воркер, вставка упрётся в unique(position)
+    if db.session.execute(select(func.count(Post.id))).scalar():
+        return False
+    try:
+        db.session.execute(Post.__table__.insert(),
+                           generate_posts(current_app.config['POSTS_SEED']))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+    return True
+
+
+def list_posts():
+    query = (
+        select(Post.position, Post.title, func.substr(Post.text, 1, PREVIEW_LENGTH),
+               Post.author, Post.date, Post.image_id)
+        .order_by(Post.position)
+    )
+    rows = db.session.execute(query).all()
+    # база без init-db: генерируем посты при первом обращении
+    if not rows and ensure_posts():
+        rows = db.session.execute(query).all()
+    return [
+        {'position': position, 'title': title, 'text': text,
+         'author': author, 'date': date, 'image_id': image_id}
+        for position, title, text, author, date, image_id in rows
+    ]
+
+
+def get_post(index):
+    query = select(Post).where(Post.position == index)
+    post = db.session.execute(query).scalar_one_or_none()
+    if post is None and ensure_posts():
+        post = db.session.execute(query).scalar_one_or_none()
+    if post is None:
+        return None
+    return {'title': post.title, 'text': post.text, 'author': post.author,
+            'date': post.date, 'image_id': post.image_id, 'comments': post.comments}
+
+
+@click.command('generate-posts')
+@click.option('--seed', type=int, default=None, help='Зерно генератора (по умолчанию POSTS_SEED).')
+@with_appcontext
+def generate_posts_command(seed):
+    """Сгенерировать посты и сохранить их в базу (старые заменяются)."""
+    seed = current_app.config['POSTS_SEED'] if seed is None else seed
+    store_posts(generate_posts(seed))
+    click.echo(f'Сгенерировано постов: {len(images_ids)} (seed={seed}).')
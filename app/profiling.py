@@ -0,0 +1,213 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+from models import db
+
+# Профилирование запросов (выключено по умолчанию, PROFILING_ENABLED).
+# На каждый запрос считаются SQL-запросы, время в базе, время отрисовки
+# шаблонов и полное время обработки; итоги копятся по endpoint (stats())
+# и отдаются клиенту заголовком Server-Timing.
+# Запросы дольше PROFILING_SLOW_MS пишутся в журнал медленных запросов
+# (логгер web4sem.slow, файл PROFILING_SLOW_LOG) вместе с SQL — повторы
+# одного и того же запроса там сразу видны как N+1.
+# Для endpoint из PROFILING_CPROFILE_ENDPOINTS доля PROFILING_CPROFILE_RATE
+# запросов снимается cProfile в PROFILING_CPROFILE_DIR (.prof, смотреть
+# `python -m pstats` или snakeviz).
+# SQL считается только в потоке запроса: фоновые writer'ы журнала и
+# счётчиков работают без контекста запроса и сюда не попадают.
+
+slow_log = logging.getLogger('web4sem.slow')
+
+# сколько SQL-команд запроса сохранять в журнале медленных
+MAX_STATEMENTS = 50
+
+
+def _add_slow_log_file(path):
+    # один обработчик на файл, сколько бы приложений ни создавалось
+    path = os.path.abspath(path)
+    if any(getattr(h, 'baseFilename', None) == path for h in slow_log.handlers):
+        return
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_log.addHandler(handler)
+    slow_log.setLevel(logging.INFO)
+
+
+class EndpointStats:
+    # итоги одного приложения (app.extensions['profiler'])
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, wall, db_ms, template_ms, queries):
+        with self._lock:
+            s = self._stats.setdefault(endpoint, {
+                'requests': 0, 'wall_ms': 0.0, 'db_ms': 0.0,
+                'template_ms': 0.0, 'queries': 0, 'max_ms': 0.0,
+            })
+            s['requests'] += 1
+            s['wall_ms'] += wall
+            s['db_ms'] += db_ms
+            s['template_ms'] += template_ms
+            s['queries'] += queries
+            s['max_ms'] = max(s['max_ms'], wall)
+
+    def stats(self):
+        # {endpoint: {requests, wall_ms, db_ms, template_ms, queries, max_ms}} — суммы
+        with self._lock:
+            return {endpoint: dict(s) for endpoint, s in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class RequestProfiler:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILING_ENABLED', False)
+        app.config.setdefault('PROFILING_SLOW_MS', 500)
+        app.config.setdefault('PROFILING_SLOW_LOG', None)
+        app.config.setdefault('PROFILING_CPROFILE_ENDPOINTS', ())
+        app.config.setdefault('PROFILING_CPROFILE_RATE', 0.01)
+        app.config.setdefault('PROFILING_CPROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+        app.extensions['profiler'] = EndpointStats()
+        if app.config['PROFILING_SLOW_LOG']:
+            _add_slow_log_file(app.config['PROFILING_SLOW_LOG'])
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        # после db.init_app: считаем SQL только движка этого приложения
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._query_started)
+        event.listen(engine, 'after_cursor_execute', self._query_finished)
+
+    # === Итоги по endpoint ===
+
+    def stats(self):
+        return current_app.extensions['profiler'].stats()
+
+    def reset(self):
+        current_app.extensions['profiler'].reset()
+
+    # === Хуки запроса ===
+
+    def _start(self):
+        cfg = current_app.config
+        if not cfg['PROFILING_ENABLED'] or request.endpoint in (None, 'static', 'image_variant'):
+            return
+        g.profile = {
+            'started': time.perf_counter(),
+            'queries': 0,
+            'db': 0.0,
+            'template': 0.0,
+            'statements': [],
+            'repeats': Counter(),
+            'cprofile': None,
+        }
+        if (request.endpoint in cfg['PROFILING_CPROFILE_ENDPOINTS']
+                and random.random() < cfg['PROFILING_CPROFILE_RATE']):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # в этом потоке уже работает другой профилировщик
+                return
+            g.profile['cprofile'] = profile
+
+    def _finish(self, response):
+        state = g.pop('profile', None)
+        if state is None:
+            return response
+        wall = (time.perf_counter() - state['started']) * 1000
+        db_ms = state['db'] * 1000
+        template_ms = state['template'] * 1000
+        if state['cprofile'] is not None:
+            state['cprofile'].disable()
+            self._dump_cprofile(state['cprofile'])
+
+        current_app.extensions['profiler'].add(
+            request.endpoint, wall, db_ms, template_ms, state['queries'])
+
+        response.headers['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{state["queries"]} queries", '
+            f'tpl;dur={template_ms:.1f}, total;dur={wall:.1f}'
+        )
+        if wall >= current_app.config['PROFILING_SLOW_MS']:
+            slow_log.warning(json.dumps({
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'status': response.status_code,
+                'wall_ms': round(wall, 1),
+                'db_ms': round(db_ms, 1),
+                'template_ms': round(template_ms, 1),
+                'queries': state['queries'],
+                # одинаковый SQL больше одного раза за запрос — кандидат в N+1
+                'repeated': {sql: n for sql, n in state['repeats'].most_common(5) if n > 1},
+                'statements': state['statements'],
+            }, ensure_ascii=False))
+        return response
+
+    def _dump_cprofile(self, profile):
+        directory = current_app.config['PROFILING_CPROFILE_DIR']
+        try:
+            os.makedirs(directory, exist_ok=True)
+            name = f'{request.endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.prof'
+            profile.dump_stats(os.path.join(directory, name))
+        except OSError:
+            current_app.logger.exception('Не удалось сохранить профиль запроса')
+
+    # === Шаблоны и SQL ===
+
+    @staticmethod
+    def _state():
+        return g.get('profile') if has_request_context() else None
+
+    def _template_started(self, sender, template, context, **extra):
+        state = self._state()
+        if state is not None:
+            state.setdefault('template_stack', []).append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        state = self._state()
+        if state is not None and state.get('template_stack'):
+            started = state['template_stack'].pop()
+            # вложенные render_template не считаем дважды
+            if not state['template_stack']:
+                state['template'] += time.perf_counter() - started
+
+    def _query_started(self, conn, cursor, statement, parameters, context, executemany):
+        state = self._state()
+        if state is not None:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def _query_finished(self, conn, cursor, statement, parameters, context, executemany):
+        state = self._state()
+        if state is None or not conn.info.get('profile_started'):
+            return
+        elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+        state['queries'] += 1
+        state['db'] += elapsed
+        state['repeats'][statement] += 1
+        if len(state['statements']) < MAX_STATEMENTS:
+            state['statements'].append({'ms': round(elapsed * 1000, 2), 'sql': statement})
+
+
+profiler = RequestProfiler()
@@ -0,0 +1,164 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import (
+    MetaData, Table, Column, Index, Integer, String, DateTime,
+    select, union_all, inspect, func
+)
+
+from models import db, VisitLog, HourlyPathVisitCount
+
+# Срок хранения журнала посещений.
+# Строки старше VISIT_LOG_RETENTION_DAYS переносятся из visit_logs в помесячные
+# архивные таблицы visit_logs_archive_ГГГГММ — рабочая таблица и её индексы
+# остаются маленькими. Счётчики (в том числе дневные visit_counts_by_day)
+# ведутся при записи журнала, поэтому перенос их не трогает; пересчёт
+# rebuild-rollups и выгрузка /visit_logs/export читают и архив.
+# Почасовая детализация по страницам (visit_counts_by_hour_detail) живёт
+# столько же, сколько сырой журнал, и удаляется тем же заданием по суткам.
+# Перенос идёт пачками по VISIT_LOG_ARCHIVE_BATCH строк, каждая — в своей
+# короткой транзакции с паузой между ними, чтобы не держать блокировку.
+# Запуск по расписанию: `flask --app app archive-visit-logs` из cron.
+
+ARCHIVE_PREFIX = 'visit_logs_archive_'
+
+archive_metadata = MetaData()
+
+
+def archive_table(month):
+    # month — 'ГГГГММ'
+    name = ARCHIVE_PREFIX + month
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+    return Table(
+        name, archive_metadata,
+        # без внешнего ключа: пользователя могут удалить, а архив остаётся
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('path', String(100), nullable=False),
+        Column('user_id', Integer, nullable=True),
+        Column('created_at', DateTime, nullable=False),
+        Index(f'ix_{name}_created_at_id', 'created_at', 'id'),
+    )
+
+
+def archive_months(conn):
+    names = inspect(conn).get_table_names()
+    return sorted(n[len(ARCHIVE_PREFIX):] for n in names if n.startswith(ARCHIVE_PREFIX))
+
+
+def month_bounds(month):
+    start = datetime.strptime(month, '%Y%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def log_sources(conn, date_from=None, date_to=None):
+    # рабочая таблица и те архивные месяцы, что пересекаются с периодом
+    # [date_from, date_to); архивные таблицы за другие месяцы не читаются
+    tables = [VisitLog.__table__]
+    for month in archive_months(conn):
+        start, end = month_bounds(month)
+        if (date_from is None or end > date_from) and (date_to is None or start < date_to):
+            tables.append(archive_table(month))
+    return tables
+
+
+def all_visit_logs(conn, date_from=None, date_to=None):
+    # подзапрос (id, created_at, path, user_id) по журналу вместе с архивом
+    parts = []
+    for table in log_sources(conn, date_from, date_to):
+        part = select(table.c.id, table.c.created_at, table.c.path, table.c.user_id)
+        if date_from is not None:
+            part = part.where(table.c.created_at >= date_from)
+        if date_to is not None:
+            part = part.where(table.c.created_at < date_to)
+        parts.append(part)
+    if len(parts) == 1:
+        return parts[0].subquery('logs')
+    return union_all(*parts).subquery('logs')
+
+
+def retention_cutoff(days, now=None):
+    # граница по началу суток: день целиком либо в журнале, либо в архиве
+    now = now or datetime.utcnow()
+    return now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+
+def archive_batch(conn, cutoff, limit):
+    logs = VisitLog.__table__
+    rows = conn.execute(
+        select(logs.c.id, logs.c.path, logs.c.user_id, logs.c.created_at)
+        .where(logs.c.created_at < cutoff)
+        .order_by(logs.c.created_at, logs.c.id)
+        .limit(limit)
+    ).mappings().all()
+    if not rows:
+        return 0
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row['created_at'].strftime('%Y%m')].append(dict(row))
+    for month, items in by_month.items():
+        table = archive_table(month)
+        table.create(conn, checkfirst=True)
+        conn.execute(table.insert(), items)
+    conn.execute(logs.delete().where(logs.c.id.in_([row['id'] for row in rows])))
+    return len(rows)
+
+
+def archive_old_logs(engine, cutoff, batch_size, pause=0.0, max_batches=None):
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            count = archive_batch(conn, cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def prune_hourly_detail(engine, cutoff, pause=0.0):
+    # по одним суткам за транзакцию
+    table = HourlyPathVisitCount.__table__
+    removed = 0
+    while True:
+        with engine.begin() as conn:
+            first = conn.execute(
+                select(func.min(table.c.hour)).where(table.c.hour < cutoff)
+            ).scalar()
+            if first is None:
+                break
+            day_end = min(first.replace(hour=0) + timedelta(days=1), cutoff)
+            removed += conn.execute(
+                table.delete().where(table.c.hour < day_end)
+            ).rowcount
+        if pause:
+            time.sleep(pause)
+    return removed
+
+
+@click.command('archive-visit-logs')
+@click.option('--days', type=int, default=None, help='Срок хранения в днях (по умолчанию VISIT_LOG_RETENTION_DAYS).')
+@click.option('--batch', type=int, default=None, help='Строк за одну транзакцию.')
+@click.option('--max-batches', type=int, default=None, help='Остановиться после N пачек.')
+@with_appcontext
+def archive_visit_logs_command(days, batch, max_batches):
+    """Перенести старые записи журнала посещений в помесячные архивные таблицы."""
+    cfg = current_app.config
+    days = cfg['VISIT_LOG_RETENTION_DAYS'] if days is None else days
+    cutoff = retention_cutoff(days)
+    moved = archive_old_logs(
+        db.engine, cutoff,
+        batch or cfg['VISIT_LOG_ARCHIVE_BATCH'],
+        cfg['VISIT_LOG_ARCHIVE_PAUSE_MS'] / 1000,
+        max_batches,
+    )
+    pruned = prune_hourly_detail(db.engine, cutoff, cfg['VISIT_LOG_ARCHIVE_PAUSE_MS'] / 1000)
+    click.echo(f'Перенесено в архив записей: {moved} (старше {cutoff:%Y-%m-%d}), '
+               f'удалено почасовых счётчиков: {pruned}.')
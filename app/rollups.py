@@ -0,0 +1,151 @@
+from collections import Counter
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select, cast, Date
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import (
+    db, VisitLog, PathVisitCount, UserVisitCount, HourlyVisitCount,
+    HourlyPathVisitCount, DailyVisitCount
+)
+from retention import all_visit_logs
+
+# Инкрементальные счётчики посещений по странице, пользователю, часу и дню.
+# apply_visits вызывается в той же транзакции, что и вставка журнала,
+# rebuild пересчитывает всё с нуля по сырым строкам журнала вместе с архивом.
+
+GUEST_ID = 0
+
+
+def hour_bucket(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(dt):
+    return dt.date()
+
+
+def hour_bucket_expr(column, dialect):
+    if dialect == 'postgresql':
+        return func.date_trunc('hour', column)
+    # в SQLite DateTime хранится строкой — формат должен совпадать с тем,
+    # что пишет SQLAlchemy, иначе ключи в первичном ключе разойдутся
+    return func.strftime('%Y-%m-%d %H:00:00.000000', column)
+
+
+def day_bucket_expr(column, dialect):
+    if dialect == 'postgresql':
+        return cast(column, Date)
+    # date() даёт 'ГГГГ-ММ-ДД' — ровно так SQLAlchemy хранит Date в SQLite
+    return func.date(column)
+
+
+# INSERT ... ON CONFLICT у SQLite и PostgreSQL устроен одинаково
+UPSERT_INSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+
+def apply_visits(conn, records):
+    increment_counts(conn, PathVisitCount.__table__, 'path',
+                     Counter(r['path'] for r in records))
+    increment_counts(conn, UserVisitCount.__table__, 'user_id',
+                     Counter(r['user_id'] or GUEST_ID for r in records))
+    increment_counts(conn, HourlyVisitCount.__table__, 'hour',
+                     Counter(hour_bucket(r['created_at']) for r in records))
+    increment_counts(conn, HourlyPathVisitCount.__table__, ('hour', 'path', 'user_id'),
+                     Counter((hour_bucket(r['created_at']), r['path'], r['user_id'] or GUEST_ID)
+                             for r in records))
+    increment_counts(conn, DailyVisitCount.__table__, ('day', 'path', 'user_id'),
+                     Counter((day_bucket(r['created_at']), r['path'], r['user_id'] or GUEST_ID)
+                             for r in records))
+
+
+def increment_counts(conn, table, key, counts):
+    # upsert: count = count + приращение; counts — {значение ключа: приращение},
+    # для составного ключа key — кортеж колонок, ключи counts — кортежи значений
+    if not counts:
+        return
+    keys = (key,) if isinstance(key, str) else key
+    values = [
+        dict(zip(keys, k if len(keys) > 1 else (k,)), count=c)
+        for k, c in sorted(counts.items())
+    ]
+    try:
+        dialect_insert = UPSERT_INSERTS[conn.dialect.name]
+    except KeyError:
+        raise NotImplementedError(f'upsert не поддержан для {conn.dialect.name}')
+    # фиксированный порядок ключей: параллельные транзакции берут
+    # блокировки строк в одном порядке и не упираются друг в друга
+    stmt = dialect_insert(table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={'count': table.c.count + stmt.excluded['count']}
+    )
+    conn.execute(stmt)
+
+
+def rebuild(conn):
+    for model in (PathVisitCount, UserVisitCount, HourlyVisitCount,
+                  HourlyPathVisitCount, DailyVisitCount):
+        conn.execute(model.__table__.delete())
+
+    logs = all_visit_logs(conn)
+    dialect = conn.dialect.name
+    conn.execute(insert(PathVisitCount).from_select(
+        ['path', 'count'],
+        select(logs.c.path, func.count()).group_by(logs.c.path)
+    ))
+    user_key = func.coalesce(logs.c.user_id, GUEST_ID)
+    conn.execute(insert(UserVisitCount).from_select(
+        ['user_id', 'count'],
+        select(user_key, func.count()).group_by(user_key)
+    ))
+    hour = hour_bucket_expr(logs.c.created_at, dialect)
+    conn.execute(insert(HourlyVisitCount).from_select(
+        ['hour', 'count'],
+        select(hour, func.count()).group_by(hour)
+    ))
+    _fill_daily(conn, logs)
+    _fill_hour_detail(conn)
+
+
+def rebuild_daily(conn):
+    # только дневные счётчики — для миграции, которая их добавила
+    conn.execute(DailyVisitCount.__table__.delete())
+    _fill_daily(conn, all_visit_logs(conn))
+
+
+def rebuild_hour_detail(conn):
+    # только почасовая детализация — для миграции, которая её добавила
+    conn.execute(HourlyPathVisitCount.__table__.delete())
+    _fill_hour_detail(conn)
+
+
+def _fill_daily(conn, logs):
+    day = day_bucket_expr(logs.c.created_at, conn.dialect.name)
+    user_key = func.coalesce(logs.c.user_id, GUEST_ID)
+    conn.execute(insert(DailyVisitCount).from_select(
+        ['day', 'path', 'user_id', 'count'],
+        select(day, logs.c.path, user_key, func.count()).group_by(day, logs.c.path, user_key)
+    ))
+
+
+def _fill_hour_detail(conn):
+    # почасовая детализация — только по рабочей таблице, архив в неё не входит
+    live_hour = hour_bucket_expr(VisitLog.created_at, conn.dialect.name)
+    live_user = func.coalesce(VisitLog.user_id, GUEST_ID)
+    conn.execute(insert(HourlyPathVisitCount).from_select(
+        ['hour', 'path', 'user_id', 'count'],
+        select(live_hour, VisitLog.path, live_user, func.count())
+        .group_by(live_hour, VisitLog.path, live_user)
+    ))
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Пересчитать счётчики посещений по журналу visit_logs."""
+    with db.engine.begin() as conn:
+        rebuild(conn)
+    click.echo('Счётчики посещений пересчитаны.')
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import math
+import zlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from models import VisitSketch
+from rollups import UPSERT_INSERTS
+
+# Приближённая аналитика посещений по дням.
+# - HyperLogLog (2^12 регистров, погрешность ~1.6%) — число уникальных
+#   посетителей; посетитель — id пользователя, для гостей пара IP и
+#   User-Agent (в базу попадают только регистры от их хэша).
+# - Space-Saving на TOPK_CAPACITY счётчиков — самые посещаемые страницы.
+# Оба скетча сливаются: день с днём, воркер с воркером. В базе
+# (visit_sketches) — сжатый скетч на пару (день, вид); writer журнала
+# сливает в него каждую пачку под блокировкой строки, так что
+# несколько воркеров не затирают друг друга. Отчёт за месяцы — слияние
+# нескольких десятков небольших скетчей вместо COUNT(DISTINCT) по журналу.
+# По сырому журналу скетчи не пересчитываются: в нём нет ключа гостя.
+
+HLL_P = 12
+HLL_M = 1 << HLL_P
+TOPK_CAPACITY = 200
+
+
+class HyperLogLog:
+    kind = 'hll'
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers else bytearray(HLL_M)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - HLL_P)
+        rest = h & ((1 << (64 - HLL_P)) - 1)
+        rank = (64 - HLL_P) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / HLL_M)
+        estimate = alpha * HLL_M * HLL_M / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # на малых множествах точнее линейный подсчёт по пустым регистрам
+        if estimate <= 2.5 * HLL_M and zeros:
+            estimate = HLL_M * math.log(HLL_M / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        # почти пустые регистры малопосещаемого дня сжимаются до десятков байт
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(zlib.decompress(data))
+
+
+class SpaceSaving:
+    kind = 'topk'
+
+    def __init__(self, counters=None, capacity=TOPK_CAPACITY):
+        self.capacity = capacity
+        # ключ -> [счётчик, максимальная переоценка]
+        self.counters = {k: list(v) for k, v in (counters or {}).items()}
+
+    def add(self, key, n=1):
+        counters = self.counters
+        if key in counters:
+            counters[key][0] += n
+        elif len(counters) < self.capacity:
+            counters[key] = [n, 0]
+        else:
+            # вытесняется самый редкий, новый ключ наследует его счётчик
+            victim = min(counters, key=lambda k: counters[k][0])
+            floor = counters.pop(victim)[0]
+            counters[key] = [floor + n, floor]
+
+    def merge(self, other):
+        # слияние по правилу mergeable summaries: ключа, которого нет
+        # в заполненном скетче, там могло быть не больше его минимума —
+        # он прибавляется и к счётчику, и к переоценке
+        own_floor, other_floor = self._floor(), other._floor()
+        counters = {}
+        for key in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(key, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(key, (other_floor, other_floor))
+            counters[key] = [count + other_count, error + other_error]
+        if len(counters) > self.capacity:
+            # вытесненные ключи не больше (k+1)-го счётчика, а он не больше
+            # минимума оставшихся: у заполненного скетча этот минимум и есть
+            # переоценка любого отсутствующего ключа
+            keep = sorted(counters.items(), key=lambda kv: (-kv[1][0], kv[0]))
+            counters = dict(keep[:self.capacity])
+        self.counters = counters
+        return self
+
+    def _floor(self):
+        # верхняя граница счётчика ключа, которого в скетче нет
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def top(self, k):
+        # [(ключ, оценка, переоценка не больше)]
+        ranked = sorted(self.counters.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return [(key, count, error) for key, (count, error) in ranked[:k]]
+
+    def to_bytes(self):
+        return zlib.compress(json.dumps(self.counters, separators=(',', ':')).encode())
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(json.loads(zlib.decompress(data)))
+
+
+SKETCHES = {cls.kind: cls for cls in (HyperLogLog, SpaceSaving)}
+
+
+def visitor_key(user_id, remote_addr, user_agent):
+    if user_id is not None:
+        return f'u:{user_id}'
+    return f'g:{remote_addr}|{user_agent}'
+
+
+def _merge_stored(conn, day, sketch):
+    table = VisitSketch.__table__
+    # строка дня создаётся один раз, дальше её сериализует блокировка
+    # (FOR UPDATE в PostgreSQL, блокировка записи всей базы в SQLite)
+    conn.execute(
+        UPSERT_INSERTS[conn.dialect.name](table)
+        .values(day=day, kind=sketch.kind, data=type(sketch)().to_bytes())
+        .on_conflict_do_nothing(index_elements=['day', 'kind'])
+    )
+    data = conn.execute(
+        select(table.c.data)
+        .where(table.c.day == day, table.c.kind == sketch.kind)
+        .with_for_update()
+    ).scalar_one()
+    combined = SKETCHES[sketch.kind].from_bytes(data).merge(sketch)
+    conn.execute(
+        table.update()
+        .where(table.c.day == day, table.c.kind == sketch.kind)
+        .values(data=combined.to_bytes())
+    )
+
+
+def apply_sketches(conn, records):
+    # вызывается в транзакции записи пачки журнала
+    by_day = defaultdict(list)
+    for r in records:
+        by_day[r['created_at'].date()].append(r)
+    for day, items in sorted(by_day.items()):
+        visitors = HyperLogLog()
+        for r in items:
+            if r.get('visitor'):
+                visitors.add(r['visitor'])
+        paths = SpaceSaving()
+        for path, n in Counter(r['path'] for r in items).items():
+            paths.add(path, n)
+        _merge_stored(conn, day, visitors)
+        _merge_stored(conn, day, paths)
+
+
+def load_daily(conn, kind, day_from, day_to):
+    # {день: скетч} за [day_from, day_to]
+    table = VisitSketch.__table__
+    rows = conn.execute(
+        select(table.c.day, table.c.data)
+        .where(table.c.kind == kind, table.c.day >= day_from, table.c.day <= day_to)
+    )
+    return {day: SKETCHES[kind].from_bytes(data) for day, data in rows}
+
+
+def merged(sketches, kind):
+    result = SKETCHES[kind]()
+    for sketch in sketches:
+        result.merge(sketch)
+    return result
+
+
+def days(day_from, day_to):
+    day = day_from
+    while day <= day_to:
+        yield day
+        day += timedelta(days=1)
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+import click
+from flask import request, send_file, url_for, abort, current_app
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+# Раздача статики вместо стандартного endpoint 'static'.
+# - Картинки постов названы по UUID и не меняются, а ссылки из asset_url()
+#   содержат отпечаток содержимого (?v=...) — такие ответы кэшируются
+#   браузером на год с immutable; остальное — no-cache с проверкой ETag.
+# - send_file даёт строгий ETag, If-None-Match/If-Modified-Since и Range;
+#   файл отдаётся через wsgi.file_wrapper (под gunicorn — sendfile без
+#   копирования в Python), а при USE_X_SENDFILE — отдаётся фронтенд-серверу.
+# - Если рядом лежит заранее сжатый вариант (styles.css.br / .gz), не старше
+#   исходника, и клиент его принимает, отдаётся он (см. `flask compress-static`).
+
+UUID_NAME = re.compile(r'(^|/)[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}[^/]*$')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.html')
+
+
+class StaticAssets:
+
+    def __init__(self, app=None):
+        self._fingerprints = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # app создаётся с static_folder=None, маршрут /static регистрируем сами
+        app.config.setdefault('STATIC_DIR', os.path.join(app.root_path, 'static'))
+        app.config.setdefault('STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 3600)
+        app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+        app.extensions['static_assets'] = self
+
+    def path(self, filename):
+        return safe_join(current_app.config['STATIC_DIR'], filename)
+
+    def fingerprint(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._fingerprints.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.blake2b(f.read(), digest_size=4).hexdigest()
+        self._fingerprints[path] = (mtime, digest)
+        return digest
+
+    def url(self, filename):
+        # ссылка с отпечатком: после изменения файла меняется и адрес
+        return url_for('static', filename=filename, v=self.fingerprint(self.path(filename)))
+
+    def is_immutable(self, filename, path):
+        if UUID_NAME.search(filename):
+            return True
+        version = request.args.get('v')
+        return version is not None and version == self.fingerprint(path)
+
+    @staticmethod
+    def _fresh(variant, source):
+        # сжатая копия старше исходника — отпечаток (по исходнику) ей не соответствует
+        try:
+            return os.stat(variant).st_mtime_ns >= os.stat(source).st_mtime_ns
+        except OSError:
+            return False
+
+    def serve(self, filename):
+        return self.send(self.path(filename), filename)
+
+    def send(self, path, filename):
+        # path — уже проверенный safe_join путь (None — вне каталога)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        served, encoding = path, None
+        variants = [(name, path + suffix) for name, suffix in PRECOMPRESSED
+                    if self._fresh(path + suffix, path)]
+        for name, variant in variants:
+            if request.accept_encodings[name]:
+                served, encoding = variant, name
+                break
+
+        immutable = self.is_immutable(filename, path)
+        resp = send_file(
+            served,
+            mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            conditional=True,
+            etag=True,
+            max_age=current_app.config['STATIC_IMMUTABLE_MAX_AGE'] if immutable else 0,
+        )
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        if variants:
+            resp.vary.add('Accept-Encoding')
+        if immutable:
+            resp.cache_control.public = True
+            resp.cache_control.immutable = True
+        else:
+            resp.cache_control.no_cache = True
+        return resp
+
+
+static_assets = StaticAssets()
+
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static_command():
+    """Создать сжатые .gz (и .br, если есть brotli) копии текстовой статики."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    count = 0
+    for root, _, files in os.walk(current_app.config['STATIC_DIR']):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data))
+            count += 1
+    click.echo(f'Сжато файлов: {count}.')
@@ -9,17 +9,55 @@ from datetime import datetime
 import pytest
 from flask import template_rendered
 from contextlib import contextmanager
-from app import app as application
+from sqlalchemy import create_engine, inspect, text
+from app import create_app
+from models import db, Role, User
+
+
+@pytest.fixture(scope='session')
+def application(tmp_path_factory):
+    # база, метрики и метки кэшей — во временном каталоге: тесты не трогают
+    # app.db из репозитория и не оставляют файлов в /dev/shm
+    directory = tmp_path_factory.mktemp('app')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory / "app.db"}',
+        'METRICS_DIR': str(directory / 'metrics'),
+        'IDENTITY_CACHE_GENERATION_PATH': str(directory / 'identity.gen'),
+        'PAGE_CACHE_GENERATION_PATH': str(directory / 'pages.gen'),
+    })
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    yield app
+    app.extensions['visit_log_writer'].close()
+    with app.app_context():
+        db.engine.dispose()
 
 
 @pytest.fixture
-def app():
+def app(application):
     return application
 
 @pytest.fixture
 def client(app):
     return app.test_client()
 
+@pytest.fixture
+def admin_client(app):
+    # клиент, вошедший под администратором (сессия, без формы входа)
+    with app.app_context():
+        admin = User.query.filter_by(login='testadmin1').first()
+        if admin is None:
+            role = Role.query.filter_by(name='Administrator').one()
+            admin = User(login='testadmin1', password_hash='-', name='Admin', role=role)
+            db.session.add(admin)
+            db.session.commit()
+        admin_id = admin.id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    return client
+
 @pytest.fixture
 @contextmanager
 def captured_templates(app):
@@ -43,4 +81,40 @@ def posts_list():
             'image_id': '123.jpg',
             'comments': []
         }
-    ]
\ No newline at end of file
+    ]
+
+
+# Движок для проверок, которые гоняются и на SQLite, и на серверной базе.
+# PostgreSQL берётся из TEST_DATABASE_URL, иначе поднимается встроенный
+# сервер pgserver во временном каталоге; если нет ни того, ни другого,
+# вариант postgresql пропускается.
+
+
+@pytest.fixture(scope='session')
+def postgresql_url(tmp_path_factory):
+    url = os.environ.get('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip('pgserver')
+    pytest.importorskip('psycopg')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pg')), cleanup_mode='stop')
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def engine(request, tmp_path):
+    if request.param == 'sqlite':
+        url = f'sqlite:///{tmp_path / "test.db"}'
+    else:
+        url = request.getfixturevalue('postgresql_url')
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        db.metadata.drop_all(conn)
+        conn.execute(text('DROP TABLE IF EXISTS schema_migrations'))
+        for name in inspect(conn).get_table_names():
+            if name.startswith('visit_logs_archive_'):
+                conn.execute(text(f'DROP TABLE {name}'))
+    yield engine
+    engine.dispose()
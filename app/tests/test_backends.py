@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import User, VisitLog, PathVisitCount, UserVisitCount, HourlyVisitCount
+from migrations import MIGRATIONS, upgrade, hot_queries, explain
+from rollups import apply_visits, rebuild, GUEST_ID
+
+# Одни и те же проверки на SQLite и на серверной базе (фикстура engine в conftest.py).
+
+
+def visits():
+    return [
+        {'path': '/', 'user_id': None, 'created_at': datetime(2025, 1, 1, 10, 15, 30, 123456)},
+        {'path': '/', 'user_id': 1, 'created_at': datetime(2025, 1, 1, 10, 45)},
+        {'path': '/posts', 'user_id': 1, 'created_at': datetime(2025, 1, 1, 11, 5)},
+    ]
+
+
+def counts(conn):
+    return (
+        dict(conn.execute(select(PathVisitCount.path, PathVisitCount.count)).all()),
+        dict(conn.execute(select(UserVisitCount.user_id, UserVisitCount.count)).all()),
+        dict(conn.execute(select(HourlyVisitCount.hour, HourlyVisitCount.count)).all()),
+    )
+
+
+def test_migrations(engine):
+    assert len(upgrade(engine)) == len(MIGRATIONS)
+    assert upgrade(engine) == []
+
+
+def test_incremental_rollups_match_rebuild(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(
+            id=1, login='u', password_hash='-', name='U', created_at=datetime(2025, 1, 1)))
+        conn.execute(VisitLog.__table__.insert(), visits())
+        apply_visits(conn, visits())
+        # повторное применение — это upsert с приращением, а не новая строка
+        conn.execute(VisitLog.__table__.insert(), visits()[:1])
+        apply_visits(conn, visits()[:1])
+    with engine.begin() as conn:
+        by_path, by_user, by_hour = counts(conn)
+        assert by_path == {'/': 3, '/posts': 1}
+        assert by_user == {GUEST_ID: 2, 1: 2}
+        assert by_hour == {datetime(2025, 1, 1, 10): 3, datetime(2025, 1, 1, 11): 1}
+        rebuild(conn)
+        assert counts(conn) == (by_path, by_user, by_hour)
+
+
+def test_explain_hot_queries(engine):
+    upgrade(engine)
+    with engine.connect() as conn:
+        for stmt in hot_queries().values():
+            assert explain(conn, stmt)
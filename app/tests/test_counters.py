@@ -0,0 +1,26 @@
+import pytest
+from models import db, UserCounter
+from counters import CounterBuffer
+
+USER_ID = 999998
+
+
+@pytest.fixture
+def worker(app):
+    # отдельный экземпляр — как счётчик в отдельном воркере
+    yield lambda: CounterBuffer(app)
+    with app.app_context():
+        UserCounter.query.filter_by(user_id=USER_ID).delete()
+        db.session.commit()
+
+
+def test_counts_are_shared_between_workers(app, worker):
+    first, second = worker(), worker()
+    with app.test_request_context():
+        assert first.incr(USER_ID) == 1
+        assert first.incr(USER_ID) == 2
+        first.flush()
+        assert second.incr(USER_ID) == 3
+        second.flush()
+    with app.app_context():
+        assert db.session.get(UserCounter, USER_ID).count == 3
@@ -0,0 +1,20 @@
+import csv
+import gzip
+import io
+
+from csv_stream import iter_csv, iter_gzip
+
+
+def test_iter_csv_yields_in_chunks():
+    rows = [(i, f'/page/{i}') for i in range(25)]
+    chunks = list(iter_csv(['id', 'path'], rows, chunk_rows=10))
+    assert len(chunks) == 3
+    parsed = list(csv.reader(io.StringIO(''.join(chunks))))
+    assert parsed[0] == ['id', 'path']
+    assert parsed[-1] == ['24', '/page/24']
+
+
+def test_iter_gzip_roundtrip():
+    chunks = iter_csv(['Страница'], [('/a',), ('/б',)])
+    data = b''.join(iter_gzip(chunks))
+    assert gzip.decompress(data).decode('utf-8') == 'Страница\r\n/a\r\n/б\r\n'
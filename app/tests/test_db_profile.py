@@ -0,0 +1,44 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+
+from models import db
+from db_profile import DatabaseProfile, db_profile
+
+
+def test_pragmas_applied_on_connect(app):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            current = db_profile.current(conn)
+    assert current['journal_mode'] == 'wal'
+    assert current['busy_timeout'] == 5000
+
+
+def test_pool_options_and_unknown_profile():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///x.db'
+    app.config['DB_PROFILE'] = 'development'
+    DatabaseProfile().init_app(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 5
+    assert app.extensions['db_profile'].pragmas['synchronous'] == 'NORMAL'
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['DB_PROFILE'] = 'fast'
+    with pytest.raises(ValueError):
+        DatabaseProfile().init_app(app)
+
+
+def test_unsupported_database_rejected_at_startup():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql+pymysql://user@localhost/web4sem'
+    with pytest.raises(ValueError, match='mysql'):
+        DatabaseProfile().init_app(app)
+
+
+def test_other_engines_keep_driver_defaults(app, tmp_path):
+    # прагмы приложения не касаются чужих движков SQLite в процессе
+    engine = create_engine(f'sqlite:///{tmp_path / "other.db"}')
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'delete'
+    engine.dispose()
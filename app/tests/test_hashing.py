@@ -0,0 +1,83 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from hashing import PasswordHasher, HashingBusy
+
+METHOD = 'pbkdf2:sha256:1000'
+
+
+class FakeApp:
+    def __init__(self, **config):
+        self.config = dict(config)
+        self.extensions = {}
+
+
+def make_hasher(**config):
+    return PasswordHasher(FakeApp(PASSWORD_HASH_METHOD=METHOD, **config))
+
+
+def test_pool_hash_and_verify():
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1)
+    pwhash = hasher.hash('Secret123')
+    assert pwhash.startswith(METHOD + '$')
+    assert hasher.verify(pwhash, 'Secret123')
+    assert not hasher.verify(pwhash, 'wrong')
+
+
+def test_needs_rehash_when_method_changes():
+    old = make_hasher(PASSWORD_HASH_WORKERS=0)
+    new = PasswordHasher(FakeApp(PASSWORD_HASH_METHOD='pbkdf2:sha256:2000',
+                                 PASSWORD_HASH_WORKERS=0))
+    pwhash = old.hash('Secret123')
+    assert not old.needs_rehash(pwhash)
+    assert new.needs_rehash(pwhash)
+
+
+@pytest.mark.parametrize('method', ['pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:2000', 'scrypt'])
+def test_short_method_name_does_not_force_rehash(method):
+    hasher = PasswordHasher(FakeApp(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=0))
+    assert not hasher.needs_rehash(hasher.hash('Secret123'))
+
+
+def test_timed_out_job_keeps_its_slot(monkeypatch):
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1,
+                         PASSWORD_HASH_QUEUE_TIMEOUT=0.01)
+    future = Future()
+    monkeypatch.setattr(hasher, '_get_pool', lambda: SimpleNamespace(submit=lambda *a: future))
+    hasher.timeout = 0.01
+    future.set_running_or_notify_cancel()
+    with pytest.raises(HashingBusy):
+        hasher.hash('Secret123')
+    # задача всё ещё считается — место не отдано
+    with pytest.raises(HashingBusy):
+        hasher.hash('Secret123')
+    future.set_result('x')
+    assert hasher.hash('Secret123') == 'x'
+
+
+def test_full_queue_raises_busy():
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1,
+                         PASSWORD_HASH_QUEUE_TIMEOUT=0.01)
+    hasher._slots.acquire()
+    try:
+        with pytest.raises(HashingBusy):
+            hasher.hash('Secret123')
+    finally:
+        hasher._slots.release()
+
+
+def test_bulk_hashing_leaves_reserved_slots(monkeypatch):
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=2,
+                         PASSWORD_HASH_RESERVED=1, PASSWORD_HASH_QUEUE_TIMEOUT=0.01)
+    hasher.timeout = 0.01
+    stuck, done = Future(), Future()
+    stuck.set_running_or_notify_cancel()
+    done.set_result('x')
+    futures = iter([stuck, done])
+    monkeypatch.setattr(hasher, '_get_pool', lambda: SimpleNamespace(submit=lambda *a: next(futures)))
+    # импорт упирается в свою долю мест...
+    with pytest.raises(HashingBusy):
+        hasher.hash_many(['Secret123', 'Secret456'])
+    # ...а вход получает зарезервированное
+    assert hasher.hash('Secret123') == 'x'
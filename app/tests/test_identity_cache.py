@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Role
+from identity_cache import IdentityStore, MemoryBackend, SQLiteBackend, identity_cache
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        role = Role.query.filter_by(name='User').first()
+        u = User(login='cacheuser1', name='Cache', surname='User', role=role)
+        u.set_password('Cache1234')
+        db.session.add(u)
+        db.session.commit()
+        user_id = u.id
+    yield user_id
+    with app.app_context():
+        identity_cache.invalidate(user_id)
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def count_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = MemoryBackend(maxsize=2)
+    backend.set('a', '1', ttl=60)
+    backend.set('b', '2', ttl=60)
+    backend.get('a')
+    backend.set('c', '3', ttl=60)
+    assert backend.get('b') is None and backend.get('a') == '1'
+    backend.set('d', '4', ttl=-1)
+    assert backend.get('d') is None
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / 'identity.db')
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    first.set('user:1', 'x', ttl=60)
+    assert second.get('user:1') == 'x'
+    second.delete('user:1')
+    assert first.get('user:1') is None
+
+
+def test_cached_load_needs_no_queries(app, user, count_queries):
+    with app.test_request_context():
+        identity_cache.load_user(user)
+    with app.test_request_context():
+        count_queries.clear()
+        u = identity_cache.load_user(user)
+        assert u.login == 'cacheuser1' and u.role.name == 'User'
+        assert count_queries == []
+
+
+def test_cached_user_can_change_password(app, user):
+    with app.test_request_context():
+        identity_cache.load_user(user)
+    with app.test_request_context():
+        u = identity_cache.load_user(user)
+        assert u.check_password('Cache1234')
+        u.set_password('Newcache1234')
+        db.session.commit()
+        identity_cache.invalidate(user)
+    with app.app_context():
+        assert db.session.get(User, user).check_password('Newcache1234')
+
+
+def test_none_backend_reads_database(app):
+    app.config['IDENTITY_CACHE_BACKEND'] = 'none'
+    try:
+        cache = IdentityStore(app)
+    finally:
+        app.config['IDENTITY_CACHE_BACKEND'] = 'memory'
+    assert cache.backend is None
+
+
+def test_invalidate_reaches_other_workers(app, user):
+    # второй экземпляр — кэш в памяти другого воркера
+    other = IdentityStore(app)
+    with app.test_request_context():
+        assert other.load_user(user).name == 'Cache'
+    with app.app_context():
+        db.session.get(User, user).name = 'Renamed'
+        db.session.commit()
+        identity_cache.invalidate(user)
+    with app.test_request_context():
+        assert other.load_user(user).name == 'Renamed'
+
+
+def test_default_paths_differ_per_database(tmp_path):
+    first, second = (create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / name}'})
+                     for name in ('first.db', 'second.db'))
+    for option in ('IDENTITY_CACHE_PATH', 'IDENTITY_CACHE_GENERATION_PATH'):
+        assert first.config[option] != second.config[option]
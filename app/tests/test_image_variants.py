@@ -0,0 +1,48 @@
+import pytest
+
+from image_variants import image_variants
+
+pytestmark = pytest.mark.skipif(not image_variants.available, reason='Pillow не установлен')
+
+IMAGE = '7d4e9175-95ea-4c5f-8be5-92a6b708bb3c.jpg'
+
+
+@pytest.fixture
+def variants_dir(app, tmp_path):
+    old = app.config['IMAGE_VARIANTS_DIR']
+    app.config['IMAGE_VARIANTS_DIR'] = str(tmp_path)
+    image_variants._info.clear()
+    yield tmp_path
+    app.config['IMAGE_VARIANTS_DIR'] = old
+    image_variants._info.clear()
+
+
+def test_variants_are_built_once(app, variants_dir):
+    from PIL import Image
+    with app.test_request_context():
+        src, srcset = image_variants.srcset(IMAGE)
+    assert src.startswith('/images/variants/7d4e9175') and '320w' in srcset and '800w' in srcset
+    thumb = variants_dir / image_variants.variant_name(IMAGE, 320)
+    with Image.open(thumb) as img:
+        assert img.width == 320
+    mtime = thumb.stat().st_mtime_ns
+    image_variants._info.clear()
+    with app.test_request_context():
+        image_variants.srcset(IMAGE)
+    assert thumb.stat().st_mtime_ns == mtime
+
+
+def test_posts_page_uses_srcset(app, client, variants_dir):
+    app.extensions['page_cache'].invalidate()
+    rv = client.get('/posts')
+    assert b'srcset=' in rv.data and b'-w320.jpg 320w' in rv.data
+
+
+def test_variants_are_served_from_their_dir(app, client, variants_dir):
+    with app.test_request_context():
+        src, _ = image_variants.srcset(IMAGE)
+    rv = client.get(src)
+    assert rv.status_code == 200
+    assert rv.data == (variants_dir / image_variants.variant_name(IMAGE, 320)).read_bytes()
+    assert rv.cache_control.immutable
+    assert client.get('/images/variants/..%2Fapp.py').status_code == 404
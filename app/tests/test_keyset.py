@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+from models import db, VisitLog
+from keyset import keyset_paginate, decode_cursor, cached_count, CountCache
+
+TEST_PATH = '/__keyset_test__'
+
+
+@pytest.fixture
+def logs(app):
+    with app.app_context():
+        # у части строк одинаковое время — порядок добирается по id
+        stamps = [datetime(2025, 1, 1, 12, 0, i // 2) for i in range(7)]
+        db.session.add_all(VisitLog(path=TEST_PATH, created_at=t) for t in stamps)
+        db.session.commit()
+        yield VisitLog.query.filter_by(path=TEST_PATH)
+        VisitLog.query.filter_by(path=TEST_PATH).delete()
+        db.session.commit()
+
+
+def ids(page):
+    return [log.id for log in page.items]
+
+
+def test_walk_forward_and_back(logs):
+    expected = [log.id for log in
+                logs.order_by(VisitLog.created_at.desc(), VisitLog.id.desc())]
+
+    first = keyset_paginate(logs, VisitLog, 3)
+    second = keyset_paginate(logs, VisitLog, 3, first.next_cursor)
+    third = keyset_paginate(logs, VisitLog, 3, second.next_cursor)
+    assert ids(first) + ids(second) + ids(third) == expected
+    assert not first.has_prev and not third.has_next
+    assert (first.start, second.start, third.start) == (1, 4, 7)
+
+    back = keyset_paginate(logs, VisitLog, 3, third.prev_cursor)
+    assert ids(back) == ids(second) and back.start == 4
+    back = keyset_paginate(logs, VisitLog, 3, back.prev_cursor)
+    assert ids(back) == ids(first) and not back.has_prev
+
+
+def test_garbage_cursor_is_first_page(logs):
+    assert decode_cursor('not-a-cursor') is None
+    page = keyset_paginate(logs, VisitLog, 3, 'not-a-cursor')
+    assert page.start == 1 and not page.has_prev
+
+
+def test_count_cache_is_bounded():
+    cache = CountCache(maxsize=2)
+    for user_id in range(3):
+        cache.set(('visit_logs', user_id), user_id)
+    assert len(cache) == 2
+    assert cache.get(('visit_logs', 0), ttl=60) is None
+    assert cache.get(('visit_logs', 2), ttl=60) == 2
+    assert cache.get(('visit_logs', 2), ttl=0) is None
+
+
+def test_count_cache_belongs_to_app(app, logs):
+    with app.app_context():
+        assert cached_count(('keyset_test', None), logs, ttl=60) == 7
+        assert app.extensions['keyset_counts'].get(('keyset_test', None), ttl=60) == 7
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from metrics import metrics, DEFAULT_BUCKETS
+
+
+@pytest.fixture
+def metrics_dir(app, tmp_path):
+    old = app.config['METRICS_DIR']
+    app.config['METRICS_DIR'] = str(tmp_path)
+    yield tmp_path
+    app.config['METRICS_DIR'] = old
+
+
+def worker_file(directory, pid, requests, queue_depth):
+    buckets = [0] * (len(DEFAULT_BUCKETS) + 1)
+    buckets[0] = requests
+    (directory / f'{pid}.json').write_text(json.dumps({
+        'pid': pid,
+        'buckets': list(DEFAULT_BUCKETS),
+        'counters': [['cache_hits_total', {'cache': 'page_cache'}, 10]],
+        'gauges': [['visit_log_queue_depth', {}, queue_depth]],
+        'histograms': [['http_request_duration_seconds',
+                        {'endpoint': 'main.about', 'method': 'GET', 'status': '200'},
+                        buckets, 0.001 * requests]],
+    }))
+
+
+def test_request_histogram(client, metrics_dir):
+    client.get('/about')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    labels = 'endpoint="main.about",method="GET",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}' in body
+    assert f'http_request_duration_seconds_count{{{labels}}}' in body
+    assert 'visit_log_queue_depth' in body
+    assert 'cache_hits_total{cache="page_cache"}' in body
+
+
+def test_values_summed_across_workers(app, client, metrics_dir):
+    # живой «соседний» воркер и уже завершившийся
+    worker_file(metrics_dir, os.getppid(), requests=3, queue_depth=5)
+    worker_file(metrics_dir, 2 ** 22 + 1, requests=4, queue_depth=7)
+    with app.app_context():
+        counters, gauges, histograms = metrics.aggregate()
+    key = ('http_request_duration_seconds',
+           (('endpoint', 'main.about'), ('method', 'GET'), ('status', '200')))
+    assert sum(histograms[key][0]) >= 7
+    assert counters[('cache_hits_total', (('cache', 'page_cache'),))] >= 20
+    # очередь умершего воркера не считается
+    depth = gauges[('visit_log_queue_depth', ())]
+    assert 5 <= depth < 12
+
+
+def test_dead_worker_counters_are_kept(app, metrics_dir):
+    dead = 2 ** 22 + 3
+    key = ('cache_hits_total', (('cache', 'page_cache'),))
+    worker_file(metrics_dir, dead, requests=4, queue_depth=7)
+    with app.app_context():
+        before = metrics.aggregate()[0][key]
+        # файл умершего воркера перенесён в retired.json и удалён
+        assert not (metrics_dir / f'{dead}.json').exists()
+        assert (metrics_dir / 'retired.json').exists()
+        after = metrics.aggregate()[0][key]
+    # сумма не уменьшилась, даже когда pid освободится для нового воркера
+    assert after >= before >= 10
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from sqlalchemy import create_engine, inspect
+
+from migrations import MIGRATIONS, upgrade, pending_migrations
+
+# схема из самой первой версии приложения: без индексов и без счётчиков
+OLD_SCHEMA = '''
+CREATE TABLE roles (id INTEGER PRIMARY KEY, name VARCHAR(64) NOT NULL UNIQUE,
+                    description TEXT);
+CREATE TABLE users (id INTEGER PRIMARY KEY, login VARCHAR(64) NOT NULL UNIQUE,
+                    password_hash VARCHAR(128) NOT NULL, surname VARCHAR(64),
+                    name VARCHAR(64) NOT NULL, patronymic VARCHAR(64),
+                    role_id INTEGER REFERENCES roles (id),
+                    created_at DATETIME NOT NULL);
+CREATE TABLE visit_logs (id INTEGER PRIMARY KEY, path VARCHAR(100) NOT NULL,
+                         user_id INTEGER REFERENCES users (id),
+                         created_at DATETIME NOT NULL);
+INSERT INTO visit_logs (path, created_at) VALUES ('/', '2025-01-01 10:15:00.000000');
+INSERT INTO visit_logs (path, created_at) VALUES ('/', '2025-01-01 10:45:00.000000');
+'''
+
+
+def test_upgrade_existing_database(tmp_path):
+    path = tmp_path / 'old.db'
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.close()
+    engine = create_engine(f'sqlite:///{path}')
+
+    done = upgrade(engine)
+    assert [v for v, _ in done] == [m[0] for m in MIGRATIONS]
+    assert pending_migrations(engine) == []
+    assert upgrade(engine) == []
+
+    names = {i['name'] for i in inspect(engine).get_indexes('visit_logs')}
+    assert {'ix_visit_logs_created_at_id', 'ix_visit_logs_user_id_created_at',
+            'ix_visit_logs_path'} <= names
+    with engine.connect() as c:
+        assert c.exec_driver_sql(
+            'SELECT count FROM visit_counts_by_path WHERE path = ?', ('/',)
+        ).scalar() == 2
+        assert c.exec_driver_sql('SELECT count FROM visit_counts_by_hour').scalar() == 2
+        assert c.exec_driver_sql('SELECT SUM(count) FROM visit_counts_by_day').scalar() == 2
+
+
+@pytest.mark.parametrize('version, table', [
+    (7, 'visit_counts_by_day'),
+    (8, 'visit_counts_by_hour_detail'),
+])
+def test_rollup_migration_fills_only_its_table(tmp_path, version, table):
+    engine = create_engine(f'sqlite:///{tmp_path / "app.db"}')
+    upgrade(engine)
+    steps = {version: step for version, _, step in MIGRATIONS}
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO visit_logs (path, created_at) "
+                             "VALUES ('/', '2025-01-01 10:15:00.000000')")
+        # «чужой» счётчик с заведомо неверным значением пересчитываться не должен
+        conn.exec_driver_sql("INSERT INTO visit_counts_by_path (path, count) VALUES ('/', 42)")
+        steps[version](conn)
+        assert conn.exec_driver_sql(f'SELECT SUM(count) FROM {table}').scalar() == 1
+        assert conn.exec_driver_sql('SELECT count FROM visit_counts_by_path').scalar() == 42
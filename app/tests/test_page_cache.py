@@ -0,0 +1,46 @@
+from page_cache import MemoryBackend, DiskBackend, Entry, PageStore
+
+
+def entry(body, generation=''):
+    return Entry(body, 'text/html', 'etag', expires=2 ** 40, generation=generation)
+
+
+def test_etag_and_not_modified(app, client):
+    store = app.extensions['page_cache']
+    store.invalidate()
+    first = client.get('/about')
+    assert first.status_code == 200 and first.headers['ETag']
+    hits = store.hits
+    second = client.get('/about')
+    assert store.hits == hits + 1
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.data == first.data
+    rv = client.get('/about', headers={'If-None-Match': first.headers['ETag']})
+    assert rv.status_code == 304 and rv.data == b''
+
+
+def test_memory_backend_evicts_by_size():
+    backend = MemoryBackend(max_bytes=10)
+    backend.set('a', entry(b'12345'))
+    backend.set('b', entry(b'12345'))
+    backend.get('a')
+    backend.set('c', entry(b'123'))
+    assert backend.get('b') is None and backend.get('a') is not None
+    assert backend.size == 8
+    backend.set('huge', entry(b'x' * 11))
+    assert backend.get('huge') is None
+
+
+def test_disk_backend_is_shared(tmp_path):
+    disk = DiskBackend(str(tmp_path))
+    disk.set('k', entry(b'body'))
+    assert DiskBackend(str(tmp_path)).get('k').body == b'body'
+
+
+def test_invalidate_reaches_other_workers(app):
+    # два хранилища в памяти — как кэши двух воркеров
+    first, other_worker = PageStore(app), PageStore(app)
+    first.set('k', entry(b'body', generation=first.generation()))
+    assert first.get('k') is not None
+    other_worker.invalidate()
+    assert first.get('k') is None
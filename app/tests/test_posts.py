@@ -1,10 +1,9 @@
 import pytest
-from app import app
 from app import db
 from models import User, Role
 
 @pytest.fixture
-def client():
+def client(app):
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
@@ -275,4 +274,3 @@ def test_change_password_validation_errors(client, login):
         }
     )
     assert 'Пароли не совпадают' in rv2.get_data(as_text=True)
-    
\ No newline at end of file
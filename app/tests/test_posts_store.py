@@ -0,0 +1,29 @@
+from posts_store import generate_posts, images_ids, list_posts, store_posts
+
+
+def test_generation_is_deterministic():
+    first, second = generate_posts(7), generate_posts(7)
+    assert first == second
+    assert len(first) == len(images_ids)
+    assert [p['position'] for p in first] == list(range(len(images_ids)))
+    assert first[0]['date'] >= first[-1]['date']
+
+
+def test_posts_pages(client):
+    rv = client.get('/posts')
+    assert rv.status_code == 200
+    rv = client.get('/posts/0')
+    assert rv.status_code == 200
+    assert 'Комментарии' in rv.get_data(as_text=True)
+    assert client.get(f'/posts/{len(images_ids)}').status_code == 404
+
+
+def test_stored_posts_are_seen_without_restart(app):
+    with app.app_context():
+        seed = app.config['POSTS_SEED']
+        before = list_posts()[0]['title']
+        try:
+            store_posts(generate_posts(seed + 1))
+            assert list_posts()[0]['title'] == generate_posts(seed + 1)[0]['title'] != before
+        finally:
+            store_posts(generate_posts(seed))
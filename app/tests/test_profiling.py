@@ -0,0 +1,64 @@
+import json
+import logging
+
+import pytest
+
+from app import create_app
+from profiling import profiler, slow_log
+
+
+@pytest.fixture
+def profiling(app):
+    app.config.update(PROFILING_ENABLED=True, PAGE_CACHE_ENABLED=False)
+    app.extensions['profiler'].reset()
+    yield app.config
+    app.config.update(PROFILING_ENABLED=False, PAGE_CACHE_ENABLED=True,
+                      PROFILING_SLOW_MS=500, PROFILING_CPROFILE_ENDPOINTS=())
+
+
+def test_disabled_by_default(client):
+    rv = client.get('/about')
+    assert 'Server-Timing' not in rv.headers
+
+
+def test_stats_per_endpoint(app, client, profiling):
+    rv = client.get('/')
+    assert 'db;dur=' in rv.headers['Server-Timing']
+    client.get('/')
+    with app.app_context():
+        stats = profiler.stats()['main.index']
+    assert stats['requests'] == 2
+    assert stats['queries'] >= 2
+    assert stats['template_ms'] > 0
+    assert stats['wall_ms'] >= stats['db_ms']
+
+
+def test_slow_request_log(client, profiling, caplog):
+    profiling['PROFILING_SLOW_MS'] = 0
+    with caplog.at_level(logging.WARNING, logger='web4sem.slow'):
+        client.get('/?page=1')
+    entry = json.loads(caplog.records[-1].getMessage())
+    assert entry['endpoint'] == 'main.index' and entry['path'] == '/?page=1'
+    assert entry['queries'] == len(entry['statements'])
+    assert any('FROM users' in s['sql'] for s in entry['statements'])
+
+
+def test_cprofile_sampling(client, profiling, tmp_path):
+    profiling.update(PROFILING_CPROFILE_ENDPOINTS=('main.about',),
+                     PROFILING_CPROFILE_RATE=1.0, PROFILING_CPROFILE_DIR=str(tmp_path))
+    client.get('/about')
+    client.get('/')
+    assert [p.name.split('-')[0] for p in tmp_path.iterdir()] == ['main.about']
+
+
+def test_slow_log_handler_added_once(tmp_path):
+    path = str(tmp_path / 'slow.log')
+    for _ in range(2):
+        create_app({'PROFILING_SLOW_LOG': path})
+    handlers = [h for h in slow_log.handlers if getattr(h, 'baseFilename', None) == path]
+    try:
+        assert len(handlers) == 1
+    finally:
+        for handler in handlers:
+            slow_log.removeHandler(handler)
+            handler.close()
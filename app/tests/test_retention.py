@@ -0,0 +1,71 @@
+from datetime import datetime, date
+
+from sqlalchemy import select, func
+
+from models import VisitLog, PathVisitCount, DailyVisitCount, HourlyPathVisitCount
+from migrations import upgrade
+from rollups import apply_visits, rebuild, GUEST_ID
+from retention import (
+    archive_old_logs, archive_months, all_visit_logs, retention_cutoff,
+    prune_hourly_detail
+)
+
+
+def seed(conn):
+    records = [
+        {'path': '/', 'user_id': None, 'created_at': datetime(2025, 1, 10, 9, 30)},
+        {'path': '/posts', 'user_id': None, 'created_at': datetime(2025, 1, 31, 23, 59)},
+        {'path': '/', 'user_id': None, 'created_at': datetime(2025, 2, 1, 0, 1)},
+        {'path': '/', 'user_id': None, 'created_at': datetime(2025, 2, 1, 12, 0)},
+        {'path': '/about', 'user_id': None, 'created_at': datetime(2025, 6, 1, 8, 0)},
+    ]
+    conn.execute(VisitLog.__table__.insert(), records)
+    apply_visits(conn, records)
+
+
+def test_retention_cutoff_is_start_of_day():
+    assert retention_cutoff(30, now=datetime(2025, 3, 31, 17, 45)) == datetime(2025, 3, 1)
+
+
+def test_archive_moves_old_rows_in_batches(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        seed(conn)
+        before = dict(conn.execute(select(PathVisitCount.path, PathVisitCount.count)).all())
+
+    moved = archive_old_logs(engine, datetime(2025, 3, 1), batch_size=2)
+    assert moved == 4
+
+    with engine.begin() as conn:
+        assert archive_months(conn) == ['202501', '202502']
+        assert conn.execute(select(func.count()).select_from(VisitLog)).scalar() == 1
+        # дневные счётчики ведутся при записи и переносом не затрагиваются
+        assert conn.execute(
+            select(DailyVisitCount.count).where(DailyVisitCount.day == date(2025, 2, 1),
+                                                DailyVisitCount.path == '/',
+                                                DailyVisitCount.user_id == GUEST_ID)
+        ).scalar() == 2
+        # пересчёт учитывает архив
+        rebuild(conn)
+        assert dict(conn.execute(select(PathVisitCount.path, PathVisitCount.count)).all()) == before
+
+        # выгрузка за период читает только нужный архивный месяц
+        logs = all_visit_logs(conn, datetime(2025, 1, 31), datetime(2025, 2, 2))
+        rows = conn.execute(select(logs.c.path, logs.c.created_at)
+                            .order_by(logs.c.created_at, logs.c.id)).all()
+        assert [r.created_at.day for r in rows] == [31, 1, 1]
+
+    assert archive_old_logs(engine, datetime(2025, 3, 1), batch_size=2) == 0
+    # после пересчёта почасовая детализация есть только по рабочей таблице
+    assert prune_hourly_detail(engine, datetime(2025, 3, 1)) == 0
+
+
+def test_prune_hourly_detail(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        seed(conn)
+    # почасовая детализация хранится только за срок хранения журнала
+    assert prune_hourly_detail(engine, datetime(2025, 3, 1)) == 4
+    with engine.begin() as conn:
+        hours = conn.execute(select(HourlyPathVisitCount.hour)).scalars().all()
+    assert hours == [datetime(2025, 6, 1, 8)]
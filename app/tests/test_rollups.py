@@ -0,0 +1,64 @@
+import pytest
+from models import db, VisitLog, PathVisitCount, UserVisitCount, HourlyVisitCount
+from rollups import rebuild
+
+TEST_PATH = '/__rollups_test__'
+
+
+@pytest.fixture
+def writer(app):
+    return app.extensions['visit_log_writer']
+
+
+@pytest.fixture(autouse=True)
+def cleanup(app, writer):
+    yield
+    writer.flush()
+    with app.app_context():
+        VisitLog.query.filter(VisitLog.path == TEST_PATH).delete()
+        db.session.commit()
+        with db.engine.begin() as conn:
+            rebuild(conn)
+
+
+def path_count(app):
+    with app.app_context():
+        row = db.session.get(PathVisitCount, TEST_PATH)
+        return row.count if row else 0
+
+
+def test_rollups_follow_writer_and_rebuild(app, writer):
+    for _ in range(3):
+        writer.put(TEST_PATH)
+    writer.flush()
+    assert path_count(app) == 3
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            rebuild(conn)
+    assert path_count(app) == 3
+
+
+def test_incremental_hour_keys_match_rebuild(app, writer):
+    writer.put(TEST_PATH)
+    writer.flush()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            rebuild(conn)
+    writer.put(TEST_PATH)
+    writer.flush()
+    with app.app_context():
+        # ключи часа, записанные инкрементально, совпадают с пересчитанными
+        hours = db.session.query(HourlyVisitCount.hour).all()
+        assert len(hours) == len(set(hours))
+        total = db.session.query(db.func.sum(HourlyVisitCount.count)).scalar()
+        assert total == VisitLog.query.count()
+
+
+def test_users_report_labels_deleted_users(app):
+    import visit_logs
+    with app.app_context():
+        db.session.add(UserVisitCount(user_id=999999, count=1))
+        db.session.commit()
+        rows = dict(visit_logs.users_report_rows())
+    assert rows['Удалённый пользователь (id 999999)'] == 1
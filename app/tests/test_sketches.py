@@ -0,0 +1,73 @@
+from datetime import datetime, date
+
+from migrations import upgrade
+from sketches import (
+    HyperLogLog, SpaceSaving, TOPK_CAPACITY, apply_sketches, load_daily, merged
+)
+
+
+def test_hyperloglog_estimate_and_merge():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(6000):
+        a.add(f'u:{i}')
+    for i in range(4000, 10000):
+        b.add(f'u:{i}')
+    assert abs(a.count() - 6000) < 6000 * 0.05
+    union = HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+    assert abs(union.count() - 10000) < 10000 * 0.05
+    small = HyperLogLog()
+    for visitor in ('u:1', 'u:2', 'u:2', 'g:1.2.3.4|curl'):
+        small.add(visitor)
+    assert small.count() == 3
+    assert len(small.to_bytes()) < 100
+
+
+def test_space_saving_keeps_heavy_hitters():
+    top = SpaceSaving(capacity=10)
+    for i in range(1000):
+        top.add('/')
+        top.add(f'/posts/{i}')
+        if i % 2:
+            top.add('/about')
+    other = SpaceSaving.from_bytes(top.to_bytes())
+    result = top.merge(other).top(2)
+    assert [path for path, _, _ in result] == ['/', '/about']
+    assert result[0][1] == 2000
+
+
+def test_space_saving_merge_beyond_capacity():
+    stored = SpaceSaving()
+    for i in range(TOPK_CAPACITY + 100):
+        batch = SpaceSaving()
+        batch.add(f'/posts/{i}', 5)
+        stored = SpaceSaving.from_bytes(stored.merge(batch).to_bytes())
+    # каждая пачка — одно посещение, как у writer'а журнала
+    for _ in range(1000):
+        batch = SpaceSaving()
+        batch.add('/hot')
+        stored = SpaceSaving.from_bytes(stored.merge(batch).to_bytes())
+    (path, count, error), = stored.top(1)
+    assert path == '/hot'
+    assert count - error <= 1000 <= count
+
+
+def test_sketches_are_merged_across_batches(engine):
+    upgrade(engine)
+    day = datetime(2025, 3, 1, 12)
+    first = [{'path': '/', 'visitor': f'u:{i}', 'created_at': day} for i in range(50)]
+    second = [{'path': '/posts', 'visitor': f'u:{i}', 'created_at': day} for i in range(25, 100)]
+    with engine.begin() as conn:
+        apply_sketches(conn, first)
+    with engine.begin() as conn:
+        apply_sketches(conn, second)
+    with engine.connect() as conn:
+        visitors = load_daily(conn, 'hll', date(2025, 3, 1), date(2025, 3, 1))
+        paths = load_daily(conn, 'topk', date(2025, 3, 1), date(2025, 3, 31))
+    assert visitors[date(2025, 3, 1)].count() == 100
+    assert merged(paths.values(), 'topk').top(2) == [('/posts', 75, 0), ('/', 50, 0)]
+
+
+def test_analytics_span_is_limited(admin_client):
+    url = '/visit_logs/analytics?format=json&date_from={}&date_to=2025-01-31'
+    assert admin_client.get(url.format('2025-01-01')).status_code == 200
+    assert admin_client.get(url.format('2000-01-01')).status_code == 400
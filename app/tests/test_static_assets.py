@@ -0,0 +1,70 @@
+import gzip
+import os
+
+from static_assets import static_assets
+
+IMAGE = '/static/images/7d4e9175-95ea-4c5f-8be5-92a6b708bb3c.jpg'
+
+
+def test_uuid_image_is_immutable_and_conditional(client):
+    rv = client.get(IMAGE)
+    assert rv.status_code == 200 and rv.mimetype == 'image/jpeg'
+    assert rv.cache_control.immutable and rv.cache_control.max_age == 365 * 24 * 3600
+    etag = rv.headers['ETag']
+    assert not etag.startswith('W/')
+    rv = client.get(IMAGE, headers={'If-None-Match': etag})
+    assert rv.status_code == 304
+
+
+def test_byte_range(client):
+    full = client.get(IMAGE).data
+    rv = client.get(IMAGE, headers={'Range': 'bytes=10-19'})
+    assert rv.status_code == 206
+    assert rv.data == full[10:20]
+    assert rv.headers['Content-Range'] == f'bytes 10-19/{len(full)}'
+
+
+def test_fingerprinted_url(app, client):
+    with app.test_request_context():
+        url = static_assets.url('styles.css')
+    assert '?v=' in url
+    assert client.get(url).cache_control.immutable
+    plain = client.get('/static/styles.css')
+    assert plain.cache_control.no_cache and not plain.cache_control.immutable
+    assert client.get('/static/styles.css?v=stale').cache_control.no_cache
+
+
+def test_precompressed_variant(app, client, tmp_path):
+    (tmp_path / 'site.css').write_text('body { color: red; }')
+    (tmp_path / 'site.css.gz').write_bytes(gzip.compress(b'body { color: red; }'))
+    old = app.config['STATIC_DIR']
+    app.config['STATIC_DIR'] = str(tmp_path)
+    try:
+        rv = client.get('/static/site.css', headers={'Accept-Encoding': 'gzip'})
+        assert rv.headers['Content-Encoding'] == 'gzip' and rv.mimetype == 'text/css'
+        assert gzip.decompress(rv.data) == b'body { color: red; }'
+        assert 'Accept-Encoding' in rv.headers['Vary']
+        rv = client.get('/static/site.css')
+        assert 'Content-Encoding' not in rv.headers and rv.data == b'body { color: red; }'
+    finally:
+        app.config['STATIC_DIR'] = old
+
+
+def test_stale_precompressed_variant_is_ignored(app, client, tmp_path):
+    (tmp_path / 'site.css.gz').write_bytes(gzip.compress(b'body { color: red; }'))
+    source = tmp_path / 'site.css'
+    source.write_text('body { color: blue; }')
+    stale = source.stat().st_mtime_ns - 10 ** 9
+    os.utime(tmp_path / 'site.css.gz', ns=(stale, stale))
+    old = app.config['STATIC_DIR']
+    app.config['STATIC_DIR'] = str(tmp_path)
+    try:
+        rv = client.get('/static/site.css', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in rv.headers and rv.data == b'body { color: blue; }'
+    finally:
+        app.config['STATIC_DIR'] = old
+
+
+def test_missing_and_traversal(client):
+    assert client.get('/static/nope.css').status_code == 404
+    assert client.get('/static/../app.py').status_code == 404
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from models import db, VisitLog
+from rollups import apply_visits, rebuild
+from timeseries import visit_series, bucket_range
+
+TEST_PATH = '/__timeseries_test__'
+
+
+@pytest.fixture
+def visits(app):
+    records = [
+        {'path': TEST_PATH, 'user_id': None, 'created_at': datetime(2001, 1, 1, 10, 5)},
+        {'path': TEST_PATH, 'user_id': None, 'created_at': datetime(2001, 1, 1, 10, 55)},
+        {'path': TEST_PATH, 'user_id': 7, 'created_at': datetime(2001, 1, 2, 3, 0)},
+        {'path': '/__other__', 'user_id': None, 'created_at': datetime(2001, 1, 9, 12, 0)},
+    ]
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(VisitLog.__table__.insert(), records)
+            apply_visits(conn, records)
+    yield
+    with app.app_context():
+        VisitLog.query.filter(VisitLog.created_at < datetime(2002, 1, 1)).delete()
+        db.session.commit()
+        with db.engine.begin() as conn:
+            rebuild(conn)
+
+
+def test_bucket_range_aligns_to_monday():
+    # 3 января 2001 — среда
+    assert bucket_range('week', datetime(2001, 1, 3), datetime(2001, 1, 10)) == \
+        (datetime(2001, 1, 1), datetime(2001, 1, 15))
+
+
+def test_series_by_bucket_and_filters(app, visits):
+    with app.app_context():
+        by_day = visit_series('day', datetime(2001, 1, 1), datetime(2001, 1, 4), path=TEST_PATH)
+        assert by_day == [(datetime(2001, 1, 1), 2), (datetime(2001, 1, 2), 1),
+                          (datetime(2001, 1, 3), 0)]
+        by_week = visit_series('week', datetime(2001, 1, 1), datetime(2001, 1, 15))
+        assert [count for _, count in by_week] == [3, 1]
+        by_hour = visit_series('hour', datetime(2001, 1, 1, 9), datetime(2001, 1, 1, 12))
+        assert [count for _, count in by_hour] == [0, 2, 0]
+        by_user = visit_series('day', datetime(2001, 1, 2), datetime(2001, 1, 3), user_id=7)
+        assert by_user == [(datetime(2001, 1, 2), 1)]
+        filtered = visit_series('hour', datetime(2001, 1, 2), datetime(2001, 1, 2, 4),
+                                path=TEST_PATH, user_id=7)
+        assert [count for _, count in filtered] == [0, 0, 0, 1]
+
+
+@pytest.mark.parametrize('bucket, date_from, status', [
+    ('hour', '2025-01-01', 200), ('hour', '2024-11-01', 400),
+    ('day', '2024-01-01', 200), ('day', '2020-01-01', 400),
+    ('week', '2020-01-01', 200), ('week', '2000-01-01', 400),
+])
+def test_timeseries_span_is_limited(admin_client, bucket, date_from, status):
+    rv = admin_client.get(f'/visit_logs/timeseries?format=json&bucket={bucket}'
+                          f'&date_from={date_from}&date_to=2025-01-31')
+    assert rv.status_code == status
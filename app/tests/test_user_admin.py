@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from sqlalchemy import select, func
+
+from models import Role, User, VisitLog, UserCounter, UserVisitCount, DailyVisitCount
+from migrations import upgrade
+from retention import archive_batch, archive_table
+from rollups import apply_visits, rebuild, GUEST_ID
+from user_admin import anonymize_logs, delete_users, change_role
+
+
+def visits():
+    return [
+        {'path': '/', 'user_id': 1, 'created_at': datetime(2025, 1, 1, 10)},
+        {'path': '/', 'user_id': 2, 'created_at': datetime(2025, 1, 1, 11)},
+        {'path': '/', 'user_id': None, 'created_at': datetime(2025, 1, 1, 12)},
+        {'path': '/posts', 'user_id': 2, 'created_at': datetime(2025, 3, 1, 10)},
+    ]
+
+
+def seed(conn):
+    conn.execute(Role.__table__.insert(), [{'id': 1, 'name': 'Administrator'},
+                                           {'id': 2, 'name': 'User'}])
+    conn.execute(User.__table__.insert(), [
+        {'id': i, 'login': f'user{i}', 'password_hash': '-', 'name': 'U',
+         'role_id': 2, 'created_at': datetime(2025, 1, 1)}
+        for i in (1, 2, 3)
+    ])
+    conn.execute(VisitLog.__table__.insert(), visits())
+    apply_visits(conn, visits())
+    conn.execute(UserCounter.__table__.insert().values(user_id=2, count=5))
+
+
+def rollups(conn):
+    return (
+        dict(conn.execute(select(UserVisitCount.user_id, UserVisitCount.count)).all()),
+        sorted(conn.execute(select(DailyVisitCount.day, DailyVisitCount.path,
+                                   DailyVisitCount.user_id, DailyVisitCount.count)).all()),
+    )
+
+
+def test_delete_users_anonymizes_logs(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        seed(conn)
+        # январь уходит в архив — там тоже есть строки пользователя 2
+        archive_batch(conn, datetime(2025, 2, 1), 100)
+    with engine.begin() as conn:
+        assert delete_users(conn, [2, 3, 99]) == 2
+    with engine.begin() as conn:
+        assert conn.execute(select(User.id)).scalars().all() == [1]
+        assert conn.execute(select(func.count()).where(VisitLog.user_id.is_not(None))).scalar() == 0
+        archive = archive_table('202501')
+        assert sorted(conn.execute(select(archive.c.user_id)).scalars(),
+                      key=lambda v: v or 0) == [None, None, 1]
+        assert conn.execute(select(func.count()).select_from(UserCounter)).scalar() == 0
+        by_user, by_day = rollups(conn)
+        assert by_user == {1: 1, GUEST_ID: 3}
+        # счётчики после удаления совпадают с пересчётом по журналу
+        rebuild(conn)
+        assert rollups(conn) == (by_user, by_day)
+
+
+def test_logs_are_anonymized_in_batches(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        seed(conn)
+        archive_batch(conn, datetime(2025, 2, 1), 100)
+    # по строке за транзакцию — и в журнале, и в архиве
+    assert anonymize_logs(engine, [2, 3], batch_size=1) == 2
+    with engine.begin() as conn:
+        assert delete_users(conn, [2, 3]) == 2
+        assert conn.execute(select(func.count()).where(VisitLog.user_id == 2)).scalar() == 0
+        by_user, by_day = rollups(conn)
+        assert by_user == {1: 1, GUEST_ID: 3}
+        rebuild(conn)
+        assert rollups(conn) == (by_user, by_day)
+
+
+def test_change_role(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        seed(conn)
+        assert change_role(conn, [1, 3], 1) == 2
+        assert change_role(conn, [2], None) == 1
+        roles = dict(conn.execute(select(User.id, User.role_id)).all())
+    assert roles == {1: 1, 2: None, 3: 1}
+
+
+def test_delete_sets_null_in_database(engine):
+    # обычный DELETE не упирается во внешний ключ журнала, где ключи проверяются
+    upgrade(engine)
+    with engine.begin() as conn:
+        seed(conn)
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+        conn.execute(User.__table__.delete().where(User.id == 1))
+        conn.commit()
+        assert conn.execute(select(func.count()).where(VisitLog.user_id == 1)).scalar() == 0
+        assert conn.execute(select(func.count()).select_from(VisitLog)).scalar() == 4
@@ -0,0 +1,171 @@
+import io
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app import create_app
+from models import db, Role, User
+from migrations import upgrade
+from hashing import password_hasher, HashingBusy
+from user_import import import_users, read_rows, decode_lines, BUSY_ERROR, DECODE_ERROR
+from csv_stream import iter_jsonl
+from validators import user_errors
+
+CSV = '''login,password,surname,name,patronymic,role
+ivanov1,Abcdef12,Иванов,Иван,,User
+petrov1,Abcdef12,Петров,Пётр,Петрович,Administrator
+bad,short,,Имя,,User
+ivanov1,Abcdef12,Иванов,Иван,,User
+sidorov1,Abcdef12,Сидоров,Сидор,,Nobody
+existing,Abcdef12,Старый,Логин,,
+'''
+
+
+def test_user_errors_match_create_form():
+    errors = user_errors({'login': 'usr', 'password': '', 'surname': '', 'name': ''})
+    assert errors['login'].startswith('Логин должен состоять')
+    assert set(errors) == {'login', 'password', 'surname', 'name'}
+    assert user_errors({'login': 'user1', 'password': 'Abcdef12',
+                        'surname': 'S', 'name': 'N'}) == {}
+
+
+def test_import_reports_errors_per_line(engine):
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(Role.__table__.insert(), [{'id': 1, 'name': 'Administrator'},
+                                               {'id': 2, 'name': 'User'}])
+        conn.execute(User.__table__.insert().values(
+            login='existing', password_hash='-', name='X', created_at=datetime(2025, 1, 1)))
+    # пачки по 2 строки: дубликат и занятый логин ловятся между пачками
+    report = import_users(engine, read_rows(io.StringIO(CSV), 'csv'), chunk_size=2)
+    assert report['created'] == 2
+    errors = {e['line']: e['errors'] for e in report['errors']}
+    assert set(errors) == {4, 5, 6, 7}
+    assert set(errors[4]) == {'login', 'password', 'surname'}
+    assert errors[5] == {'login': 'Логин повторяется в файле'}
+    assert set(errors[6]) == {'role'}
+    assert 'уже есть' in errors[7]['login']
+    with engine.connect() as conn:
+        rows = dict(conn.execute(
+            select(User.login, User.role_id).where(User.login.in_(['ivanov1', 'petrov1']))).all())
+        pwhash = conn.execute(select(User.password_hash).where(User.login == 'ivanov1')).scalar()
+    assert rows == {'ivanov1': 2, 'petrov1': 1}
+    assert pwhash.startswith('scrypt:')
+
+
+def test_busy_hashing_is_reported_per_chunk(engine, monkeypatch):
+    upgrade(engine)
+    calls = []
+
+    def hash_many(passwords):
+        calls.append(passwords)
+        if len(calls) == 2:
+            raise HashingBusy()
+        return ['-'] * len(passwords)
+
+    monkeypatch.setattr(password_hasher, 'hash_many', hash_many)
+    rows = [(n, {'login': f'user{n:04}', 'password': 'Abcdef12', 'surname': 'S', 'name': 'N'},
+             None) for n in range(2, 8)]
+    report = import_users(engine, rows, chunk_size=2)
+    # вторая пачка не записана, но импорт дошёл до конца
+    assert report['created'] == 4
+    assert [(e['line'], e['errors']) for e in report['errors']] == [
+        (4, {'password': BUSY_ERROR}), (5, {'password': BUSY_ERROR})]
+
+
+def test_jsonl_rows():
+    lines = '{"login": "user12345"}\n\nnot json\n[1]\n'
+    parsed = list(read_rows(io.StringIO(lines), 'jsonl'))
+    assert parsed[0] == (1, {'login': 'user12345'}, None)
+    assert [(n, e is not None) for n, _, e in parsed[1:]] == [(3, True), (4, True)]
+
+
+def test_bad_encoding_stops_at_its_line():
+    data = '\ufefflogin,password\nuser1,Abcdef12\n'.encode() + b'user2,\xff\nuser3,x\n'
+    parsed = list(read_rows(decode_lines(io.BytesIO(data)), 'csv'))
+    assert parsed == [(2, {'login': 'user1', 'password': 'Abcdef12'}, None),
+                      (3, None, DECODE_ERROR)]
+
+
+def test_iter_jsonl():
+    chunks = list(iter_jsonl(['login', 'created_at'],
+                             [('a', datetime(2025, 1, 2, 3, 4))] * 3, chunk_rows=2))
+    assert len(chunks) == 2
+    rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+    assert rows[0] == {'login': 'a', 'created_at': '2025-01-02T03:04:00'}
+
+
+# Импорт через веб идёт в отдельную базу во временном каталоге: общий app.db
+# не трогается, даже если проверка упадёт на середине.
+@pytest.fixture
+def import_client(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "import.db"}',
+                      'METRICS_DIR': str(tmp_path / 'metrics'),
+                      'IDENTITY_CACHE_GENERATION_PATH': str(tmp_path / 'identity.gen'),
+                      'PAGE_CACHE_GENERATION_PATH': str(tmp_path / 'pages.gen'),
+                      'TESTING': True})
+    with app.app_context():
+        upgrade(db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(Role.__table__.insert(), [{'id': 1, 'name': 'Administrator'},
+                                                   {'id': 2, 'name': 'User'}])
+            conn.execute(User.__table__.insert().values(
+                id=1, login='admin1234', password_hash='-', name='A', role_id=1,
+                created_at=datetime(2025, 1, 1)))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    yield client
+    app.extensions['visit_log_writer'].close()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_import_and_export_users(import_client):
+    data = 'login,password,surname,name,patronymic,role\nimported1,Abcdef12,Imp,Orted,,User\n'
+    rv = import_client.post(
+        '/users/import',
+        data={'file': (io.BytesIO(data.encode()), 'users.csv')},
+        content_type='multipart/form-data'
+    )
+    assert 'Создано пользователей: 1' in rv.get_data(as_text=True)
+
+    body = import_client.get('/users/export?format=jsonl').get_data(as_text=True)
+    exported = [json.loads(line) for line in body.splitlines()]
+    assert any(u['login'] == 'imported1' and u['role'] == 'User' for u in exported)
+    assert all('password_hash' not in u for u in exported)
+
+    user_id = next(u['id'] for u in import_client.get('/dump').json['users']
+                   if u['login'] == 'imported1')
+    rv = import_client.post(f'/delete_user/{user_id}', follow_redirects=True)
+    assert 'успешно удалён' in rv.get_data(as_text=True)
+
+
+def test_large_upload_goes_to_cli(import_client, monkeypatch):
+    monkeypatch.setitem(import_client.application.config, 'USER_IMPORT_MAX_BYTES', 100)
+    data = 'login,password,surname,name,patronymic,role\n' + 'imported1,Abcdef12,Imp,Orted,,User\n' * 10
+    rv = import_client.post(
+        '/users/import',
+        data={'file': (io.BytesIO(data.encode()), 'users.csv')},
+        content_type='multipart/form-data'
+    )
+    page = rv.get_data(as_text=True)
+    assert 'Файл больше 0 КиБ' in page
+    assert 'Создано пользователей' not in page
+    assert 'imported1' not in [u['login'] for u in import_client.get('/dump').json['users']]
+
+
+def test_non_utf8_upload_is_reported(import_client):
+    data = b'login,password,surname,name,patronymic,role\nimported1,Abcdef12,Imp,Orted,,User\n\xff\n'
+    rv = import_client.post(
+        '/users/import',
+        data={'file': (io.BytesIO(data), 'users.csv')},
+        content_type='multipart/form-data'
+    )
+    page = rv.get_data(as_text=True)
+    assert rv.status_code == 200
+    assert 'Создано пользователей: 1, строк с ошибками: 1' in page
+    assert 'UTF-8' in page
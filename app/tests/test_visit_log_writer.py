@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+from app import create_app
+from models import db, VisitLog
+
+TEST_PATH = '/__visit_log_writer_test__'
+
+
+@pytest.fixture
+def writer(app):
+    return app.extensions['visit_log_writer']
+
+
+@pytest.fixture(autouse=True)
+def cleanup(app, writer):
+    yield
+    writer.flush()
+    with app.app_context():
+        VisitLog.query.filter(VisitLog.path.like(TEST_PATH + '%')).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+
+
+def count_test_rows(app):
+    with app.app_context():
+        return VisitLog.query.filter(VisitLog.path.like(TEST_PATH + '%')).count()
+
+
+def test_put_is_written_after_flush(app, writer):
+    for i in range(5):
+        writer.put(f'{TEST_PATH}/{i}')
+    writer.flush()
+    assert count_test_rows(app) == 5
+
+
+def test_drop_policy_counts_overflow(app, writer, monkeypatch):
+    writer.flush()
+    monkeypatch.setitem(app.config, 'VISIT_LOG_OVERFLOW', 'drop')
+    monkeypatch.setattr(writer._queue, 'maxsize', 1)
+    dropped = writer.dropped
+    # фоновый поток может успеть забрать запись, поэтому кладём с запасом
+    for i in range(50):
+        writer.put(f'{TEST_PATH}/{i}')
+    assert writer.dropped > dropped
+    writer.flush()
+    assert count_test_rows(app) + writer.dropped - dropped == 50
+
+
+def test_bad_record_does_not_drop_batch(app, writer, monkeypatch):
+    monkeypatch.setattr('visit_log_writer.RETRY_PAUSE', 0)
+    records = [{'path': f'{TEST_PATH}/{i}', 'user_id': None, 'visitor': 'g:test',
+                'created_at': datetime.utcnow()} for i in range(3)]
+    # NOT NULL на path роняет всю пачку — остальные записи пишутся по одной
+    records.insert(1, dict(records[0], path=None))
+    writer._write(records)
+    assert count_test_rows(app) == 3
+
+
+def test_deleted_users_become_guests(writer):
+    records = [{'path': TEST_PATH, 'user_id': 10 ** 9, 'visitor': 'u:1',
+                'created_at': datetime.utcnow()}]
+    assert writer._without_deleted_users(records)[0]['user_id'] is None
+
+
+def test_apps_keep_their_own_writer(app, writer, tmp_path):
+    other = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "other.db"}'})
+    # второе приложение не перехватывает очередь первого
+    assert other.extensions['visit_log_writer'] is not writer
+    assert writer.app is app
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from models import db, HourlyVisitCount, HourlyPathVisitCount, DailyVisitCount
+
+# Посещения по интервалам (час, день, неделя) для отчёта /visit_logs/timeseries.
+# Читаются только предагрегированные счётчики:
+# - неделя и день — visit_counts_by_day (весь период, включая архив журнала);
+# - час без фильтров — visit_counts_by_hour;
+# - час с фильтром по странице или пользователю — visit_counts_by_hour_detail,
+#   которая хранится только за срок хранения журнала.
+# Пустые интервалы заполняются нулями, чтобы ряд можно было сразу рисовать.
+
+BUCKETS = ('hour', 'day', 'week')
+STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+LABELS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'week': '%Y-%m-%d'}
+
+
+def align(bucket, dt):
+    if bucket == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        # неделя начинается с понедельника
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def bucket_range(bucket, start, end):
+    # границы [start, end), выровненные по интервалам
+    start = align(bucket, start)
+    if align(bucket, end) != end:
+        end = align(bucket, end) + STEPS[bucket]
+    return start, end
+
+
+def _counts(bucket, start, end, path, user_id):
+    if bucket == 'hour' and path is None and user_id is None:
+        table = HourlyVisitCount
+        stmt = (select(table.hour, table.count)
+                .where(table.hour >= start, table.hour < end))
+        return {hour: count for hour, count in db.session.execute(stmt)}
+
+    if bucket == 'hour':
+        table, key, lo, hi = HourlyPathVisitCount, HourlyPathVisitCount.hour, start, end
+    else:
+        table, key, lo, hi = DailyVisitCount, DailyVisitCount.day, start.date(), end.date()
+    stmt = select(key, func.sum(table.count)).where(key >= lo, key < hi)
+    if path is not None:
+        stmt = stmt.where(table.path == path)
+    if user_id is not None:
+        stmt = stmt.where(table.user_id == user_id)
+    counts = {}
+    for value, count in db.session.execute(stmt.group_by(key)):
+        if bucket != 'hour':
+            value = align(bucket, datetime.combine(value, datetime.min.time()))
+        counts[value] = counts.get(value, 0) + int(count)
+    return counts
+
+
+def visit_series(bucket, start, end, path=None, user_id=None):
+    # [(начало интервала, посещений)] за [start, end); user_id=0 — гости
+    start, end = bucket_range(bucket, start, end)
+    counts = _counts(bucket, start, end, path, user_id)
+    series = []
+    point = start
+    while point < end:
+        series.append((point, counts.get(point, 0)))
+        point += STEPS[bucket]
+    return series
+
+
+def label(bucket, point):
+    return point.strftime(LABELS[bucket])
@@ -0,0 +1,103 @@
+from collections import Counter
+
+from sqlalchemy import select, update, delete
+
+from models import (
+    User, VisitLog, UserCounter, UserVisitCount,
+    HourlyPathVisitCount, DailyVisitCount
+)
+from retention import archive_months, archive_table
+from rollups import increment_counts, GUEST_ID
+
+# Удаление пользователей и смена роли набором SQL-команд, без загрузки
+# объектов в сессию: журнал посещений удаляемого пользователя может
+# насчитывать миллионы строк, и db.session.delete(user) тянул бы их все.
+# Журнал и архив обезличиваются (user_id = NULL), счётчики пользователя
+# переходят к гостям — так же их посчитал бы rebuild-rollups по журналу.
+# Внешний ключ visit_logs.user_id объявлен с ON DELETE SET NULL
+# (миграция 10), но SQLite его не соблюдает без PRAGMA foreign_keys,
+# поэтому журнал обезличивается явно до удаления пользователей.
+# Все функции, кроме anonymize_logs, работают в транзакции вызывающего, id
+# обрабатываются пачками по ID_CHUNK, чтобы не упереться в лимит параметров.
+# anonymize_logs заранее обезличивает журнал пачками по batch_size строк,
+# каждая — своей транзакцией: у давнего пользователя строк может быть очень
+# много, а одна большая UPDATE держала бы блокировку записи SQLite до конца
+# запроса. Тогда delete_users дообезличивает лишь строки, записанные
+# за это время. Если само удаление затем не удалось, журнал остаётся
+# обезличенным — пользователя можно удалить повторно.
+
+ID_CHUNK = 500
+
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for i in range(0, len(ids), ID_CHUNK):
+        yield ids[i:i + ID_CHUNK]
+
+
+def _fold_to_guests(conn, model, key, chunk):
+    # счётчики пользователей пачки прибавляются к тем же ключам гостя;
+    # user_id — последняя колонка key
+    table = model.__table__
+    columns = [table.c[k] for k in key[:-1]]
+    rows = conn.execute(
+        select(*columns, table.c.count).where(table.c.user_id.in_(chunk))
+    ).all()
+    counts = Counter()
+    for *values, count in rows:
+        values = tuple(values) + (GUEST_ID,)
+        counts[values if len(values) > 1 else values[0]] += count
+    conn.execute(table.delete().where(table.c.user_id.in_(chunk)))
+    increment_counts(conn, table, key, counts)
+
+
+def anonymize_logs(engine, user_ids, batch_size):
+    # число обезличенных строк журнала и архива
+    with engine.connect() as conn:
+        months = archive_months(conn)
+    logs = [VisitLog.__table__] + [archive_table(m) for m in months]
+    anonymized = 0
+    for chunk in _chunks(user_ids):
+        for table in logs:
+            while True:
+                batch = (select(table.c.id).where(table.c.user_id.in_(chunk))
+                         .order_by(table.c.id).limit(batch_size))
+                with engine.begin() as conn:
+                    count = conn.execute(
+                        update(table).where(table.c.id.in_(batch)).values(user_id=None)
+                    ).rowcount
+                anonymized += count
+                if count < batch_size:
+                    break
+    return anonymized
+
+
+def anonymize_visits(conn, user_ids):
+    logs = [VisitLog.__table__] + [archive_table(m) for m in archive_months(conn)]
+    for chunk in _chunks(user_ids):
+        for table in logs:
+            conn.execute(update(table).where(table.c.user_id.in_(chunk)).values(user_id=None))
+        _fold_to_guests(conn, UserVisitCount, ('user_id',), chunk)
+        _fold_to_guests(conn, HourlyPathVisitCount, ('hour', 'path', 'user_id'), chunk)
+        _fold_to_guests(conn, DailyVisitCount, ('day', 'path', 'user_id'), chunk)
+
+
+def delete_users(conn, user_ids):
+    # число удалённых пользователей
+    anonymize_visits(conn, user_ids)
+    deleted = 0
+    for chunk in _chunks(user_ids):
+        conn.execute(delete(UserCounter.__table__).where(UserCounter.user_id.in_(chunk)))
+        deleted += conn.execute(delete(User.__table__).where(User.id.in_(chunk))).rowcount
+    return deleted
+
+
+def change_role(conn, user_ids, role_id):
+    # role_id=None снимает роль; число изменённых пользователей
+    changed = 0
+    for chunk in _chunks(user_ids):
+        changed += conn.execute(
+            update(User.__table__).where(User.id.in_(chunk)).values(role_id=role_id)
+        ).rowcount
+    return changed
+
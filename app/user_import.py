@@ -0,0 +1,221 @@
+import csv
+import itertools
+import json
+import os
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Role
+from csv_stream import iter_rows, iter_csv, iter_jsonl
+from hashing import password_hasher, HashingBusy
+from page_cache import page_cache
+from validators import user_errors
+
+# Массовый импорт и выгрузка пользователей (CSV или JSONL).
+# Файл читается потоком, по USER_IMPORT_CHUNK строк: строки пачки проверяются
+# теми же правилами, что и форма create_user, логины сверяются с базой одним
+# запросом, пароли хэшируются в пуле процессов (password_hasher.hash_many),
+# а пачка вставляется одной транзакцией. Если пачку не пускает ограничение
+# уникальности (логин заняли параллельно), её строки вставляются по одной.
+# Файл не в UTF-8 — ошибка на строке, с которой его не удалось прочитать.
+# Если пул хэширования занят, строки пачки попадают в ошибки, а импорт
+# идёт дальше. На выходе — число созданных и ошибки по номерам строк.
+# Через веб принимается файл не больше USER_IMPORT_MAX_BYTES — импорт идёт
+# в потоке запроса; большие файлы — командой `flask import-users`.
+# Роль задаётся названием (Administrator, User) или пустая.
+# Выгрузка отдаёт те же колонки без пароля: хэши из базы не выходят.
+
+IMPORT_COLUMNS = ('login', 'password', 'surname', 'name', 'patronymic', 'role')
+EXPORT_COLUMNS = ('login', 'surname', 'name', 'patronymic', 'role', 'created_at')
+FORMATS = ('csv', 'jsonl')
+DECODE_ERROR = 'Файл не в кодировке UTF-8: эта строка и следующие не импортированы'
+BUSY_ERROR = 'Пул хэширования паролей занят, строка не импортирована — повторите позже'
+
+
+def decode_lines(stream):
+    # строки двоичного потока в UTF-8 (BOM в начале допускается); каждая
+    # строка декодируется отдельно, поэтому битый байт ломает только её
+    encoding = 'utf-8-sig'
+    for line in stream:
+        yield line.decode(encoding)
+        encoding = 'utf-8'
+
+
+def read_rows(stream, fmt):
+    # (номер строки, {поле: значение} или None, текст ошибки разбора);
+    # stream — текстовые строки (поток или decode_lines)
+    line_no = 0
+    reader = None
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row, None
+            return
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, None, 'Строка не является JSON'
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, 'Ожидается JSON-объект'
+                continue
+            yield line_no, row, None
+    except UnicodeDecodeError:
+        # дальше файл не читается: ошибка на первой непрочитанной строке
+        read = reader.line_num if reader is not None else line_no
+        yield read + 1, None, DECODE_ERROR
+
+
+def _clean(row):
+    form = {k: str(row.get(k) or '') for k in IMPORT_COLUMNS}
+    for k in IMPORT_COLUMNS:
+        if k != 'password':
+            form[k] = form[k].strip()
+    return form
+
+
+def _insert(engine, values):
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), values)
+
+
+def _import_chunk(engine, chunk, roles, seen, report):
+    valid = []
+    for line_no, row, parse_error in chunk:
+        if parse_error:
+            report['errors'].append({'line': line_no, 'login': None,
+                                     'errors': {'row': parse_error}})
+            continue
+        form = _clean(row)
+        errors = user_errors(form)
+        if form['role'] and form['role'] not in roles:
+            errors['role'] = 'Выбранная роль недействительна'
+        if form['login'] in seen and 'login' not in errors:
+            errors['login'] = 'Логин повторяется в файле'
+        seen.add(form['login'])
+        if errors:
+            report['errors'].append({'line': line_no, 'login': form['login'], 'errors': errors})
+        else:
+            valid.append((line_no, form))
+
+    if valid:
+        with engine.connect() as conn:
+            taken = set(conn.execute(
+                select(User.login).where(User.login.in_([f['login'] for _, f in valid]))
+            ).scalars())
+        for line_no, form in valid:
+            if form['login'] in taken:
+                report['errors'].append({'line': line_no, 'login': form['login'],
+                                         'errors': {'login': 'Пользователь с таким логином уже есть'}})
+        valid = [(line_no, f) for line_no, f in valid if f['login'] not in taken]
+    if not valid:
+        return
+
+    try:
+        hashes = password_hasher.hash_many([f['password'] for _, f in valid])
+    except HashingBusy:
+        # пачка не вставлена; отчёт по уже записанным пачкам не теряется
+        for line_no, form in valid:
+            report['errors'].append({'line': line_no, 'login': form['login'],
+                                     'errors': {'password': BUSY_ERROR}})
+        return
+    now = datetime.utcnow()
+    values = [
+        {'login': f['login'], 'password_hash': pwhash, 'surname': f['surname'],
+         'name': f['name'], 'patronymic': f['patronymic'],
+         'role_id': roles.get(f['role']), 'created_at': now}
+        for (_, f), pwhash in zip(valid, hashes)
+    ]
+    try:
+        _insert(engine, values)
+        report['created'] += len(values)
+    except IntegrityError:
+        for (line_no, form), value in zip(valid, values):
+            try:
+                _insert(engine, [value])
+                report['created'] += 1
+            except IntegrityError:
+                report['errors'].append({'line': line_no, 'login': form['login'],
+                                         'errors': {'login': 'Пользователь с таким логином уже есть'}})
+
+
+def import_users(engine, rows, chunk_size=500):
+    # rows — из read_rows; {'created': число, 'errors': [{line, login, errors}]}
+    with engine.connect() as conn:
+        roles = dict(conn.execute(select(Role.name, Role.id)).all())
+    report = {'created': 0, 'errors': []}
+    seen = set()
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(engine, chunk, roles, seen, report)
+    return report
+
+
+def export_query():
+    return (
+        select(User.login, User.surname, User.name, User.patronymic,
+               Role.name, User.created_at)
+        .outerjoin(Role, User.role_id == Role.id)
+        .order_by(User.id)
+    )
+
+
+def format_from_filename(filename, default='csv'):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return ext if ext in FORMATS else default
+
+
+# === Команды CLI ===
+
+@click.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Формат файла (по умолчанию — по расширению).')
+@click.option('--chunk', type=int, default=None, help='Строк в одной транзакции.')
+@click.option('--workers', type=int, default=None,
+              help='Процессов хэширования (по умолчанию — по числу ядер).')
+@with_appcontext
+def import_users_command(path, fmt, chunk, workers):
+    """Импортировать пользователей из CSV или JSONL."""
+    fmt = fmt or format_from_filename(path)
+    # отдельный процесс команды не делит пул с веб-воркерами — берём все ядра
+    password_hasher.workers = workers or os.cpu_count() or 1
+    with open(path, 'rb') as f:
+        report = import_users(db.engine, read_rows(decode_lines(f), fmt),
+                              chunk or current_app.config['USER_IMPORT_CHUNK'])
+    page_cache.invalidate()
+    for error in report['errors']:
+        details = '; '.join(f'{k}: {v}' for k, v in error['errors'].items())
+        click.echo(f"строка {error['line']} ({error['login'] or '-'}): {details}", err=True)
+    click.echo(f"Создано пользователей: {report['created']}, ошибок: {len(report['errors'])}.")
+
+
+@click.command('export-users')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True), required=False)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Формат (по умолчанию — по расширению, иначе csv).')
+@with_appcontext
+def export_users_command(path, fmt):
+    """Выгрузить пользователей в CSV или JSONL (без паролей)."""
+    fmt = fmt or format_from_filename(path or '')
+    rows = iter_rows(export_query())
+    chunks = iter_jsonl(EXPORT_COLUMNS, rows) if fmt == 'jsonl' else iter_csv(EXPORT_COLUMNS, rows)
+    out = open(path, 'w', encoding='utf-8', newline='') if path else click.get_text_stream('stdout')
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if path:
+            out.close()
@@ -0,0 +1,46 @@
+import re
+
+# Проверка полей пользователя: общая для формы create_user и импорта
+# (user_import.py). Возвращаются тексты ошибок для показа в форме.
+
+LOGIN_RE = re.compile(r'^[A-Za-z0-9]{5,}$')
+PASSWORD_CHARS_RE = re.compile(r'^[A-Za-zА-Яа-я0-9~!?@#$%^&*_\-+()\[\]{}><\\|"\'.:,]+$')
+EMPTY = 'Поле не может быть пустым'
+
+
+def login_error(login):
+    if not login:
+        return EMPTY
+    if not LOGIN_RE.match(login):
+        return 'Логин должен состоять из латинских букв и цифр, минимум 5 символов'
+    return None
+
+
+def password_error(pwd):
+    if not pwd:
+        return EMPTY
+    if len(pwd) < 8 or len(pwd) > 128:
+        return 'Пароль должен быть от 8 до 128 символов'
+    if not re.search(r'[A-Z]', pwd) or not re.search(r'[a-z]', pwd):
+        return 'Пароль должен содержать и заглавные, и строчные буквы'
+    if not re.search(r'\d', pwd):
+        return 'Пароль должен содержать хотя бы одну цифру'
+    if ' ' in pwd:
+        return 'Пароль не должен содержать пробелов'
+    if not PASSWORD_CHARS_RE.match(pwd):
+        return 'Пароль содержит недопустимые символы'
+    return None
+
+
+def user_errors(form):
+    # {поле: ошибка} для login, password, surname, name; роль проверяет
+    # вызывающий — ей нужна база
+    errors = {}
+    for field, error in (('login', login_error(form.get('login'))),
+                         ('password', password_error(form.get('password')))):
+        if error:
+            errors[field] = error
+    for field in ('surname', 'name'):
+        if not form.get(field):
+            errors[field] = EMPTY
+    return errors
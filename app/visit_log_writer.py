@@ -0,0 +1,225 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select
+
+from metrics import metrics
+from models import db, User, VisitLog
+from rollups import apply_visits
+from sketches import apply_sketches
+
+# Буферизованная запись журнала посещений.
+# Хук запроса только кладёт запись в ограниченную очередь, а фоновый поток
+# сбрасывает накопленное одним многострочным INSERT — каждые
+# VISIT_LOG_BATCH_SIZE записей или раз в VISIT_LOG_FLUSH_INTERVAL_MS.
+# В той же транзакции обновляются счётчики отчётов (rollups.py) и дневные
+# скетчи уникальных посетителей и популярных страниц (sketches.py).
+# Не записавшаяся пачка повторяется один раз, затем пишется по одной записи.
+# Очередь и поток свои у каждого приложения (app.extensions), visit_log_writer
+# находит их через current_app.
+
+_STOP = object()
+PATH_LENGTH = VisitLog.__table__.c.path.type.length
+LOG_COLUMNS = ('path', 'user_id', 'created_at')
+# пауза перед повторной записью пачки, с
+RETRY_PAUSE = 0.2
+
+
+class VisitLogQueue:
+    # очередь и фоновый поток одного приложения (app.extensions['visit_log_writer'])
+
+    def __init__(self, app):
+        self.app = app
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    # === Постановка в очередь ===
+
+    def put(self, path, user_id=None, visitor=None):
+        self._ensure_started()
+        record = {
+            # PostgreSQL, в отличие от SQLite, соблюдает длину VARCHAR
+            'path': path[:PATH_LENGTH],
+            'user_id': user_id,
+            'created_at': datetime.utcnow(),
+            # ключ посетителя идёт только в скетч, в журнал не пишется
+            'visitor': visitor,
+        }
+        cfg = self.app.config
+        try:
+            if cfg['VISIT_LOG_OVERFLOW'] == 'block':
+                self._queue.put(record, timeout=cfg['VISIT_LOG_BLOCK_TIMEOUT_MS'] / 1000)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # === Сброс в базу ===
+
+    def flush(self):
+        # синхронно сбрасываем всё, что лежит в очереди, и дожидаемся
+        # пачки, которую фоновый поток уже забрал, но ещё не записал
+        if self._queue is None or self._pid != os.getpid():
+            return
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            self._queue.task_done()
+            if len(batch) >= self.app.config['VISIT_LOG_BATCH_SIZE']:
+                self._write(batch)
+                batch = []
+        self._write(batch)
+        self._queue.join()
+
+    def close(self):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=5)
+        except queue.Full:
+            # поток не успевает разбирать очередь — остаток допишет flush
+            pass
+        else:
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        # после fork (gunicorn --preload) поток родителя в воркере не существует
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.app.config['VISIT_LOG_QUEUE_SIZE'])
+            self._thread = threading.Thread(
+                target=self._run, name='visit-log-writer', daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        batch_size = self.app.config['VISIT_LOG_BATCH_SIZE']
+        interval = self.app.config['VISIT_LOG_FLUSH_INTERVAL_MS'] / 1000
+        while True:
+            batch = []
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._write(batch)
+                    self._done(len(batch) + 1)
+                    return
+                batch.append(item)
+            self._write(batch)
+            self._done(len(batch))
+
+    def _done(self, n):
+        for _ in range(n):
+            self._queue.task_done()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self._insert(batch)
+        except Exception:
+            # вторая попытка — после паузы (блокировка, разрыв соединения) и без
+            # пользователей, удалённых, пока записи ждали в очереди: в PostgreSQL
+            # их user_id нарушил бы внешний ключ всей пачки
+            self.app.logger.warning(
+                'Пачка журнала посещений (%d записей) не записалась, повтор', len(batch),
+                exc_info=True
+            )
+            time.sleep(RETRY_PAUSE)
+            batch = self._without_deleted_users(batch)
+            try:
+                self._insert(batch)
+            except Exception:
+                # по одной записи: плохая строка не уносит с собой остальные
+                self._insert_each(batch)
+                return
+        metrics.observe('visit_log_batch_seconds', time.perf_counter() - started)
+        metrics.inc('visit_log_written_total', n=len(batch))
+
+    def _insert(self, batch):
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(VisitLog.__table__.insert().values(
+                    [{k: r[k] for k in LOG_COLUMNS} for r in batch]))
+                apply_visits(conn, batch)
+                apply_sketches(conn, batch)
+
+    def _insert_each(self, batch):
+        for record in batch:
+            try:
+                self._insert([record])
+            except Exception:
+                metrics.inc('visit_log_write_errors_total')
+                self.app.logger.exception('Не удалось записать посещение %s', record['path'])
+            else:
+                metrics.inc('visit_log_written_total')
+
+    def _without_deleted_users(self, batch):
+        # как ON DELETE SET NULL: посещения удалённого пользователя — гостевые
+        ids = {r['user_id'] for r in batch if r['user_id'] is not None}
+        if not ids:
+            return batch
+        try:
+            with self.app.app_context():
+                with db.engine.connect() as conn:
+                    existing = set(conn.execute(
+                        select(User.id).where(User.id.in_(ids))).scalars())
+        except Exception:
+            return batch
+        return [r if r['user_id'] is None or r['user_id'] in existing else dict(r, user_id=None)
+                for r in batch]
+
+class VisitLogWriter:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VISIT_LOG_BATCH_SIZE', 100)
+        app.config.setdefault('VISIT_LOG_FLUSH_INTERVAL_MS', 500)
+        app.config.setdefault('VISIT_LOG_QUEUE_SIZE', 10000)
+        # 'drop' — выбрасывать записи при переполнении очереди,
+        # 'block' — ждать место не дольше VISIT_LOG_BLOCK_TIMEOUT_MS
+        app.config.setdefault('VISIT_LOG_OVERFLOW', 'drop')
+        app.config.setdefault('VISIT_LOG_BLOCK_TIMEOUT_MS', 100)
+        app.extensions['visit_log_writer'] = VisitLogQueue(app)
+
+    def put(self, path, user_id=None, visitor=None):
+        current_app.extensions['visit_log_writer'].put(path, user_id, visitor)
+
+    def flush(self):
+        current_app.extensions['visit_log_writer'].flush()
+
+
+visit_log_writer = VisitLogWriter()
@@ -1,8 +1,16 @@
-from flask import Blueprint, render_template, request, Response
+from flask import Blueprint, render_template, request, abort, current_app, jsonify
 from flask_login import current_user
-from app import db, VisitLog, User, check_rights
-from datetime import datetime
-import io, csv
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from models import db, VisitLog, User, PathVisitCount, UserVisitCount
+from auth import check_rights
+from rollups import GUEST_ID
+from retention import all_visit_logs
+from timeseries import BUCKETS, visit_series, label
+from sketches import load_daily, merged, days
+from csv_stream import csv_response, iter_rows
+from keyset import keyset_paginate, cached_count
+from datetime import datetime, timedelta
 
 visit_logs_bp = Blueprint(
     'visit_logs',
@@ -10,102 +18,183 @@ visit_logs_bp = Blueprint(
     template_folder='templates/'
 )
 
+def pages_report_rows():
+    return iter_rows(
+        select(PathVisitCount.path, PathVisitCount.count)
+        .order_by(PathVisitCount.count.desc(), PathVisitCount.path)
+    )
+
+def users_report_rows():
+    # одним запросом: счётчики + ФИО через LEFT JOIN, без запроса на каждую строку
+    rows = iter_rows(
+        select(
+            UserVisitCount.user_id, UserVisitCount.count,
+            User.surname, User.name, User.patronymic
+        )
+        .outerjoin(User, User.id == UserVisitCount.user_id)
+        .order_by(UserVisitCount.count.desc(), UserVisitCount.user_id)
+    )
+    for uid, cnt, surname, name, patronymic in rows:
+        if uid == GUEST_ID:
+            label = "Гость"
+        elif name is None:
+            # пользователь удалён, а его посещения остались в счётчиках
+            label = f"Удалённый пользователь (id {uid})"
+        else:
+            label = f"{surname or ''} {name} {patronymic or ''}".strip()
+        yield label, cnt
+
+def parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400)
+
+def wants_gzip():
+    return request.args.get('gzip', type=int) == 1
+
 @visit_logs_bp.route('/')
 @check_rights(['Administrator', 'User'])
 def index():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 20
-    pagination = VisitLog.query \
-        .order_by(VisitLog.created_at.desc()) \
-        .paginate(page, per_page, False)
-    return render_template('visit_logs.html', pagination=pagination)
+    query = VisitLog.query.options(joinedload(VisitLog.user))
+    total = cached_count(('visit_logs', None), query,
+                         current_app.config['VISIT_LOG_COUNT_TTL'])
+    page = keyset_paginate(query, VisitLog, per_page, cursor, total)
+    return render_template('visit_logs.html', page=page)
 
 @visit_logs_bp.route('/logs_pages_report')
 @check_rights(['Administrator'])
 def pages_report():
-    # собираем статистику по пути
-    rows = (
-        db.session.query(
-            VisitLog.path,
-            db.func.count(VisitLog.id).label('count')
-        )
-        .group_by(VisitLog.path)
-        .order_by(db.desc('count'))
-        .all()
-    )
-    return render_template('logs_pages_report.html', rows=rows)
+    # статистика по пути берётся из предагрегированных счётчиков
+    return render_template('logs_pages_report.html', rows=pages_report_rows())
 
 @visit_logs_bp.route('/logs_pages_report/export')
 @check_rights(['Administrator'])
 def pages_report_export():
-    rows = (
-        db.session.query(
-            VisitLog.path,
-            db.func.count(VisitLog.id).label('count')
-        )
-        .group_by(VisitLog.path)
-        .order_by(db.desc('count'))
-        .all()
-    )
-    si = io.StringIO()
-    w = csv.writer(si)
-    w.writerow(['Страница', 'Количество посещений'])
-    for path, cnt in rows:
-        w.writerow([path, cnt])
-    return Response(
-        si.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=pages_report.csv'}
+    return csv_response(
+        'pages_report.csv', ['Страница', 'Количество посещений'],
+        pages_report_rows(), gzip=wants_gzip()
     )
 
 @visit_logs_bp.route('/logs_users_report')
 @check_rights(['Administrator'])
 def users_report():
-    # собираем статистику по пользователю
-    rows = (
-        db.session.query(
-            VisitLog.user_id,
-            db.func.count(VisitLog.id).label('count')
-        )
-        .group_by(VisitLog.user_id)
-        .order_by(db.desc('count'))
-        .all()
-    )
-    # заменяем user_id на ФИО или "Гость"
-    data = []
-    for uid, cnt in rows:
-        if uid:
-            u = User.query.get(uid)
-            name = f"{u.surname or ''} {u.name or ''} {u.patronymic or ''}".strip()
-        else:
-            name = "Гость"
-        data.append((name, cnt))
-    return render_template('logs_users_report.html', rows=data)
+    return render_template('logs_users_report.html', rows=users_report_rows())
 
 @visit_logs_bp.route('/logs_users_report/export')
 @check_rights(['Administrator'])
 def users_report_export():
-    rows = (
-        db.session.query(
-            VisitLog.user_id,
-            db.func.count(VisitLog.id).label('count')
+    return csv_response(
+        'users_report.csv', ['Пользователь', 'Количество посещений'],
+        users_report_rows(), gzip=wants_gzip()
+    )
+
+@visit_logs_bp.route('/export')
+@check_rights(['Administrator'])
+def logs_export():
+    # сырой журнал за период: ?date_from=ГГГГ-ММ-ДД&date_to=ГГГГ-ММ-ДД (включительно);
+    # перенесённые в архив месяцы читаются тоже
+    date_from = parse_date_arg('date_from')
+    date_to = parse_date_arg('date_to')
+    with db.engine.connect() as conn:
+        logs = all_visit_logs(conn, date_from, date_to and date_to + timedelta(days=1))
+    stmt = (
+        select(logs.c.id, logs.c.created_at, logs.c.path, logs.c.user_id, User.login)
+        .outerjoin(User, User.id == logs.c.user_id)
+        .order_by(logs.c.created_at, logs.c.id)
+    )
+    return csv_response(
+        'visit_logs.csv', ['id', 'Дата', 'Страница', 'user_id', 'Логин'],
+        iter_rows(stmt), gzip=wants_gzip()
+    )
+
+# по умолчанию — последние сутки по часам, месяц по дням, квартал по неделям
+TIMESERIES_SPAN = {'hour': timedelta(days=1), 'day': timedelta(days=30), 'week': timedelta(weeks=13)}
+# дольше не отдаём: не больше ~750 точек в ряду любого размера интервала
+TIMESERIES_MAX_SPAN = {'hour': timedelta(days=31), 'day': timedelta(days=732), 'week': timedelta(weeks=520)}
+
+@visit_logs_bp.route('/timeseries')
+@check_rights(['Administrator'])
+def timeseries():
+    # ?bucket=hour|day|week&date_from&date_to&path=&user_id=(0 — гости)&format=html|csv|json
+    bucket = request.args.get('bucket', 'day')
+    fmt = request.args.get('format', 'html')
+    if bucket not in BUCKETS or fmt not in ('html', 'csv', 'json'):
+        abort(400)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    date_to = parse_date_arg('date_to') or today
+    date_from = parse_date_arg('date_from') or date_to - TIMESERIES_SPAN[bucket] + timedelta(days=1)
+    end = date_to + timedelta(days=1)
+    if date_from >= end:
+        abort(400)
+    if end - date_from > TIMESERIES_MAX_SPAN[bucket]:
+        abort(400)
+    path = request.args.get('path') or None
+    user_id = request.args.get('user_id', type=int)
+
+    series = visit_series(bucket, date_from, end, path=path, user_id=user_id)
+    if fmt == 'json':
+        return jsonify({
+            'bucket': bucket,
+            'date_from': date_from.date().isoformat(),
+            'date_to': date_to.date().isoformat(),
+            'path': path,
+            'user_id': user_id,
+            'total': sum(count for _, count in series),
+            'series': [{'start': point.isoformat(), 'count': count} for point, count in series],
+        })
+    if fmt == 'csv':
+        return csv_response(
+            'timeseries.csv', ['Начало интервала', 'Количество посещений'],
+            ((label(bucket, point), count) for point, count in series), gzip=wants_gzip()
         )
-        .group_by(VisitLog.user_id)
-        .order_by(db.desc('count'))
-        .all()
+    return render_template(
+        'logs_timeseries.html', bucket=bucket, buckets=BUCKETS,
+        rows=[(label(bucket, point), count) for point, count in series],
+        peak=max((count for _, count in series), default=0),
+        date_from=date_from, date_to=date_to, path=path, user_id=user_id,
+        query={k: v for k, v in request.args.items() if k != 'format'},
     )
-    si = io.StringIO()
-    w = csv.writer(si)
-    w.writerow(['Пользователь', 'Количество посещений'])
-    for uid, cnt in rows:
-        if uid is not None:
-            u = User.query.get(uid)
-            name = f"{u.surname or ''} {u.name or ''} {u.patronymic or ''}".strip()
-        else:
-            name = "Гость"
-        w.writerow([name, cnt])
-    return Response(
-        si.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=users_report.csv'}
+
+# скетчи уникальных посетителей и популярных страниц (sketches.py)
+ANALYTICS_SPAN = timedelta(days=30)
+# дольше не отдаём: на каждый день периода — свои скетчи
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_TOP = 20
+
+@visit_logs_bp.route('/analytics')
+@check_rights(['Administrator'])
+def analytics():
+    # ?date_from&date_to&format=html|json; значения приближённые
+    fmt = request.args.get('format', 'html')
+    if fmt not in ('html', 'json'):
+        abort(400)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    day_to = (parse_date_arg('date_to') or today).date()
+    day_from = (parse_date_arg('date_from') or today - ANALYTICS_SPAN + timedelta(days=1)).date()
+    if day_from > day_to or (day_to - day_from).days >= ANALYTICS_MAX_DAYS:
+        abort(400)
+    with db.engine.connect() as conn:
+        visitors = load_daily(conn, 'hll', day_from, day_to)
+        paths = load_daily(conn, 'topk', day_from, day_to)
+    daily = [(day, visitors[day].count() if day in visitors else 0)
+             for day in days(day_from, day_to)]
+    unique_total = merged(visitors.values(), 'hll').count()
+    top = merged(paths.values(), 'topk').top(ANALYTICS_TOP)
+    if fmt == 'json':
+        return jsonify({
+            'date_from': day_from.isoformat(),
+            'date_to': day_to.isoformat(),
+            'unique_visitors': unique_total,
+            'daily_unique_visitors': [{'day': day.isoformat(), 'count': count} for day, count in daily],
+            'top_paths': [{'path': path, 'count': count, 'error': error} for path, count, error in top],
+        })
+    return render_template(
+        'logs_analytics.html', daily=daily, unique_total=unique_total, top=top,
+        date_from=day_from, date_to=day_to,
     )